@@ -0,0 +1,337 @@
+#!/usr/bin/env python3
+"""
+Gemini API（google.generativeai）のローカル代替実装（ベンチマーク・負荷試験用）
+
+gemini_cli_wrapper が使う genai の関数・クラス（configure / upload_file / get_file / delete_file /
+GenerativeModel / caching.CachedContent）と同じ形のオブジェクトを提供し、ネットワークやクォータを使わずに
+パイプライン全体の性能を測れるようにする。
+
+- 応答時間は LatencyModel（fixed / uniform / lognormal、入力トークン数に比例する項を加算可能）で決める
+- 429 / 503 をそれぞれの確率で返す（google.api_core の例外と同じく code に HTTP ステータスを持つ）
+- stream=True の場合は断片に分けて返し、指定した確率で途中で接続を切る
+- アップロードしたファイルは get_file を指定回数呼ぶまで PROCESSING のまま（ACTIVE 待ちの再現）
+
+Usage:
+    from fake_gemini import FakeGemini, LatencyModel, install
+    fake = FakeGemini(latency=LatencyModel('lognormal', seconds=0.8, spread=0.5), error_rates={429: 0.05})
+    install(fake)  # 以降 gemini_cli_wrapper は fake に対してリクエストする
+"""
+import itertools
+import math
+import os
+import random
+import re
+import sys
+import threading
+import time
+import types
+
+_PACKED_FILE_PATTERN = re.compile(r'^=== id=(\d+) File: (.+?) ===$', re.MULTILINE)
+
+
+class FakeApiError(Exception):
+    """Gemini API のエラー（code に HTTP ステータスを持つ）"""
+
+    def __init__(self, code, message, retry_delay=None):
+        if retry_delay is not None:
+            # rate_limit.retry_delay_hint が読み取る形式で待機秒数を添える
+            message = f"{message} retry_delay {{ seconds: {retry_delay} }}"
+        super().__init__(f"{code} {message}")
+        self.code = code
+
+
+class LatencyModel:
+    """リクエストの応答時間の分布
+
+    kind:
+        fixed: 常に seconds 秒
+        uniform: seconds ± spread 秒の一様分布
+        lognormal: 中央値 seconds 秒・対数標準偏差 spread の対数正規分布（API の裾の長い遅延の再現）
+    per_1k_tokens: 入力 1000 トークンあたりに加算する秒数
+    """
+
+    KINDS = ('fixed', 'uniform', 'lognormal')
+
+    def __init__(self, kind='fixed', seconds=0.0, spread=0.0, per_1k_tokens=0.0):
+        if kind not in self.KINDS:
+            raise ValueError(f"Unknown latency kind: {kind}")
+        self.kind = kind
+        self.seconds = seconds
+        self.spread = spread
+        self.per_1k_tokens = per_1k_tokens
+
+    def sample(self, rng, tokens=0):
+        if self.kind == 'uniform':
+            base = rng.uniform(self.seconds - self.spread, self.seconds + self.spread)
+        elif self.kind == 'lognormal' and self.seconds > 0:
+            base = rng.lognormvariate(math.log(self.seconds), self.spread)
+        else:
+            base = self.seconds
+        return max(0.0, base + self.per_1k_tokens * tokens / 1000)
+
+    @classmethod
+    def parse(cls, spec):
+        """`kind:seconds[:spread[:per_1k_tokens]]` 形式（例: lognormal:0.8:0.5）の文字列から作る"""
+        kind, *numbers = spec.split(':')
+        return cls(kind, *(float(n) for n in numbers))
+
+
+def estimate_content_tokens(contents):
+    """contents の入力トークン数を大まかに見積もる（テキストは 4 文字 1 トークン、画像・ファイルは 258 トークン）"""
+    tokens = 0
+    for part in contents:
+        if isinstance(part, str):
+            tokens += len(part) // 4 + 1
+        else:
+            tokens += 258
+    return tokens
+
+
+class FakeGemini:
+    """google.generativeai の代わりに使うローカルのバックエンド（スレッドセーフ）
+
+    Args:
+        latency: generate_content の応答時間（LatencyModel）
+        error_rates: HTTP ステータス -> 返す確率（例: {429: 0.05, 503: 0.01}）
+        retry_delay: 429 に添える待機秒数（None なら添えない）
+        stream_chunks: stream=True のときの断片数
+        first_chunk_fraction: 応答時間のうち最初の断片までに掛かる割合
+        stream_disconnect_rate: ストリーミングの途中で接続を切る確率
+        output_tokens: 1 レスポンスあたりの出力トークン数
+        upload_latency: upload_file の所要秒数
+        active_after_polls: get_file を何回呼ぶと ACTIVE になるか
+        seed: 乱数のシード（同じシードなら同じ遅延・エラーの列になる）
+        sleep: 待機に使う関数（テストでは時間を進めずに計測できるよう差し替える）
+    """
+
+    def __init__(
+        self,
+        latency=None,
+        error_rates=None,
+        retry_delay=None,
+        stream_chunks=8,
+        first_chunk_fraction=0.3,
+        stream_disconnect_rate=0.0,
+        output_tokens=400,
+        upload_latency=0.0,
+        active_after_polls=1,
+        seed=None,
+        sleep=time.sleep,
+    ):
+        self.latency = latency or LatencyModel()
+        self.error_rates = dict(error_rates or {})
+        self.retry_delay = retry_delay
+        self.stream_chunks = max(1, stream_chunks)
+        self.first_chunk_fraction = first_chunk_fraction
+        self.stream_disconnect_rate = stream_disconnect_rate
+        self.output_tokens = output_tokens
+        self.upload_latency = upload_latency
+        self.active_after_polls = active_after_polls
+        self._sleep = sleep
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._files = {}
+        self._active = 0
+        self.stats = {
+            'requests': 0,
+            'stream_requests': 0,
+            'errors': {},
+            'disconnects': 0,
+            'uploads': 0,
+            'get_file_calls': 0,
+            'deleted_files': 0,
+            'peak_concurrency': 0,
+            'latencies': [],
+        }
+        self.caching = types.SimpleNamespace(CachedContent=self._cached_content_class())
+        self.GenerativeModel = self._model_class()
+
+    # --- genai のモジュール関数 ---
+
+    def configure(self, api_key=None, **_kwargs):
+        return None
+
+    def upload_file(self, path, mime_type=None, display_name=None, **_kwargs):
+        self._sleep(self.upload_latency)
+        with self._lock:
+            name = f"files/fake-{next(self._ids)}"
+            self._files[name] = {'polls': 0, 'display_name': display_name or os.path.basename(str(path))}
+            self.stats['uploads'] += 1
+        return self._file_object(name, 'PROCESSING' if self.active_after_polls > 0 else 'ACTIVE')
+
+    def get_file(self, name):
+        with self._lock:
+            self.stats['get_file_calls'] += 1
+            entry = self._files.get(name)
+            if entry is None:
+                raise FakeApiError(404, f"File {name} not found")
+            entry['polls'] += 1
+            state = 'ACTIVE' if entry['polls'] >= self.active_after_polls else 'PROCESSING'
+        return self._file_object(name, state)
+
+    def delete_file(self, name):
+        with self._lock:
+            if self._files.pop(getattr(name, 'name', name), None) is not None:
+                self.stats['deleted_files'] += 1
+
+    def _file_object(self, name, state):
+        return types.SimpleNamespace(
+            name=name,
+            display_name=self._files[name]['display_name'],
+            state=types.SimpleNamespace(name=state),
+            expiration_time=None,
+        )
+
+    # --- リクエストの処理 ---
+
+    def _draw(self):
+        with self._lock:
+            return self._rng.random()
+
+    def _enter(self):
+        with self._lock:
+            self._active += 1
+            self.stats['peak_concurrency'] = max(self.stats['peak_concurrency'], self._active)
+
+    def _leave(self, latency):
+        with self._lock:
+            self._active -= 1
+            self.stats['latencies'].append(latency)
+
+    def _maybe_fail(self):
+        for code, rate in sorted(self.error_rates.items()):
+            if rate and self._draw() < rate:
+                with self._lock:
+                    self.stats['errors'][code] = self.stats['errors'].get(code, 0) + 1
+                if code == 429:
+                    raise FakeApiError(429, "Resource has been exhausted (e.g. check quota).", self.retry_delay)
+                raise FakeApiError(code, "The service is currently unavailable.")
+
+    def _review_text(self, contents):
+        prompt = contents[0] if contents and isinstance(contents[0], str) else ''
+        packed = _PACKED_FILE_PATTERN.findall(prompt)
+        if packed:
+            # まとめレビューは区切り行でファイルごとに返す
+            return '\n'.join(
+                f"<<<REVIEW-BEGIN id={number}>>>\n## レビュー: {path}\n- 指摘はありません\n<<<REVIEW-END id={number}>>>"
+                for number, path in packed
+            )
+        first_line = prompt.splitlines()[0] if prompt else 'prompt'
+        return f"## レビューサマリー\n{first_line}\n\n## 改善点\n- 指摘はありません\n"
+
+    def _usage(self, contents, cached_tokens=0):
+        input_tokens = estimate_content_tokens(contents) + cached_tokens
+        return types.SimpleNamespace(
+            prompt_token_count=input_tokens,
+            cached_content_token_count=cached_tokens,
+            candidates_token_count=self.output_tokens,
+        )
+
+    def generate(self, contents, stream=False, cached_tokens=0):
+        contents = list(contents) if isinstance(contents, (list, tuple)) else [contents]
+        with self._lock:
+            self.stats['requests'] += 1
+            if stream:
+                self.stats['stream_requests'] += 1
+        self._maybe_fail()
+        latency = self.latency.sample(self._rng, estimate_content_tokens(contents))
+        text = self._review_text(contents)
+        usage = self._usage(contents, cached_tokens)
+        if not stream:
+            self._enter()
+            try:
+                self._sleep(latency)
+            finally:
+                self._leave(latency)
+            return types.SimpleNamespace(text=text, usage_metadata=usage)
+        disconnect = self.stream_disconnect_rate and self._draw() < self.stream_disconnect_rate
+        return _FakeStream(self, text, usage, latency, disconnect)
+
+    def _model_class(self):
+        backend = self
+
+        class FakeGenerativeModel:
+            def __init__(self, model_name='gemini-2.5-flash', cached_content=None, **_kwargs):
+                self.model_name = model_name
+                self.cached_content = cached_content
+
+            @classmethod
+            def from_cached_content(cls, cached_content):
+                return cls(cached_content.model, cached_content=cached_content)
+
+            def generate_content(self, contents, stream=False, **_kwargs):
+                cached_tokens = self.cached_content.tokens if self.cached_content is not None else 0
+                return backend.generate(contents, stream=stream, cached_tokens=cached_tokens)
+
+        return FakeGenerativeModel
+
+    def _cached_content_class(self):
+        backend = self
+
+        class FakeCachedContent:
+            def __init__(self, name, model, tokens):
+                self.name = name
+                self.model = model
+                self.tokens = tokens
+
+            @classmethod
+            def create(cls, model, contents, ttl=None, **_kwargs):
+                with backend._lock:
+                    name = f"cachedContents/fake-{next(backend._ids)}"
+                return cls(name, model, estimate_content_tokens(contents))
+
+            def delete(self):
+                return None
+
+        return FakeCachedContent
+
+
+class _FakeStream:
+    """stream=True のレスポンス（断片を順に返し、usage_metadata を持つ）"""
+
+    def __init__(self, backend, text, usage, latency, disconnect):
+        self._backend = backend
+        self._text = text
+        self._latency = latency
+        self._disconnect = disconnect
+        self.usage_metadata = usage
+        self.text = text
+
+    def __iter__(self):
+        backend = self._backend
+        count = backend.stream_chunks
+        size = max(1, math.ceil(len(self._text) / count))
+        pieces = [self._text[i:i + size] for i in range(0, len(self._text), size)] or ['']
+        first = self._latency * backend.first_chunk_fraction
+        rest = (self._latency - first) / max(1, len(pieces) - 1)
+        backend._enter()
+        try:
+            for index, piece in enumerate(pieces):
+                backend._sleep(first if index == 0 else rest)
+                if self._disconnect and index == len(pieces) // 2:
+                    with backend._lock:
+                        backend.stats['disconnects'] += 1
+                    raise ConnectionResetError('stream reset by fake server')
+                yield types.SimpleNamespace(text=piece)
+        finally:
+            backend._leave(self._latency)
+
+
+def install(fake, module=None):
+    """gemini_cli_wrapper（module を渡した場合はそのモジュール）が参照する genai を fake に差し替える
+
+    google-generativeai が入っていない環境でも gemini_cli_wrapper を import できるよう、
+    未登録の場合は fake を google.generativeai として登録してから import する。
+    """
+    if 'google.generativeai' not in sys.modules:
+        try:
+            import google.generativeai  # noqa: F401
+        except ImportError:
+            google = sys.modules.setdefault('google', types.ModuleType('google'))
+            sys.modules['google.generativeai'] = fake
+            google.generativeai = fake
+    if module is None:
+        import gemini_cli_wrapper as module
+    module.genai = fake
+    return module
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+OCR 画像前処理のマイクロベンチマーク
+
+従来の前処理（ImageEnhance.Contrast による全画素のブレンド → シャープネス → point による二値化）と、
+process_ocr.preprocess_image（変換表によるコントラスト強調 → シャープネス → 二値化）の所要時間を比較する。
+
+Usage:
+    python scripts/benchmarks/ocr_preprocess_benchmark.py [--width 3000] [--height 4000] [--repeat 5] [--image <png>]
+
+Requirements:
+    pip install pillow
+"""
+import statistics
+import sys
+import time
+from pathlib import Path
+
+from PIL import Image, ImageDraw, ImageEnhance, ImageFilter
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+import process_ocr  # noqa: E402
+
+
+def legacy_preprocess(image):
+    """変更前の前処理（比較用）"""
+    image = image.convert('L')
+    image = ImageEnhance.Contrast(image).enhance(process_ocr.CONTRAST_ENHANCEMENT_FACTOR)
+    image = image.filter(ImageFilter.SHARPEN)
+    return image.point(lambda p: 255 if p > process_ocr.BINARIZATION_THRESHOLD else 0)
+
+
+def synthetic_screenshot(width, height):
+    """文字を敷き詰めたカラーのスクリーンショット風画像を作る"""
+    image = Image.new('RGB', (width, height), (245, 245, 240))
+    draw = ImageDraw.Draw(image)
+    line = "def review(path): return gemini.generate_content(path)  # 自動レビュー 0123456789"
+    for y in range(0, height, 18):
+        draw.text((10, y), line * (width // 400 + 1), fill=(30, 30, 60))
+    return image
+
+
+def measure(func, image, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func(image)
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings)
+
+
+def main():
+    args = sys.argv[1:]
+    options = {'--width': 3000, '--height': 4000, '--repeat': 5, '--image': None}
+    for index in range(0, len(args) - 1, 2):
+        if args[index] in options:
+            options[args[index]] = args[index + 1]
+
+    if options['--image']:
+        image = Image.open(options['--image'])
+        image.load()
+    else:
+        image = synthetic_screenshot(int(options['--width']), int(options['--height']))
+    repeat = int(options['--repeat'])
+    print(f"Image: {image.width}x{image.height} {image.mode}, repeat={repeat}")
+
+    baseline = measure(legacy_preprocess, image, repeat)
+    print(f"legacy            : {baseline * 1000:8.1f} ms")
+    for method in process_ocr.THRESHOLD_METHODS:
+        elapsed = measure(lambda img: process_ocr.preprocess_image(img, threshold_method=method), image, repeat)
+        print(f"{method:<18}: {elapsed * 1000:8.1f} ms  (x{baseline / elapsed:.2f})")
+    image.info['dpi'] = (300, 300)
+    elapsed = measure(lambda img: process_ocr.preprocess_image(img, threshold_method='fixed', target_dpi=150), image, repeat)
+    print(f"{'fixed + 150dpi':<18}: {elapsed * 1000:8.1f} ms  (x{baseline / elapsed:.2f})")
+
+
+if __name__ == "__main__":
+    main()
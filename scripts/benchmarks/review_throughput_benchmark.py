@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+"""
+レビューパイプラインのスループットベンチマーク（Gemini API は fake_gemini で代替する）
+
+一時ディレクトリに合成リポジトリ（Python / TypeScript / JavaScript のファイルを複数ディレクトリに配置）を作り、
+batch_review_files または run_reviews.py の main を fake_gemini に対して実行して、
+ファイル/秒・ファイルごとのリクエスト時間の p50 / p95・プロセスのピーク RSS を表示する。
+API のクォータを使わないため、CI などでスループットの劣化を検出する用途に使える。
+
+Usage:
+    python scripts/benchmarks/review_throughput_benchmark.py [--files 100] [--driver batch|run_reviews]
+        [--concurrency 8] [--latency lognormal:0.5:0.4] [--error-429 0.02] [--error-503 0.01]
+        [--stream true] [--disconnect 0.0] [--pack-tokens 0] [--seed 1] [--repeat 1] [--json <path>]
+
+    --files: 合成リポジトリのファイル数（10〜1000）
+    --driver: batch は batch_review_files を直接、run_reviews は run_reviews.py の main を呼び出す
+    --latency: 応答時間の分布（fake_gemini.LatencyModel.parse を参照）
+    --json: 結果を JSON で書き出すパス（CI で前回の結果と比較する場合）
+
+Output:
+    files=100 driver=batch concurrency=8 exit_code=0 reviews=100 seconds=6.52 files_per_sec=15.34 p50=0.481 p95=1.210 ...
+
+    exit_code はドライバーの終了コード（レビューの失敗が許容値を超えた場合は 1）。その場合も計測結果は出力する。
+"""
+import contextlib
+import io
+import json
+import os
+import random
+import resource
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+BENCHMARK_DIR = Path(__file__).resolve().parent
+SCRIPTS_DIR = BENCHMARK_DIR.parent
+REPO_ROOT = SCRIPTS_DIR.parent
+for _path in (BENCHMARK_DIR, SCRIPTS_DIR):
+    if str(_path) not in sys.path:
+        sys.path.insert(0, str(_path))
+
+from fake_gemini import FakeGemini, LatencyModel, install  # noqa: E402
+
+MIN_FILES = 10
+MAX_FILES = 1000
+DRIVERS = ('batch', 'run_reviews')
+# 合成リポジトリで使う拡張子と、1 ファイルの行数の範囲
+SYNTHETIC_EXTENSIONS = ('.py', '.ts', '.js')
+SYNTHETIC_LINES = (20, 400)
+
+
+def synthetic_source(extension, lines, rng):
+    """拡張子に合わせたそれらしいソースコードを lines 行ぶん作る"""
+    if extension == '.py':
+        template = "def handler_{n}(value):\n    # 入力値を検証して返す\n    return value * {k}\n\n"
+    else:
+        template = "export function handler{n}(value) {{\n  // 入力値を検証して返す\n  return value * {k};\n}}\n"
+    body = []
+    for n in range(max(1, lines // 4)):
+        body.append(template.format(n=n, k=rng.randint(1, 99)))
+    return ''.join(body)
+
+
+def build_synthetic_repo(root, file_count, seed=None):
+    """root に file_count 個のソースファイルとレビュー用の docs を作り、ファイルの相対パスのリストを返す"""
+    rng = random.Random(seed)
+    root = Path(root)
+    docs = root / 'docs'
+    docs.mkdir(parents=True, exist_ok=True)
+    # 拡張子マップが参照するプロンプトもそのまま使う
+    for source in (REPO_ROOT / 'docs').glob('*'):
+        if source.suffix in ('.md', '.csv'):
+            (docs / source.name).write_text(source.read_text(encoding='utf-8'), encoding='utf-8')
+
+    files = []
+    for index in range(file_count):
+        extension = SYNTHETIC_EXTENSIONS[index % len(SYNTHETIC_EXTENSIONS)]
+        # 同じ名前のファイルが別のディレクトリにある構成も含める
+        relative = Path('src') / f"module{index % 17}" / f"file{index // 17}{extension}"
+        (root / relative).parent.mkdir(parents=True, exist_ok=True)
+        (root / relative).write_text(synthetic_source(extension, rng.randint(*SYNTHETIC_LINES), rng), encoding='utf-8')
+        files.append(relative.as_posix())
+    (root / 'decoded_files.txt').write_text('\n'.join(files) + '\n', encoding='utf-8')
+    return files
+
+
+def percentile(values, fraction):
+    """values の fraction（0〜1）分位点を返す（線形補間）"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * fraction
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+def peak_rss_mb():
+    """このプロセスのピーク RSS（MB）を返す（Linux は KB、macOS はバイト単位で返る）"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def _file_latencies(output_dir):
+    """出力ディレクトリの review_metrics.json からファイルごとのリクエスト時間を集める"""
+    from review_metrics import METRICS_FILENAME, load_metrics
+
+    latencies = []
+    for path in Path(output_dir).rglob(METRICS_FILENAME):
+        for run in load_metrics(path)['runs']:
+            latencies.extend(
+                record['request_seconds'] for record in run.get('file_metrics', []) if 'request_seconds' in record
+            )
+    return latencies
+
+
+def run_benchmark(
+    file_count=100,
+    driver='batch',
+    concurrency=8,
+    latency=None,
+    error_rates=None,
+    stream=False,
+    disconnect_rate=0.0,
+    pack_tokens=0,
+    seed=None,
+    sleep=time.sleep,
+):
+    """合成リポジトリで 1 回レビューを実行し、計測結果の辞書を返す"""
+    if not MIN_FILES <= file_count <= MAX_FILES:
+        raise ValueError(f"--files must be between {MIN_FILES} and {MAX_FILES}: {file_count}")
+    if driver not in DRIVERS:
+        raise ValueError(f"Unknown driver: {driver}")
+
+    fake = FakeGemini(
+        latency=latency,
+        error_rates=error_rates,
+        retry_delay=0,
+        stream_disconnect_rate=disconnect_rate,
+        seed=seed,
+        sleep=sleep,
+    )
+    gemini_cli_wrapper = install(fake)
+
+    env = {
+        'GEMINI_API_KEY': 'dummy',
+        'GEMINI_CONCURRENCY': str(concurrency),
+        'GEMINI_STREAM': 'true' if stream else 'false',
+        'GEMINI_PACK_TOKEN_BUDGET': str(pack_tokens),
+        'REVIEW_RESULT_CACHE_DIR': '.bench_result_cache',
+        'REVIEW_LOG_LEVEL': 'quiet',
+        'REVIEW_BASE_DIR': 'review',
+    }
+    saved_env = {key: os.environ.get(key) for key in env}
+    saved_cwd = os.getcwd()
+    with tempfile.TemporaryDirectory(prefix='review-bench-') as work_dir:
+        try:
+            os.environ.update(env)
+            os.chdir(work_dir)
+            build_synthetic_repo(work_dir, file_count, seed)
+            output_dir = Path(work_dir) / 'out'
+            stdout = io.StringIO()
+            exit_code = 0
+            started = time.perf_counter()
+            try:
+                if driver == 'batch':
+                    gemini_cli_wrapper.batch_review_files(
+                        'decoded_files.txt',
+                        str(output_dir),
+                        default_prompt_path='docs/instruction-review.md',
+                        default_custom_prompt_path='docs/instruction-review-custom.md',
+                        prompt_map_path='docs/target-extensions.csv',
+                        result_cache_dir=False,
+                    )
+                else:
+                    import run_reviews
+                    run_reviews._session = None
+                    with contextlib.redirect_stdout(stdout):
+                        run_reviews.main()
+            except SystemExit as e:
+                # 失敗の割合が GEMINI_FAILURE_THRESHOLD を超えるとドライバーは非ゼロ終了する。その場合も計測結果を返す
+                exit_code = _exit_code(e)
+            seconds = time.perf_counter() - started
+            if driver == 'run_reviews':
+                outputs = dict(line.split('=', 1) for line in stdout.getvalue().splitlines() if '=' in line)
+                output_dir = Path(outputs.get('files_to_commit') or 'review')
+            reviews = len([p for p in Path(output_dir).rglob('*.md')])
+            latencies = _file_latencies(output_dir)
+        finally:
+            os.chdir(saved_cwd)
+            for key, value in saved_env.items():
+                if value is None:
+                    os.environ.pop(key, None)
+                else:
+                    os.environ[key] = value
+
+    return {
+        'files': file_count,
+        'driver': driver,
+        'concurrency': concurrency,
+        'exit_code': exit_code,
+        'reviews': reviews,
+        'seconds': round(seconds, 4),
+        'files_per_sec': round(file_count / seconds, 2) if seconds > 0 else 0.0,
+        'p50': round(percentile(latencies, 0.5), 4),
+        'p95': round(percentile(latencies, 0.95), 4),
+        'peak_rss_mb': round(peak_rss_mb(), 1),
+        'requests': fake.stats['requests'],
+        'errors': sum(fake.stats['errors'].values()),
+        'disconnects': fake.stats['disconnects'],
+        'peak_concurrency': fake.stats['peak_concurrency'],
+    }
+
+
+def _exit_code(exc):
+    """SystemExit の終了コードを整数で返す（sys.exit() と同じく None は 0、整数以外は 1）"""
+    if exc.code is None:
+        return 0
+    return exc.code if isinstance(exc.code, int) else 1
+
+
+def _parse_bool(value):
+    return str(value).strip().lower() in ('1', 'true', 'yes', 'on')
+
+
+def main():
+    args = sys.argv[1:]
+    options = {
+        '--files': '100',
+        '--driver': 'batch',
+        '--concurrency': '8',
+        '--latency': 'lognormal:0.5:0.4',
+        '--error-429': '0',
+        '--error-503': '0',
+        '--stream': 'false',
+        '--disconnect': '0',
+        '--pack-tokens': '0',
+        '--seed': '1',
+        '--repeat': '1',
+        '--json': None,
+    }
+    for index in range(0, len(args) - 1, 2):
+        if args[index] not in options:
+            print(f"Error: Unknown option: {args[index]}", file=sys.stderr)
+            sys.exit(1)
+        options[args[index]] = args[index + 1]
+
+    try:
+        results = []
+        for repeat in range(int(options['--repeat'])):
+            result = run_benchmark(
+                file_count=int(options['--files']),
+                driver=options['--driver'],
+                concurrency=int(options['--concurrency']),
+                latency=LatencyModel.parse(options['--latency']),
+                error_rates={429: float(options['--error-429']), 503: float(options['--error-503'])},
+                stream=_parse_bool(options['--stream']),
+                disconnect_rate=float(options['--disconnect']),
+                pack_tokens=int(options['--pack-tokens']),
+                seed=int(options['--seed']) + repeat,
+            )
+            results.append(result)
+            print(' '.join(f"{key}={value}" for key, value in result.items()))
+    except ValueError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
+
+    if len(results) > 1:
+        print(f"median files_per_sec={statistics.median(r['files_per_sec'] for r in results)}")
+    if options['--json']:
+        with open(options['--json'], 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+            f.write('\n')
+
+
+if __name__ == "__main__":
+    main()
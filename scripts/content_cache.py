@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+コンテンツハッシュをキーにしたテキストの永続キャッシュ
+
+1 エントリを 1 ファイルとしてキャッシュディレクトリに保存する。
+参照されたエントリは更新日時を更新し、容量・件数・経過日数の上限を超えた場合は
+最も古く参照されたものから削除する。
+"""
+import hashlib
+import os
+import threading
+import time
+from pathlib import Path
+
+import review_log as log
+
+
+def sha256_bytes(data: bytes) -> str:
+    """バイト列の SHA-256 を16進文字列で返す"""
+    return hashlib.sha256(data).hexdigest()
+
+
+def sha256_file(path) -> str:
+    """ファイル内容の SHA-256 を16進文字列で返す"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def build_cache_key(*parts) -> str:
+    """複数の要素（bytes / str）を連結したハッシュキーを返す
+
+    要素の境界が曖昧にならないよう、各要素の長さを前置してからハッシュする。
+    """
+    digest = hashlib.sha256()
+    for part in parts:
+        data = part if isinstance(part, bytes) else str(part).encode('utf-8')
+        digest.update(f"{len(data)}:".encode('ascii'))
+        digest.update(data)
+    return digest.hexdigest()
+
+
+class ContentCache:
+    """キー -> テキストの永続キャッシュ（スレッドセーフ）"""
+
+    def __init__(self, cache_dir, max_bytes=None, max_entries=None, max_age_seconds=None, suffix='.txt'):
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.max_age_seconds = max_age_seconds
+        self.suffix = suffix
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def _entry_path(self, key: str) -> Path:
+        return self.cache_dir / f"{key}{self.suffix}"
+
+    def _is_expired(self, mtime: float, now: float) -> bool:
+        return self.max_age_seconds is not None and now - mtime > self.max_age_seconds
+
+    def get(self, key: str):
+        """キーに対応するテキストを返す。存在しない・期限切れの場合は None"""
+        path = self._entry_path(key)
+        try:
+            stat = path.stat()
+            if self._is_expired(stat.st_mtime, time.time()):
+                path.unlink()
+                text = None
+            else:
+                text = path.read_text(encoding='utf-8')
+                # LRU 判定のため参照時刻を更新する
+                os.utime(path, None)
+        except (OSError, UnicodeDecodeError):
+            text = None
+        with self._lock:
+            if text is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return text
+
+    def put(self, key: str, text: str):
+        """テキストを保存する（一時ファイル経由で置き換えるため読み手が壊れた内容を見ることはない）"""
+        path = self._entry_path(key)
+        tmp_path = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        try:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            tmp_path.write_text(text, encoding='utf-8')
+            os.replace(tmp_path, path)
+        except OSError as e:
+            # キャッシュ保存失敗は致命的ではない。ログのみ出力する
+            log.warning(f"Failed to write cache entry {path}: {e}")
+            try:
+                tmp_path.unlink()
+            except OSError:
+                pass
+
+    def evict(self) -> int:
+        """期限切れのエントリと上限超過分を削除し、削除件数を返す"""
+        if not self.cache_dir.exists():
+            return 0
+        now = time.time()
+        entries = []
+        removed = 0
+        for path in self.cache_dir.glob(f"*{self.suffix}"):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            if self._is_expired(stat.st_mtime, now):
+                removed += self._unlink(path)
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+        # 新しく参照されたものから順に残し、上限を超えた古いものを削除する
+        entries.sort(key=lambda entry: entry[0], reverse=True)
+        total_bytes = 0
+        for index, (_mtime, size, path) in enumerate(entries):
+            total_bytes += size
+            over_entries = self.max_entries is not None and index >= self.max_entries
+            over_bytes = self.max_bytes is not None and total_bytes > self.max_bytes
+            if over_entries or over_bytes:
+                removed += self._unlink(path)
+        return removed
+
+    @staticmethod
+    def _unlink(path: Path) -> int:
+        try:
+            path.unlink()
+            return 1
+        except OSError:
+            return 0
+
+    def stats_line(self, label: str) -> str:
+        """ヒット/ミス件数のサマリ文字列を返す"""
+        return f"{label}: hits={self.hits} misses={self.misses}"
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+オプション値の決定（明示値 -> 環境変数 -> 既定値）
+
+レビュー（gemini_cli_wrapper.py / token_preflight.py）と OCR（process_ocr.py）で共通に使い、
+環境変数の解釈と不正な値の警告をどこでも同じにする。
+
+- resolve_option: 明示値・環境変数のうち最初に解釈できた値を返す（解釈できない値は出どころを示して警告する）
+- env_number: 数値の環境変数を読み込む
+- parse_*: resolve_option に渡す値の解釈
+"""
+import os
+
+import review_log as log
+
+
+def resolve_option(explicit, env_name, parse, default, name=None):
+    """オプションの値を決定する（明示 -> 環境変数 env_name -> default）
+
+    None・空白のみの値は未指定として扱う。parse が ValueError を送出した値は、どこから渡された値か
+    （明示値 name か環境変数 env_name か）を示して警告し、次の候補を使う。
+    """
+    explicit_source = f"explicit {name}" if name else "explicit value"
+    for source, candidate in ((explicit_source, explicit), (f"env {env_name}", os.getenv(env_name) if env_name else None)):
+        if candidate is None or (isinstance(candidate, str) and not candidate.strip()):
+            continue
+        try:
+            return parse(candidate.strip() if isinstance(candidate, str) else candidate)
+        except (TypeError, ValueError) as e:
+            log.warning(f"Invalid {source} ignored: {candidate!r} ({e})")
+    return default
+
+
+def env_number(name, default, cast=float):
+    """数値の環境変数を読み込む。未設定・空・不正値の場合は default を返す"""
+    return resolve_option(None, name, cast, default)
+
+
+def parse_flag(value):
+    """真偽値のオプション（文字列は 1 / true / yes のみ有効）"""
+    if isinstance(value, bool):
+        return value
+    return str(value).strip().lower() in ('1', 'true', 'yes')
+
+
+def parse_count(value):
+    """0 以上の整数のオプション（負の値は 0 に丸める）"""
+    return max(0, int(str(value).strip()))
+
+
+def parse_amount(value):
+    """0 以上の実数のオプション（負の値は 0 に丸める）"""
+    return max(0.0, float(str(value).strip()))
+
+
+def parse_ratio(value):
+    """0〜1 の割合のオプション"""
+    return min(1.0, max(0.0, float(str(value).strip())))
+
+
+def parse_positive_int(value):
+    """1 以上の整数のオプション（並列数など）"""
+    number = int(str(value).strip())
+    if number < 1:
+        raise ValueError("must be >= 1")
+    return number
+
+
+def choice_parser(choices):
+    """choices のいずれか（大文字小文字を区別しない）を受け付ける解釈関数を返す"""
+    def parse(value):
+        choice = str(value).strip().lower()
+        if choice not in choices:
+            raise ValueError(f"expected one of {', '.join(choices)}")
+        return choice
+    return parse
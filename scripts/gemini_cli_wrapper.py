@@ -4,15 +4,37 @@ import os
 import time
 import json
 import csv
+import fnmatch
+import mimetypes
+import re
+import subprocess
+import threading
+from dataclasses import dataclass, replace
+from datetime import datetime, timedelta
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from pathlib import Path
 import google.generativeai as genai
 import traceback
 
+from content_cache import ContentCache, build_cache_key, sha256_bytes, sha256_file
+from env_options import (
+    choice_parser, env_number, parse_amount, parse_count, parse_flag, parse_positive_int, parse_ratio, resolve_option,
+)
+from rate_limit import RETRYABLE, RateLimiter, call_with_retry, classify_error
+from review_metrics import FAILURES_FILENAME, ReviewMetrics, append_metrics_run, update_failure_manifest, update_review_index
+from review_journal import JOURNAL_PENDING, ReviewJournal
+from source_paths import source_relative_path
+from token_preflight import (
+    TOKEN_COUNTER_API, PreflightBudget, TokenCounter, open_token_count_cache, resolve_prices, resolve_token_counter,
+)
+import review_log as log
+from review_log import text_digest
+
 def setup_genai():
     # 環境変数からGEMINI_API_KEYを取得
     api_key = os.getenv('GEMINI_API_KEY')
     if not api_key:
-        print("Error: GEMINI_API_KEY environment variable is not set", file=sys.stderr)
+        log.error("GEMINI_API_KEY environment variable is not set")
         sys.exit(1)
     genai.configure(api_key=api_key)
 
@@ -25,12 +47,56 @@ def _resolve_model_name(explicit_model_name):
     - 環境変数 GEMINI_MODEL（空白のみは無効）
     - デフォルト 'gemini-2.5-flash'
     """
-    if explicit_model_name and str(explicit_model_name).strip():
-        return str(explicit_model_name).strip()
-    env_model = os.getenv('GEMINI_MODEL')
-    if env_model and str(env_model).strip():
-        return str(env_model).strip()
-    return 'gemini-2.5-flash'
+    return resolve_option(explicit_model_name, 'GEMINI_MODEL', str, 'gemini-2.5-flash')
+
+
+def estimate_tokens(text):
+    """テキストのトークン数を API を呼ばずに概算する
+
+    ASCII 文字は約 4 文字で 1 トークン、日本語などの非 ASCII 文字は 1 文字 1 トークンとして数える。
+    """
+    if not text:
+        return 0
+    non_ascii = sum(1 for ch in text if ord(ch) > 127)
+    return (len(text) - non_ascii + 3) // 4 + non_ascii
+
+
+def open_rate_limiter(rpm=None, tpm=None):
+    """generate_content 用の共有レート制限を作成する。
+
+    明示値が無ければ環境変数 GEMINI_RPM（リクエスト数/分）・GEMINI_TPM（入力トークン数/分）を使う。
+    どちらも未設定（または 0）の場合は制限しないため None を返す。
+    """
+    rpm = resolve_option(rpm, 'GEMINI_RPM', float, 0.0)
+    tpm = resolve_option(tpm, 'GEMINI_TPM', float, 0.0)
+    if rpm <= 0 and tpm <= 0:
+        return None
+    return RateLimiter(rpm=rpm if rpm > 0 else None, tpm=tpm if tpm > 0 else None)
+
+
+RESULT_CACHE_DIR = '.review_result_cache'
+
+
+def open_result_cache(cache_dir=None):
+    """レビュー結果キャッシュを開く。
+
+    cache_dir が False の場合はキャッシュを無効にして None を返す。
+    None の場合は環境変数 REVIEW_RESULT_CACHE_DIR、未設定なら RESULT_CACHE_DIR を使う。
+    容量と保持期間は REVIEW_RESULT_CACHE_MAX_MB / REVIEW_RESULT_CACHE_MAX_AGE_DAYS で調整できる。
+    """
+    if cache_dir is False:
+        return None
+    if not cache_dir:
+        env_dir = os.getenv('REVIEW_RESULT_CACHE_DIR')
+        cache_dir = env_dir.strip() if env_dir and env_dir.strip() else RESULT_CACHE_DIR
+    max_mb = env_number('REVIEW_RESULT_CACHE_MAX_MB', 100.0)
+    max_age_days = env_number('REVIEW_RESULT_CACHE_MAX_AGE_DAYS', 14.0)
+    return ContentCache(
+        cache_dir,
+        max_bytes=int(max_mb * 1024 * 1024),
+        max_age_seconds=max_age_days * 24 * 60 * 60,
+        suffix='.md',
+    )
 
 def wait_for_file_active(file_name, timeout=120, interval=2):
     """アップロード済みファイルが ACTIVE になるまで定期的に確認する"""
@@ -42,15 +108,69 @@ def wait_for_file_active(file_name, timeout=120, interval=2):
         if not state_name or state_name == "ACTIVE":
             return file
         if state_name == "FAILED":
-            print(f"Error: File processing failed for {file_name}", file=sys.stderr)
+            log.error(f"File processing failed for {file_name}")
             sys.exit(1)
         if time.time() >= deadline:
-            print(f"Error: Timed out waiting for file to become ACTIVE: {file_name}", file=sys.stderr)
+            log.error(f"Timed out waiting for file to become ACTIVE: {file_name}")
             sys.exit(1)
         time.sleep(interval)
 
 
+
+def _file_state_name(file):
+    state = getattr(file, "state", None)
+    return getattr(state, "name", state)
+
+
+def poll_files_active(file_names, timeout=120, initial_interval=0.5, max_interval=5.0):
+    """複数のアップロード済みファイルをまとめてポーリングし、ACTIVE になるまで待つ
+
+    未完了のファイルだけを毎回並列に確認し、確認間隔は initial_interval から max_interval まで徐々に伸ばす。
+    (ACTIVE になった name -> File の辞書, 失敗した name -> 理由 の辞書) を返す。
+    取得自体に失敗したもの（削除済み・失効済みなど）と FAILED / タイムアウトは失敗として扱う。
+    """
+    pending = list(dict.fromkeys(name for name in file_names if name))
+    active = {}
+    failed = {}
+    deadline = time.time() + timeout
+    interval = initial_interval
+
+    def fetch(name):
+        try:
+            return genai.get_file(name), None
+        except Exception as e:
+            return None, e
+
+    with ThreadPoolExecutor(max_workers=max(1, min(8, len(pending)))) as executor:
+        while pending:
+            still_pending = []
+            for name, (file, error) in zip(pending, executor.map(fetch, pending)):
+                if error is not None:
+                    failed[name] = f"get_file failed: {error}"
+                    continue
+                state_name = _file_state_name(file)
+                if not state_name or state_name == "ACTIVE":
+                    active[name] = file
+                elif state_name == "FAILED":
+                    failed[name] = "processing failed"
+                else:
+                    still_pending.append(name)
+            pending = still_pending
+            if not pending:
+                break
+            if time.time() >= deadline:
+                for name in pending:
+                    failed[name] = "timed out waiting for ACTIVE"
+                break
+            time.sleep(interval)
+            interval = min(max_interval, interval * 1.5)
+    return active, failed
+
 PROMPT_CACHE_FILE = Path('.prompt_upload_cache.json')
+# Gemini にアップロードしたファイルは約 48 時間で失効する
+PROMPT_FILE_TTL_SECONDS = 48 * 60 * 60
+# 失効までの残り時間がこれより短いエントリは、使用中に失効しないよう事前に再アップロードする
+PROMPT_CACHE_REFRESH_MARGIN_SECONDS = 2 * 60 * 60
 
 
 def _load_prompt_cache():
@@ -64,42 +184,64 @@ def _load_prompt_cache():
 
 
 def _save_prompt_cache(cache):
+    # 一時ファイルに書いてから置き換えることで、中断時や actions/cache での復元時に壊れたファイルを残さない
+    tmp_path = PROMPT_CACHE_FILE.with_name(f"{PROMPT_CACHE_FILE.name}.{os.getpid()}.tmp")
     try:
-        PROMPT_CACHE_FILE.write_text(json.dumps(cache, ensure_ascii=False, indent=2), encoding='utf-8')
+        tmp_path.write_text(json.dumps(cache, ensure_ascii=False, indent=2), encoding='utf-8')
+        os.replace(tmp_path, PROMPT_CACHE_FILE)
     except Exception:
         # キャッシュ保存失敗は致命的ではない。ログのみ出力する
-        print("Warning: Failed to write prompt cache", file=sys.stderr)
+        log.warning("Failed to write prompt cache")
+        try:
+            tmp_path.unlink()
+        except OSError:
+            pass
+
+
+def _file_expiration_timestamp(file, uploaded_at):
+    """アップロード済み File の失効時刻（UNIX 秒）を返す。取得できなければ既定の有効期間から推定する"""
+    expiration = getattr(file, "expiration_time", None)
+    if hasattr(expiration, "timestamp"):
+        return expiration.timestamp()
+    if isinstance(expiration, str) and expiration:
+        try:
+            return datetime.fromisoformat(expiration.replace('Z', '+00:00')).timestamp()
+        except ValueError:
+            pass
+    return uploaded_at + PROMPT_FILE_TTL_SECONDS
+
+
+def _prompt_cache_entry(file_id, content_hash, file, uploaded_at):
+    return {
+        "file_id": file_id,
+        "sha256": content_hash,
+        "uploaded_at": uploaded_at,
+        "expires_at": _file_expiration_timestamp(file, uploaded_at),
+    }
+
+
+def _prompt_cache_stale_reason(entry, content_hash, now):
+    """キャッシュエントリが再利用できない理由を返す。再利用できる場合は None"""
+    if not isinstance(entry, dict) or not entry.get("file_id"):
+        return "no valid cache entry"
+    if entry.get("sha256") != content_hash:
+        return "content changed"
+    try:
+        expires_at = float(entry.get("expires_at"))
+    except (TypeError, ValueError):
+        return "unknown expiry"
+    if expires_at - now < PROMPT_CACHE_REFRESH_MARGIN_SECONDS:
+        return "expired or expiring soon"
+    return None
 
 
 def upload_prompt_file(prompt_file_path):
     """プロンプトファイルをアップロードして file_id を返す（内部用、標準出力なし）"""
     if not os.path.exists(prompt_file_path):
-        print(f"Error: Prompt file does not exist: {prompt_file_path}", file=sys.stderr)
+        log.error(f"Prompt file does not exist: {prompt_file_path}")
         sys.exit(1)
-    # キャッシュからチェック
-    cache = _load_prompt_cache()
     abs_path = os.path.abspath(prompt_file_path)
-    cached = cache.get(abs_path)
-    if cached:
-        try:
-            # キャッシュされた file_id がすでに ACTIVE か確認
-            wait_for_file_active(cached)
-            print(f"Using cached prompt file ID for {prompt_file_path}: {cached}", file=sys.stderr)
-            return cached
-        except Exception:
-            # キャッシュが無効な場合は再アップロードを行う
-            pass
-    file = genai.upload_file(prompt_file_path)
-    file = wait_for_file_active(file.name)
-    file_id = getattr(file, "name", None) or getattr(file, "file_id", None)
-    if not file_id:
-        print("Error: Unable to determine uploaded prompt file ID", file=sys.stderr)
-        sys.exit(1)
-    # キャッシュに保存
-    cache[abs_path] = file_id
-    _save_prompt_cache(cache)
-    print(f"Uploaded prompt file. File ID: {file_id}", file=sys.stderr)
-    return file_id
+    return upload_prompt_files([abs_path])[abs_path]
 
 
 def upload_prompt_file_cli(prompt_file_path):
@@ -123,7 +265,7 @@ def build_prompt_file_parts(prompt_file_ids):
             # Python SDK では File オブジェクトをそのまま使用する
             parts.append(uploaded_file)
         except Exception:
-            print(f"Warning: Failed to load prompt file {file_id}, skipping", file=sys.stderr)
+            log.warning(f"Failed to load prompt file {file_id}, skipping")
             continue
     return parts
 
@@ -136,7 +278,7 @@ def load_prompt_mapping(csv_path):
     csv_path = os.path.abspath(csv_path)
     base_dir = os.path.dirname(csv_path)
     if not os.path.exists(csv_path):
-        print(f"Warning: prompt map not found: {csv_path}", file=sys.stderr)
+        log.warning(f"prompt map not found: {csv_path}")
         return mapping
 
     with open(csv_path, 'r', encoding='utf-8') as f:
@@ -155,21 +297,87 @@ def load_prompt_mapping(csv_path):
     return mapping
 
 
-def upload_prompt_files(prompt_paths):
-    """プロンプトファイルをアップロードしてパスと file_id の対応表を返す"""
+def _upload_prompt_files_parallel(prompt_paths):
+    """複数のプロンプトファイルを並列にアップロードし、パス -> (File, アップロード時刻) を返す（ACTIVE 待ちはしない）"""
+    def upload(prompt_path):
+        uploaded_at = time.time()
+        return genai.upload_file(prompt_path), uploaded_at
+
+    with ThreadPoolExecutor(max_workers=max(1, min(8, len(prompt_paths)))) as executor:
+        return dict(zip(prompt_paths, executor.map(upload, prompt_paths)))
+
+
+def upload_prompt_files(prompt_paths, parts_cache=None):
+    """プロンプトファイルをアップロードしてパスと file_id の対応表を返す
+
+    キャッシュ（PROMPT_CACHE_FILE）は内容ハッシュと失効時刻を検証し、
+    内容が変わったもの・失効間近のものだけを再アップロードして最後に一度だけ保存する。
+    アップロードは並列に行い、新規分とキャッシュ分の ACTIVE 確認は poll_files_active でまとめて行う。
+    キャッシュ済みの ID がサーバー側で失効・削除されていた場合はその場で再アップロードする。
+    parts_cache を渡すと、確認時に取得した File を file_id -> [File] として格納する
+    （get_prompt_parts_for_paths がそのまま再利用するため、ファイルごとの再取得が不要になる）。
+    """
     uploaded = {}
     # 既存のキャッシュを先にロード
     cache = _load_prompt_cache()
+    cache_changed = False
+    now = time.time()
+    content_hashes = {}
+    stale_paths = []
 
     for prompt_path in sorted({os.path.abspath(p) for p in prompt_paths if p}):
         if not os.path.exists(prompt_path):
-            print(f"Warning: Prompt file not found: {prompt_path}", file=sys.stderr)
+            log.warning(f"Prompt file not found: {prompt_path}")
             continue
-        # キャッシュに存在すればキャッシュ値を利用
-        if prompt_path in cache:
-            uploaded[prompt_path] = cache.get(prompt_path)
+        content_hashes[prompt_path] = sha256_file(prompt_path)
+        entry = cache.get(prompt_path)
+        stale_reason = _prompt_cache_stale_reason(entry, content_hashes[prompt_path], now)
+        # 内容・有効期限ともに問題なければキャッシュ値を利用
+        if stale_reason is None:
+            log.info(f"Using cached prompt file ID for {prompt_path}: {entry['file_id']}")
+            uploaded[prompt_path] = entry["file_id"]
             continue
-        uploaded[prompt_path] = upload_prompt_file(prompt_path)
+        if entry is not None:
+            log.info(f"Re-uploading prompt file {prompt_path} ({stale_reason})")
+        stale_paths.append(prompt_path)
+
+    # キャッシュ済み ID の検証と新規アップロード分の ACTIVE 待ちを 1 回のポーリングで行う
+    # （キャッシュ済み ID が無効だった場合は再アップロードしてもう 1 回だけポーリングする）
+    for attempt in range(2):
+        new_uploads = _upload_prompt_files_parallel(stale_paths) if stale_paths else {}
+        # 2 回目は再アップロードした分だけを確認する
+        to_check = dict(uploaded) if attempt == 0 else {}
+        for prompt_path, (file, _uploaded_at) in new_uploads.items():
+            to_check[prompt_path] = getattr(file, "name", None) or getattr(file, "file_id", None)
+            uploaded[prompt_path] = to_check[prompt_path]
+        active, failed = poll_files_active(to_check.values())
+
+        stale_paths = []
+        for prompt_path, file_id in to_check.items():
+            if file_id in active:
+                if parts_cache is not None:
+                    parts_cache[file_id] = [active[file_id]]
+                if prompt_path in new_uploads:
+                    log.info(f"Uploaded prompt file {os.path.basename(prompt_path)}. File ID: {file_id}")
+                    cache[prompt_path] = _prompt_cache_entry(
+                        file_id, content_hashes[prompt_path], active[file_id], new_uploads[prompt_path][1]
+                    )
+                    cache_changed = True
+                continue
+            reason = failed.get(file_id, "unknown error")
+            if prompt_path in new_uploads or attempt > 0:
+                log.error(f"Prompt file upload failed for {prompt_path} ({file_id}): {reason}")
+                sys.exit(1)
+            log.info(f"Re-uploading prompt file {prompt_path} (cached file unavailable: {reason})")
+            del uploaded[prompt_path]
+            cache.pop(prompt_path, None)
+            cache_changed = True
+            stale_paths.append(prompt_path)
+        if not stale_paths:
+            break
+
+    if cache_changed:
+        _save_prompt_cache(cache)
     return uploaded
 
 
@@ -182,13 +390,667 @@ def get_prompt_parts_for_paths(prompt_paths, uploaded_ids, cache):
         abs_path = os.path.abspath(prompt_path)
         file_id = uploaded_ids.get(abs_path)
         if not file_id:
-            print(f"Warning: Prompt file not uploaded: {abs_path}", file=sys.stderr)
+            log.warning(f"Prompt file not uploaded: {abs_path}")
             continue
         if file_id not in cache:
             cache[file_id] = build_prompt_file_parts([file_id])
         parts.extend(cache[file_id])
     return parts
 
+def _extension_candidates(file_path):
+    """拡張子マップの検索候補（複合拡張子 -> 末尾側の単一拡張子の順）を返す"""
+    suffixes = [s.lower() for s in Path(file_path).suffixes]
+    candidates = []
+    if suffixes:
+        candidates.append(''.join(suffixes))
+        for suf in reversed(suffixes):
+            candidates.append(suf)
+    return candidates
+
+
+def resolve_prompt_paths_for_file(file_path, prompt_map, default_prompt_paths):
+    """ファイルの拡張子に基づいて (一致した拡張子, 使用するプロンプトファイルパスのリスト) を返す
+
+    拡張子マップに一致しない場合は (None, default_prompt_paths) を返す。
+    """
+    # 拡張子に対応するプロンプトを検索
+    for ext in _extension_candidates(file_path):
+        if ext in prompt_map:
+            base_path, custom_path = prompt_map[ext]
+            # 拡張子専用のプロンプトを優先的に追加
+            paths = [os.path.abspath(p) for p in (base_path, custom_path) if p]
+            return ext, paths
+    return None, list(default_prompt_paths)
+
+
+def open_token_counter(explicit_counter, model, model_name, max_api_tokens=None, limiter=None, max_retries=0):
+    """pre-flight 用の TokenCounter を作る（GEMINI_TOKEN_COUNTER=api の場合のみ count_tokens を呼ぶ）"""
+    if resolve_token_counter(explicit_counter) == TOKEN_COUNTER_API:
+        return TokenCounter(
+            estimate_tokens, model, model_name, open_token_count_cache(), max_api_tokens, limiter, max_retries,
+        )
+    return TokenCounter(estimate_tokens)
+
+
+# 1 リクエストにまとめるファイル数の上限（出力が長くなりすぎて途中で切れるのを避ける）
+PACK_MAX_FILES = 8
+PACK_BEGIN_MARKER = '<<<REVIEW-BEGIN id={}>>>'
+PACK_END_MARKER = '<<<REVIEW-END id={}>>>'
+_PACKED_REVIEW_PATTERN = re.compile(r'<<<REVIEW-BEGIN id=(\d+)>>>\s*\n(.*?)\n?<<<REVIEW-END id=\1>>>', re.DOTALL)
+
+
+def estimate_file_tokens(file_path):
+    """ファイルを読まずに、estimate_tokens で数えた場合のトークン数の上限をサイズから求める
+
+    estimate_tokens は非 ASCII 文字を 1 文字 1 トークンと数え、UTF-8 の非 ASCII 文字は 2 バイト以上なので、
+    2 バイトを 1 トークンとみなせば日本語などの多バイト文字が多いファイルでも少なく見積もらない。
+    """
+    try:
+        return os.path.getsize(file_path) // 2 + 1
+    except OSError:
+        return 0
+
+
+def min_file_tokens(file_path):
+    """ファイルを読まずに、estimate_tokens で数えた場合のトークン数の下限をサイズから求める
+
+    ASCII 文字は 4 バイトで 1 トークン、非 ASCII 文字は 4 バイト以下で 1 トークンになるため、4 バイトを 1 トークンとみなす。
+    """
+    try:
+        return os.path.getsize(file_path) // 4
+    except OSError:
+        return 0
+
+
+class PreloadCache:
+    """pre-flight で読み込んだファイルの内容を、レビュー時に読み直さないよう保持する（スレッドセーフ）
+
+    保持する合計は max_bytes まで。超える分は保持せず、レビュー時に読み直す
+    （大量のファイルを含む push で、最初のリクエストを送る前に全ファイルをメモリに載せないため）。
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.held_bytes = 0
+        self._contents = {}
+        self._lock = threading.Lock()
+
+    def put(self, file_path, data):
+        """data を保持できれば True を返す"""
+        with self._lock:
+            if file_path in self._contents or self.held_bytes + len(data) > self.max_bytes:
+                return False
+            self._contents[file_path] = data
+            self.held_bytes += len(data)
+            return True
+
+    def pop(self, file_path):
+        """保持している内容を取り出す（無ければ None）"""
+        with self._lock:
+            data = self._contents.pop(file_path, None)
+            if data is not None:
+                self.held_bytes -= len(data)
+            return data
+
+
+def open_preload_cache():
+    """pre-flight の読み込み内容の保持上限を GEMINI_PRELOAD_MAX_MB（既定 64MB、0 で保持しない）から決める"""
+    return PreloadCache(int(max(0.0, env_number('GEMINI_PRELOAD_MAX_MB', 64.0)) * 1024 * 1024))
+
+
+def plan_review_packs(file_entries, token_budget):
+    """(ファイルパス, プロンプトの組) のリストを個別レビューとまとめレビューに振り分ける
+
+    推定トークン数が予算の半分以下のファイルを、同じプロンプトの組ごとにリスト順で詰めていく。
+    (個別にレビューするファイル番号のリスト, まとめてレビューするファイル番号のリストのリスト) を返す。
+    """
+    singles = []
+    open_packs = {}
+    packs = []
+    for index, (file_path, prompt_key) in enumerate(file_entries):
+        tokens = estimate_file_tokens(file_path)
+        if not os.path.exists(file_path) or tokens > token_budget // 2:
+            singles.append(index)
+            continue
+        pack = open_packs.get(prompt_key)
+        if pack is None or pack['tokens'] + tokens > token_budget or len(pack['indexes']) >= PACK_MAX_FILES:
+            pack = {'tokens': 0, 'indexes': []}
+            open_packs[prompt_key] = pack
+            packs.append(pack['indexes'])
+        pack['tokens'] += tokens
+        pack['indexes'].append(index)
+
+    # 1 件しか入らなかったまとめは個別レビューに戻す
+    for indexes in [p for p in packs if len(p) == 1]:
+        singles.extend(indexes)
+    return sorted(singles), [p for p in packs if len(p) > 1]
+
+
+def build_packed_prompt(file_entries):
+    """(ファイルパス, 内容) のリストから、複数ファイルを個別にレビューさせるプロンプトを組み立てる"""
+    lines = [
+        f"以下の {len(file_entries)} 個のファイルを、それぞれ独立してレビューしてください。",
+        "各ファイルのレビュー結果は、ファイルごとに次の区切り行で囲んで出力してください。",
+        "区切り行は一字一句変更せず、区切り行の外には何も出力しないでください。",
+        "",
+    ]
+    for number, (file_path, _content) in enumerate(file_entries, start=1):
+        lines.append(f"- {file_path}: {PACK_BEGIN_MARKER.format(number)} ... {PACK_END_MARKER.format(number)}")
+    for number, (file_path, content) in enumerate(file_entries, start=1):
+        lines.extend(["", f"=== id={number} File: {file_path} ===", "", "```", content, "```"])
+    return "\n".join(lines)
+
+
+def split_packed_response(text, expected_count):
+    """まとめレビューの出力をファイルごとのレビューに分割する。すべて揃わなければ None を返す"""
+    reviews = {}
+    for match in _PACKED_REVIEW_PATTERN.finditer(text or ''):
+        reviews.setdefault(int(match.group(1)), match.group(2).strip())
+    expected = range(1, expected_count + 1)
+    if any(not reviews.get(number) for number in expected):
+        return None
+    return [reviews[number] for number in expected]
+
+
+REVIEW_OK = 'ok'
+REVIEW_FAILED = 'failed'
+REVIEW_SKIPPED = 'skipped'
+
+# 分割位置として優先する行（トップレベルの関数・クラス定義など）
+_CHUNK_BOUNDARY_PATTERN = re.compile(
+    r'^(?:(?:export\s+)?(?:default\s+)?(?:async\s+)?(?:def|class|function|interface|enum|type)\b'
+    r'|(?:public|private|protected|static)\b|func\b|fn\b|@\w)'
+)
+
+
+class SourceChunk:
+    """分割したソースの 1 範囲（行番号は 1 始まり、両端を含む）"""
+
+    def __init__(self, number, start_line, end_line, text):
+        self.number = number
+        self.start_line = start_line
+        self.end_line = end_line
+        self.text = text
+
+
+def _chunk_split_point(lines, start, end):
+    """lines[start:end] を分割する位置（次の範囲の先頭行の番号）を返す
+
+    範囲の後半から、トップレベルの定義の直前 -> 空行の直後 の順に探し、見つからなければ end で切る。
+    """
+    lower_bound = start + max(1, (end - start) // 2)
+    for index in range(end - 1, lower_bound - 1, -1):
+        if _CHUNK_BOUNDARY_PATTERN.match(lines[index]):
+            return index
+    for index in range(end - 1, lower_bound - 1, -1):
+        if not lines[index - 1].strip():
+            return index
+    return end
+
+
+def split_source_chunks(text, max_tokens, overlap_lines=20):
+    """ソースを推定トークン数が max_tokens 以下の範囲に分割し、SourceChunk のリストを返す
+
+    各範囲は前の範囲の末尾 overlap_lines 行を含めて始まる。
+    1 行だけで上限を超える行（圧縮済みファイルなど）はその行だけで 1 範囲とする。
+    """
+    lines = text.split('\n')
+    line_tokens = [estimate_tokens(line) + 1 for line in lines]
+    chunks = []
+    start = 0
+    while start < len(lines):
+        end = start
+        tokens = 0
+        while end < len(lines) and (end == start or tokens + line_tokens[end] <= max_tokens):
+            tokens += line_tokens[end]
+            end += 1
+        if end < len(lines):
+            end = _chunk_split_point(lines, start, end)
+        chunks.append(SourceChunk(len(chunks) + 1, start + 1, end, '\n'.join(lines[start:end])))
+        if end >= len(lines):
+            break
+        # 重なり部分を含めても必ず前進させる
+        start = max(start + 1, end - overlap_lines)
+    return chunks
+
+
+def measure_source_tokens(text, count, chunk_tokens, overlap_lines, max_file_tokens):
+    """ソース全体をレビューする場合の (送信する内容のトークン数, リクエスト数) を返す（pre-flight 用）
+
+    分割・スキップの判定はレビュー時と同じく estimate_tokens で行い、分割する場合は split_source_chunks と
+    同じ範囲（重なりの行を含む）ごとに count で数える。max_file_tokens を超えてスキップされる場合は None。
+    """
+    estimated = estimate_tokens(text)
+    if estimated > max_file_tokens:
+        return None
+    if estimated <= chunk_tokens:
+        return count(text), 1
+    chunks = split_source_chunks(text, chunk_tokens, overlap_lines)
+    return sum(count(chunk.text) for chunk in chunks), len(chunks)
+
+
+def build_chunk_prompt(file_path, chunk, chunk_count, total_lines, diff_base=None):
+    """分割したファイル（diff_base がある場合は変更差分）の 1 範囲をレビューするリクエストの本文を返す"""
+    if diff_base:
+        return (
+            f"File: {file_path} (changes since {diff_base}, part {chunk.number}/{chunk_count}, "
+            f"diff lines {chunk.start_line}-{chunk.end_line} of {total_lines})\n"
+            "このファイルの変更差分（unified diff 形式）は大きいため分割してレビューしています。"
+            "追加・変更された行（先頭が + の行）のうち、この範囲に含まれるものについてのみ指摘してください。\n\n"
+            f"```diff\n{chunk.text}\n```"
+        )
+    return (
+        f"File: {file_path} (part {chunk.number}/{chunk_count}, "
+        f"lines {chunk.start_line}-{chunk.end_line} of {total_lines})\n"
+        "このファイルは大きいため分割してレビューしています。前後の範囲は別途レビューされるため、"
+        "この範囲に含まれるコードについてのみ指摘してください。\n\n"
+        f"```\n{chunk.text}\n```"
+    )
+
+
+def oversized_file_review(file_tokens, max_file_tokens):
+    """max_file_tokens を超えてスキップしたファイルのレビュー結果に書き込む本文を返す"""
+    return (
+        "自動レビューをスキップしました。ファイルが大きすぎます"
+        f"（推定 {file_tokens} トークン / 上限 {max_file_tokens} トークン）。\n"
+        "生成物やベンダーファイルの場合はレビュー対象から除外することを検討してください。\n"
+    )
+
+
+def merge_chunk_reviews(file_path, chunks, results):
+    """範囲ごとのレビュー結果 (状態, 本文) を 1 つの Markdown にまとめ、(全体の状態, 本文) を返す
+
+    失敗した範囲があれば失敗、失敗は無いがスキップした範囲（制限時間切れ）があればスキップとする。
+    """
+    failed = [chunk.number for chunk, (status, _body) in zip(chunks, results) if status == REVIEW_FAILED]
+    skipped = [chunk.number for chunk, (status, _body) in zip(chunks, results) if status == REVIEW_SKIPPED]
+    lines = [
+        f"# 分割レビュー: {file_path}",
+        "",
+        f"このファイルは大きいため {len(chunks)} 個の範囲に分割してレビューしました（範囲の境界付近は前後で重複しています）。",
+    ]
+    if failed:
+        lines.append(f"範囲 {', '.join(str(n) for n in failed)} の自動レビューに失敗しました。担当者に確認してください。")
+    if skipped:
+        lines.append(f"範囲 {', '.join(str(n) for n in skipped)} はレビューの制限時間に達したためレビューしていません。")
+    for chunk, (_status, body) in zip(chunks, results):
+        lines.extend(["", f"## 範囲 {chunk.number}/{len(chunks)}（L{chunk.start_line}-L{chunk.end_line}）", "", body.strip()])
+    status = REVIEW_FAILED if failed else REVIEW_SKIPPED if skipped else REVIEW_OK
+    return status, "\n".join(lines) + "\n"
+
+
+SCHEDULE_FIFO = 'fifo'
+SCHEDULE_SJF = 'sjf'
+SCHEDULE_LJF = 'ljf'
+SCHEDULES = (SCHEDULE_FIFO, SCHEDULE_SJF, SCHEDULE_LJF)
+
+
+def _parse_deadline(value):
+    """batch-review 全体の制限時間（秒）。0 以下は制限なし（None）"""
+    deadline = float(str(value).strip())
+    return deadline if deadline > 0 else None
+
+
+def _parse_patterns(value):
+    """カンマ区切り（またはリスト）の glob パターン"""
+    patterns = value.split(',') if isinstance(value, str) else value
+    return [p.strip() for p in patterns if p and p.strip()]
+
+
+def priority_rank(file_path, patterns):
+    """file_path に一致する最初のパターンの番号を返す（小さいほど優先。どれにも一致しなければ len(patterns)）"""
+    path = Path(file_path).as_posix()
+    for rank, pattern in enumerate(patterns):
+        if fnmatch.fnmatchcase(path, pattern) or fnmatch.fnmatchcase(os.path.basename(path), pattern):
+            return rank
+    return len(patterns)
+
+
+def order_review_jobs(jobs, costs, schedule, ranks=None):
+    """リクエスト（ファイル番号のリスト）を投入する順に並べ替えたリストを返す
+
+    costs は各リクエストの推定トークン数、ranks は優先度（priority_rank、小さいほど先）。
+    優先度が同じものは、fifo はファイルリストの順、sjf は推定トークン数の小さい順、
+    ljf は大きい順（ワーカーに大きいものから割り当てて全体の完了時刻を揃える）に並べる。
+    """
+    ranks = ranks or [0] * len(jobs)
+
+    def key(position):
+        if schedule == SCHEDULE_SJF:
+            cost_key = costs[position]
+        elif schedule == SCHEDULE_LJF:
+            cost_key = -costs[position]
+        else:
+            cost_key = 0
+        return ranks[position], cost_key, position
+
+    return [jobs[position] for position in sorted(range(len(jobs)), key=key)]
+
+
+def plan_review_jobs(
+    files, prompt_keys, image_files, excluded, chunk_tokens, pack_token_budget, schedule, priority_patterns,
+):
+    """レビューするファイルをリクエスト（ファイル番号のリスト）に分け、投入する順に並べて (jobs, large_indexes) を返す
+
+    prompt_keys はファイルごとのプロンプトの組、excluded はリクエストを送らないファイル。
+    推定トークン数が chunk_tokens を超えるファイルは分割・スキップの可能性があるため 1 ファイルずつ扱い、
+    その番号を large_indexes として返す。画像は常に 1 ファイル 1 リクエスト。
+    pack_token_budget があれば残りの小さなファイルをまとめる（plan_review_packs を参照）。
+    並べ替えは order_review_jobs（schedule・priority_patterns）に従う。
+    """
+    # サイズから分割・スキップの可能性があるファイルは個別に扱う（画像は常に 1 ファイル 1 リクエスト）
+    image_indexes = [i for i, f in enumerate(files) if f in image_files and f not in excluded]
+    file_tokens = [IMAGE_TOKEN_ESTIMATE if f in image_files else estimate_file_tokens(f) for f in files]
+    large_indexes = {
+        i for i, f in enumerate(files)
+        if f not in image_files and f not in excluded and file_tokens[i] > chunk_tokens
+    }
+    normal_indexes = [
+        i for i, f in enumerate(files)
+        if i not in large_indexes and f not in image_files and f not in excluded
+    ]
+    if pack_token_budget:
+        single_indexes, packs = plan_review_packs(
+            [(files[i], prompt_keys[i]) for i in normal_indexes], pack_token_budget,
+        )
+        single_indexes = [normal_indexes[i] for i in single_indexes]
+        packs = [[normal_indexes[i] for i in pack] for pack in packs]
+        log.info(f"Packing {sum(len(p) for p in packs)} small file(s) into {len(packs)} request(s)")
+    else:
+        single_indexes, packs = normal_indexes, []
+    single_indexes = list(single_indexes) + image_indexes
+    jobs = sorted([[i] for i in single_indexes] + [[i] for i in large_indexes] + packs)
+    # スレッドプールは投入した順に実行するため、並べ替えた順がそのまま実行順になる
+    jobs = order_review_jobs(
+        jobs,
+        [sum(file_tokens[i] for i in indexes) for indexes in jobs],
+        schedule,
+        [min(priority_rank(files[i], priority_patterns) for i in indexes) for indexes in jobs],
+    )
+    if schedule != SCHEDULE_FIFO or priority_patterns:
+        log.info(f"Scheduling {len(jobs)} request(s) by {schedule} (priority patterns: {len(priority_patterns)})")
+    return jobs, large_indexes
+
+
+DIFF_CONTEXT_LINES = 10
+
+
+def verify_git_revision(revision):
+    """revision がコミットとして解決できるか確認する（git が無い・履歴に無い場合は False）"""
+    try:
+        result = subprocess.run(
+            ['git', 'rev-parse', '--verify', '--quiet', f"{revision}^{{commit}}"],
+            capture_output=True, text=True,
+        )
+    except OSError:
+        return False
+    return result.returncode == 0
+
+
+def git_diff_for_file(file_path, diff_base, context_lines=DIFF_CONTEXT_LINES):
+    """diff_base から作業ツリーまでの file_path の変更ハンク（@@ 行以降の unified diff）を返す
+
+    差分が無い・git 管理外・diff_base 以降に追加されたファイル・バイナリ・git の実行失敗の場合は
+    None を返す（呼び出し側はファイル全体をレビューする）。
+    """
+    try:
+        result = subprocess.run(
+            ['git', 'diff', '--no-color', '--no-ext-diff', f"--unified={context_lines}", diff_base, '--', file_path],
+            capture_output=True, text=True, encoding='utf-8', errors='replace',
+        )
+    except OSError as e:
+        log.warning(f"git diff failed for {file_path}: {e}")
+        return None
+    if result.returncode != 0:
+        log.warning(f"git diff failed for {file_path}: {result.stderr.strip()}")
+        return None
+
+    header, separator, hunks = result.stdout.partition('\n@@')
+    if not separator:
+        # 変更なし（または git 管理外）・バイナリ差分
+        return None
+    if '\nnew file mode' in f"\n{header}" or '\n--- /dev/null' in f"\n{header}":
+        # 新規ファイルは差分にしても全行が追加行になるだけなので全体をレビューする
+        return None
+    return '@@' + hunks.rstrip('\n')
+
+
+def build_review_prompt(file_path, file_content, diff_text=None, diff_base=None):
+    """1ファイル分のレビュー対象部分のプロンプトを組み立てる（diff_text があれば変更ハンクのみ）"""
+    if diff_text is None:
+        return f"File: {file_path}\n\n```\n{file_content}\n```"
+    return (
+        f"File: {file_path} (changes since {diff_base})\n"
+        "以下はこのファイルの変更箇所の差分（unified diff 形式、前後のコンテキスト行付き）です。"
+        "追加・変更された行（先頭が + の行）を中心にレビューし、"
+        "指摘箇所は @@ 行から求めた変更後のファイルの行番号で示してください。\n\n"
+        f"```diff\n{diff_text}\n```"
+    )
+
+
+# target-extensions.csv の 4 列目（review_mode）で指定するレビュー方式
+REVIEW_MODE_TEXT = 'text'
+REVIEW_MODE_IMAGE = 'image'
+REVIEW_MODES = (REVIEW_MODE_TEXT, REVIEW_MODE_IMAGE)
+IMAGE_MIME_TYPES = {
+    '.png': 'image/png',
+    '.jpg': 'image/jpeg',
+    '.jpeg': 'image/jpeg',
+    '.webp': 'image/webp',
+    '.gif': 'image/gif',
+    '.heic': 'image/heic',
+    '.heif': 'image/heif',
+}
+# これより大きい画像はインラインで送らず File API でアップロードする（リクエスト全体の上限は 20MB）
+INLINE_IMAGE_MAX_BYTES = 15 * 1024 * 1024
+# 画像 1 枚あたりの入力トークン数の目安（レート制限の見積もり用）
+IMAGE_TOKEN_ESTIMATE = 258
+
+
+def load_review_modes(csv_path):
+    """拡張子からレビュー方式（target-extensions.csv の 4 列目 review_mode）への対応表を読み込む
+
+    review_mode が空または text の拡張子は含めない（テキストとしてレビューする）。
+    """
+    modes = {}
+    if not csv_path or not os.path.exists(csv_path):
+        return modes
+    with open(csv_path, 'r', encoding='utf-8') as f:
+        for row in csv.reader(f):
+            if len(row) < 4:
+                continue
+            ext = row[0].strip().lower()
+            mode = row[3].strip().lower()
+            if not ext or not mode or mode == 'review_mode' or mode == REVIEW_MODE_TEXT:
+                continue
+            if mode not in REVIEW_MODES:
+                log.warning(f"Unknown review mode ignored for {ext}: {mode}")
+                continue
+            modes[ext] = mode
+    return modes
+
+
+def review_mode_for_file(file_path, review_modes):
+    """ファイルの拡張子に対応するレビュー方式を返す（対応表に無ければ text）"""
+    for ext in _extension_candidates(file_path):
+        if ext in review_modes:
+            return review_modes[ext]
+    return REVIEW_MODE_TEXT
+
+
+def image_mime_type(file_path):
+    """画像の MIME タイプを拡張子から求める"""
+    suffix = Path(file_path).suffix.lower()
+    return IMAGE_MIME_TYPES.get(suffix) or mimetypes.guess_type(file_path)[0] or 'application/octet-stream'
+
+
+def build_image_review_prompt(file_path):
+    """画像 1 枚分のレビュー対象部分のプロンプトを組み立てる（画像本体は別のパーツとして添付する）"""
+    return (
+        f"File: {file_path} (image)\n"
+        "このファイルは画像です。添付した画像に含まれる文字・図表・画面の内容を読み取り、"
+        "レビュープロンプトの観点でレビューしてください。読み取れない箇所はその旨を明記してください。"
+    )
+
+
+def image_content_part(file_path, image_bytes, uploaded_files):
+    """画像を generate_content の contents に添付するパーツを返す
+
+    INLINE_IMAGE_MAX_BYTES 以下はインラインで送り、それより大きい画像は File API でアップロードして
+    ACTIVE になるのを待つ。アップロードしたファイルは uploaded_files に追加する（終了時に削除する）。
+    """
+    mime_type = image_mime_type(file_path)
+    if len(image_bytes) <= INLINE_IMAGE_MAX_BYTES:
+        return {'mime_type': mime_type, 'data': image_bytes}
+    log.info(f"Uploading large image {file_path} ({len(image_bytes)} bytes)")
+    uploaded = genai.upload_file(file_path, mime_type=mime_type)
+    uploaded_files.append(uploaded)
+    active, failed = poll_files_active([uploaded.name])
+    if uploaded.name in failed:
+        raise RuntimeError(f"Image upload for {file_path} did not become ACTIVE: {failed[uploaded.name]}")
+    return active[uploaded.name]
+
+
+def delete_uploaded_files(uploaded_files):
+    """image_content_part でアップロードしたファイルを削除する（失敗しても 48 時間で失効するため警告のみ）"""
+    for uploaded in uploaded_files:
+        try:
+            genai.delete_file(uploaded.name)
+        except Exception as e:
+            log.warning(f"Failed to delete uploaded image {uploaded.name}: {e}")
+
+
+def create_context_cached_model(model_name, prompt_parts, prompt_tokens, created_caches):
+    """プロンプトパーツをサーバー側のコンテキストキャッシュに載せ、それを参照するモデルを返す
+
+    推定トークン数がキャッシュの最小サイズ（GEMINI_CONTEXT_CACHE_MIN_TOKENS、既定 1024）に満たない場合や、
+    作成に失敗した場合は None を返す（呼び出し側は通常どおりプロンプトを毎回送信する）。
+    作成したキャッシュは created_caches に追加する（delete_context_caches で削除する）。
+    """
+    min_tokens = env_number('GEMINI_CONTEXT_CACHE_MIN_TOKENS', 1024, int)
+    if prompt_tokens < min_tokens:
+        log.info(f"Prompt set too small for context cache (~{prompt_tokens} < {min_tokens} tokens); sending prompts inline")
+        return None
+    caching = getattr(genai, 'caching', None)
+    if caching is None:
+        log.warning("Context caching is not supported by this google-generativeai version")
+        return None
+    ttl_seconds = env_number('GEMINI_CONTEXT_CACHE_TTL', 3600, int)
+    try:
+        cached_content = caching.CachedContent.create(
+            model=model_name if model_name.startswith('models/') else f"models/{model_name}",
+            contents=list(prompt_parts),
+            ttl=timedelta(seconds=ttl_seconds),
+        )
+        created_caches.append(cached_content)
+        log.info(f"Created context cache {getattr(cached_content, 'name', '')} for {len(prompt_parts)} prompt part(s)")
+        return genai.GenerativeModel.from_cached_content(cached_content=cached_content)
+    except Exception as e:
+        log.warning(f"Failed to create context cache; sending prompts inline: {e}")
+        return None
+
+
+def delete_context_caches(created_caches):
+    """作成したコンテキストキャッシュを削除する（失敗しても TTL で失効するため警告のみ）"""
+    for cached_content in created_caches:
+        try:
+            cached_content.delete()
+        except Exception as e:
+            log.warning(f"Failed to delete context cache {getattr(cached_content, 'name', '')}: {e}")
+
+
+def _stream_chunk_text(chunk):
+    """ストリーミングの断片から本文を取り出す（本文を持たない断片は空文字列）"""
+    try:
+        return chunk.text or ''
+    except ValueError:
+        # 安全性フィルタなどで候補が無い断片は text の参照で ValueError になる
+        return ''
+
+
+def _read_partial_output(part_path):
+    """途中まで受信した一時ファイルの内容を読み出して削除する。無ければ空文字列"""
+    try:
+        with open(part_path, 'r', encoding='utf-8') as f:
+            partial = f.read()
+        os.remove(part_path)
+        return partial
+    except OSError:
+        return ''
+
+
+def usage_counts(response):
+    """レスポンスの usage_metadata から (入力トークン数, うちキャッシュ分, 出力トークン数) を返す"""
+    usage = getattr(response, 'usage_metadata', None)
+    return (
+        getattr(usage, 'prompt_token_count', 0) or 0,
+        getattr(usage, 'cached_content_token_count', 0) or 0,
+        getattr(usage, 'candidates_token_count', 0) or 0,
+    )
+
+
+def _split_evenly(total, count):
+    """total を count 個に（端数は先頭から 1 ずつ）分けたリストを返す"""
+    share, remainder = divmod(total, count)
+    return [share + (1 if i < remainder else 0) for i in range(count)]
+
+
+class TokenUsage:
+    """レスポンスの usage_metadata からトークン数を集計する（スレッドセーフ）"""
+
+    def __init__(self):
+        self.requests = 0
+        self.prompt_tokens = 0
+        self.cached_tokens = 0
+        self.output_tokens = 0
+        self._lock = threading.Lock()
+
+    def add(self, response):
+        prompt_tokens, cached_tokens, output_tokens = usage_counts(response)
+        with self._lock:
+            self.requests += 1
+            self.prompt_tokens += prompt_tokens
+            self.cached_tokens += cached_tokens
+            self.output_tokens += output_tokens
+
+    def summary_line(self):
+        uncached = self.prompt_tokens - self.cached_tokens
+        return (
+            f"Token usage: requests={self.requests} input={self.prompt_tokens} "
+            f"cached={self.cached_tokens} uncached={uncached} output={self.output_tokens}"
+        )
+
+
+def _content_part_name(part):
+    """ログ用に contents の要素（アップロード済みファイルなど）の名前を返す"""
+    if isinstance(part, dict):
+        return f"inline:{part.get('mime_type')}:{len(part.get('data') or b'')}B"
+    return getattr(part, 'display_name', None) or getattr(part, 'name', None) or type(part).__name__
+
+
+def log_request(label, model_name, request_model, contents):
+    """generate_content に渡す内容をログに出す
+
+    info レベルでは本文のサイズ・ハッシュと添付プロンプト名のみを出し、
+    本文とモデルオブジェクトの repr は debug レベルでのみ出力する。
+    """
+    text = contents[0] if contents and isinstance(contents[0], str) else ''
+    chars, size, digest = text_digest(text)
+    prompts = [_content_part_name(part) for part in contents[1:]]
+    log.info(
+        f"Sending request for {label}",
+        model=model_name,
+        chars=chars,
+        bytes=size,
+        sha256=digest,
+        prompts=','.join(prompts) or '-',
+        context_cache=getattr(request_model, 'cached_content', None) is not None,
+    )
+    if log.enabled(log.DEBUG):
+        log.debug(f"モデルオブジェクト repr: {repr(request_model)}")
+        log.debug("generate_content に渡す contents:\n" + "\n".join(str(part) for part in contents))
+
+
 def run_review(prompt, file_path=None, model_name=None, prompt_file_ids=None):
     # 呼び出し側でモデルの明示がない場合
     # モデル名を解決（明示 -> 環境変数 -> デフォルト）
@@ -198,16 +1060,16 @@ def run_review(prompt, file_path=None, model_name=None, prompt_file_ids=None):
     # レビュー対象のファイルがある場合、読み取り
     if file_path:
         if not os.path.exists(file_path):
-            print(f"Error: File does not exist: {file_path}", file=sys.stderr)
-            print(f"Current working directory: {os.getcwd()}", file=sys.stderr)
+            log.error(f"File does not exist: {file_path}")
+            log.error(f"Current working directory: {os.getcwd()}")
             sys.exit(1)
         else:
             try:
                 with open(file_path, 'r', encoding='utf-8') as f:
                     file_content = f.read()
-                print(f"Successfully read file: {file_path} ({len(file_content)} bytes)", file=sys.stderr)
+                log.info(f"Successfully read file: {file_path} ({len(file_content)} bytes)")
             except Exception as e:
-                print(f"Error reading file {file_path}: {e}", file=sys.stderr)
+                log.error(f"Reading file {file_path} failed: {e}")
     if file_path:
         full_prompt = f"{prompt}\n\nFile: {file_path}\n\n```\n{file_content}\n```"
     else:
@@ -216,14 +1078,432 @@ def run_review(prompt, file_path=None, model_name=None, prompt_file_ids=None):
     # prompt_file_idsが指定されている場合（リストまたは単一の文字列）
     contents = [full_prompt]
     contents.extend(build_prompt_file_parts(prompt_file_ids))
-    # Print model info and the contents passed to the Gemini SDK so we can
-    # verify exactly what is being sent.
-    print(f"モデル名（変数）: {model_name}", file=sys.stderr)
-    print(f"モデルオブジェクト repr: {repr(model)}", file=sys.stderr)
-    print("generate_content に渡す contents:", contents, file=sys.stderr)
+    log_request(file_path or 'prompt', model_name, model, contents)
     response = model.generate_content(contents)
     print(response.text)
 
+
+class PendingReview:
+    """投入したレビュー 1 ファイル分の結果 (状態, 本文)
+
+    futures は結果が揃うまでに完了を待つ Future。呼び出すと futures の完了を待ち、collect() で組み立てた結果を返す。
+    """
+
+    def __init__(self, collect, futures=()):
+        self._collect = collect
+        self.futures = list(futures)
+
+    @classmethod
+    def finished(cls, status, body):
+        """リクエストを送らずに決まった結果（キャッシュヒット・スキップ・読み込み失敗など）"""
+        return cls(lambda: (status, body))
+
+    @classmethod
+    def of_future(cls, future, position=None):
+        """future の結果（position があれば、まとめレビューの結果のリストのうちその位置）"""
+        if position is None:
+            return cls(future.result, [future])
+        return cls(lambda: future.result()[position], [future])
+
+    def done(self):
+        return all(future.done() for future in self.futures)
+
+    def __call__(self):
+        return self._collect()
+
+
+def write_completed_results(pending, write_result, block=True):
+    """投入したレビューを完了した順に write_result(index, status, body) で書き込み、pending から取り除く
+
+    pending はファイル番号 -> PendingReview。同時に完了していたものはファイル番号の順に書き込む。
+    block が False の場合は完了済みのものだけを書き込んで戻る（次のファイルが届くのを待つ間など）。
+    """
+    while pending:
+        for index in sorted(i for i, result in pending.items() if result.done()):
+            write_result(index, *pending.pop(index)())
+        if not block or not pending:
+            return
+        wait(
+            {future for result in pending.values() for future in result.futures if not future.done()},
+            return_when=FIRST_COMPLETED,
+        )
+
+
+def sweep_failed_files(failed_indexes, submit, write_result, deadline_passed, file_retries, concurrency, deadline=None):
+    """失敗したファイルを、並列数を半分ずつ下げながら最大 file_retries 回まで再レビューする
+
+    リトライ上限に達した 429/503 などで失敗したファイルを、他のリクエストと競合しない状態で再送するため。
+    failed_indexes() は各回の開始時に再レビューするファイル番号のリストを返す（致命的なエラーの失敗は含めない）。
+    submit(executor, index) は PendingReview を返し、結果は完了した順に write_result(index, status, body) で書き込む。
+    制限時間（deadline_passed()）を過ぎている場合は再レビューせず、失敗のまま残す。
+    """
+    def write_sweep_result(index, status, body):
+        # 再レビュー中に制限時間に達した場合も、前回の失敗を結果として残す
+        if status != REVIEW_SKIPPED:
+            write_result(index, status, body)
+
+    for sweep_round in range(1, file_retries + 1):
+        indexes = failed_indexes()
+        if not indexes:
+            return
+        if deadline_passed():
+            log.warning(f"Not retrying {len(indexes)} failed file(s): review deadline of {deadline:g}s reached")
+            return
+        sweep_concurrency = max(1, concurrency >> sweep_round)
+        log.progress(
+            f"🔁 Retrying {len(indexes)} failed file(s) "
+            f"(round {sweep_round}/{file_retries}, concurrency {sweep_concurrency})"
+        )
+        with ThreadPoolExecutor(max_workers=sweep_concurrency) as sweep_executor:
+            results = {index: submit(sweep_executor, index) for index in indexes}
+            write_completed_results(results, write_sweep_result)
+
+
+def review_output_relative_path(file_path):
+    """レビュー対象のパスから、出力ディレクトリ内でのレビュー Markdown の相対パスを返す
+
+    ファイルのディレクトリ構成（カレントディレクトリからの相対パス）を保ち、ファイル名に .md を付ける
+    （index.ts -> index.ts.md。拡張子違いの同名ファイルも別の Markdown になる）。
+    カレントディレクトリの外のファイルの配置は source_relative_path を参照。
+    どちらもファイル自身のパスだけで決まり、実行環境の絶対パスや他のファイルには依存しない。
+    """
+    relative = source_relative_path(file_path)
+    return relative.with_name(f"{relative.name}.md")
+
+
+class ReviewOutputLayout:
+    """1 つの出力ディレクトリ内のレビュー Markdown の配置を決める（スレッドセーフ）
+
+    通常は review_output_relative_path のとおり。大文字小文字だけが異なるパス（Readme.txt と README.txt）は
+    大文字小文字を区別しないファイルシステムで同じ Markdown になるため、後のファイルの名前に
+    相対パスのハッシュを付ける。それでも重なる場合はハッシュを伸ばし、上書きはしない。
+    """
+
+    def __init__(self, output_dir):
+        self.output_dir = Path(output_dir)
+        self._claimed = {}
+        self._lock = threading.Lock()
+
+    def path_for(self, file_path):
+        """file_path のレビュー Markdown のパスを返す（同じ file_path には常に同じパス）"""
+        relative = review_output_relative_path(file_path)
+        source = relative.as_posix()
+        source_hash = sha256_bytes(source.encode('utf-8'))
+        candidates = [relative] + [
+            relative.with_name(f"{relative.stem}-{source_hash[:length]}.md") for length in (8, 16, 64)
+        ]
+        with self._lock:
+            for candidate in candidates:
+                key = candidate.as_posix().lower()
+                if self._claimed.get(key, source) == source:
+                    self._claimed[key] = source
+                    break
+            else:
+                raise RuntimeError(f"No unique review output path for {file_path} in {self.output_dir}")
+        output_path = self.output_dir / candidate
+        output_path.parent.mkdir(parents=True, exist_ok=True)
+        return str(output_path)
+
+
+class ReviewPreflight:
+    """送信前の見積もり（pre-flight）: ファイルを読んでトークン数を数え、予算（PreflightBudget）と照合する
+
+    読み込んだ内容は preloaded（PreloadCache）に保持し、レビュー時に take で取り出す。
+    見積もりと予算超過の理由は metrics（ReviewMetrics）に記録する。
+    image_files は画像としてレビューするファイルの集合（file_source の場合は呼び出し側が追加する）。
+    """
+
+    def __init__(self, budget, metrics, preloaded, image_files, chunk_tokens, overlap_lines, max_file_tokens):
+        self.budget = budget
+        self.metrics = metrics
+        self.preloaded = preloaded
+        self.image_files = image_files
+        self.chunk_tokens = chunk_tokens
+        self.overlap_lines = overlap_lines
+        self.max_file_tokens = max_file_tokens
+
+    def measure(self, file_path):
+        """(送信する内容のトークン数, リクエスト数) を返す。max_file_tokens を超えてスキップされるファイルは None
+
+        ワーカースレッドから並列に呼び出してよい。
+        """
+        if file_path in self.image_files:
+            return IMAGE_TOKEN_ESTIMATE, 1
+        if min_file_tokens(file_path) > self.max_file_tokens:
+            # 確実に上限を超える大きさのファイルは読まない（レビュー時にスキップされる）
+            return None
+        try:
+            with open(file_path, 'rb') as f:
+                file_bytes = f.read()
+            text = file_bytes.decode('utf-8')
+        except (OSError, UnicodeDecodeError):
+            return estimate_file_tokens(file_path), 1
+        self.preloaded.put(file_path, file_bytes)
+        return measure_source_tokens(
+            text, self.budget.counter.count, self.chunk_tokens, self.overlap_lines, self.max_file_tokens,
+        )
+
+    def admit(self, file_path, prompt_paths, measured):
+        """1 ファイル分の入出力トークン数・費用を見積もり、予算と照合する（PreflightBudget.admit を参照）
+
+        measured は measure の結果。予算の積み上げは呼び出した順に行う（メインスレッドから呼び出す）。
+        """
+        if measured is None:
+            # max_file_tokens によるスキップ（レビュー時に判定する）になるため合計に加えない
+            self.preloaded.pop(file_path)
+            return
+        content_tokens, request_count = measured
+        input_tokens, output_tokens, cost, reason = self.budget.admit(
+            file_path, content_tokens, prompt_paths, request_count,
+        )
+        self.metrics.set(file_path, 'projected_input_tokens', input_tokens)
+        self.metrics.set(file_path, 'projected_output_tokens', output_tokens)
+        self.metrics.set(file_path, 'projected_cost_usd', cost)
+        if reason:
+            self.metrics.set(file_path, 'skip_reason', reason)
+            self.preloaded.pop(file_path)
+
+    def run(self, file_paths, prompt_paths, concurrency, schedule, priority_patterns):
+        """file_paths（prompt_paths はファイルごとのプロンプト）をまとめて見積もる
+
+        ファイルの読み込みと count_tokens は並列に行い、予算は schedule の順（実際にリクエストを送る順）に積み上げる。
+        """
+        order = order_review_jobs(
+            [[i] for i in range(len(file_paths))],
+            [IMAGE_TOKEN_ESTIMATE if f in self.image_files else estimate_file_tokens(f) for f in file_paths],
+            schedule,
+            [priority_rank(f, priority_patterns) for f in file_paths],
+        )
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            measured = list(executor.map(self.measure, [file_paths[i] for (i,) in order]))
+        for (i,), measured_file in zip(order, measured):
+            self.admit(file_paths[i], prompt_paths[i], measured_file)
+
+    def take(self, file_path):
+        """measure で読み込んだ内容を取り出す（保持していなければ None）"""
+        return self.preloaded.pop(file_path)
+
+
+class ReviewResults:
+    """1 回の batch-review の結果を書き込み、状態を計測値とジャーナルに記録する（書き込みはメインスレッドで行う）
+
+    files はファイル番号 -> ファイルパスのリスト（file_source の場合は届くたびに呼び出し側が追加する）。
+    journaled は再開時に参照するジャーナルの記録（ReviewJournal.latest、再開しない場合は空）。
+    """
+
+    def __init__(self, output_dir, layout, journal, metrics, files, journaled=None):
+        self.output_dir = output_dir
+        self.layout = layout
+        self.journal = journal
+        self.metrics = metrics
+        self.files = files
+        self.journaled = journaled or {}
+        # ファイル番号 -> 書き込んだ結果の状態
+        self.statuses = {}
+        # ジャーナルでレビュー済みのため、リクエストを送らないファイル
+        self.resumed_files = set()
+        # ファイルパス -> 最後の失敗が一時的なエラー（429/503/タイムアウトなど）だったか（ワーカースレッドから記録する）
+        self.transient_failures = {}
+
+    def review_path(self, index):
+        return self.layout.path_for(self.files[index])
+
+    def relative_path(self, review_file_path):
+        """レビュー Markdown の出力ディレクトリからの相対パス（ジャーナル・review_index.json 用）"""
+        return Path(os.path.relpath(review_file_path, self.output_dir)).as_posix()
+
+    def already_reviewed(self, file_path):
+        """ジャーナルに ok と記録され、内容と出力先が記録時のままのファイルか（--resume 用）"""
+        entry = self.journaled.get(file_path)
+        if not entry or entry.get('status') != REVIEW_OK:
+            return False
+        review_file_path = self.layout.path_for(file_path)
+        if entry.get('review') != self.relative_path(review_file_path) or not os.path.exists(review_file_path):
+            return False
+        return entry.get('sha256') is not None and entry['sha256'] == _file_sha256(file_path)
+
+    def record_journal(self, entries):
+        try:
+            self.journal.record_many(entries)
+        except OSError as e:
+            # ジャーナルはレビュー結果に影響しないため警告のみ（再開時に再実行される）
+            log.warning(f"Failed to write review journal: {e}")
+
+    def mark_pending(self, file_paths):
+        """これからレビューするファイルをジャーナルに pending として記録する"""
+        self.record_journal([{'file': f, 'status': JOURNAL_PENDING, 'sha256': None, 'review': None} for f in file_paths])
+
+    def write(self, index, status, body):
+        """レビュー結果を書き込み、状態を計測値とジャーナルに記録する"""
+        file_path = self.files[index]
+        review_file_path = self.review_path(index)
+        # 本文が None の場合はストリーミング（または前回の実行）で書き込み済み
+        if body is not None:
+            with self.metrics.timed(file_path, 'write_seconds'):
+                with open(review_file_path, 'w', encoding='utf-8') as out:
+                    out.write(body)
+        self.metrics.set(file_path, 'status', status)
+        self.metrics.set(file_path, 'output', review_file_path)
+        if file_path in self.resumed_files:
+            self.metrics.set(file_path, 'resumed', True)
+        else:
+            self.record_journal([{
+                'file': file_path,
+                'status': status,
+                'sha256': _file_sha256(file_path),
+                'review': self.relative_path(review_file_path),
+            }])
+        self.statuses[index] = status
+
+    def failed_indexes(self):
+        """一時的なエラーで失敗し、ファイルがまだ存在するファイルの番号（再レビューの対象）"""
+        return [
+            i for i in sorted(self.statuses)
+            if self.statuses[i] == REVIEW_FAILED and self.transient_failures.get(self.files[i])
+            and os.path.exists(self.files[i])
+        ]
+
+    def count(self, status):
+        return list(self.statuses.values()).count(status)
+
+
+def _file_sha256(file_path):
+    try:
+        return sha256_file(file_path)
+    except OSError:
+        return None
+
+
+# BatchReviewOptions の項目 -> (環境変数, 値の解釈, 既定値)。None の項目は batch_review_files 内の open_* 関数が決める
+_BATCH_OPTION_SOURCES = {
+    'concurrency': ('GEMINI_CONCURRENCY', parse_positive_int, 1),
+    'max_retries': ('GEMINI_MAX_RETRIES', parse_count, 4),
+    'lazy_prompts': ('GEMINI_LAZY_PROMPTS', parse_flag, False),
+    'pack_token_budget': ('GEMINI_PACK_TOKEN_BUDGET', parse_count, 0),
+    'context_cache': ('GEMINI_CONTEXT_CACHE', parse_flag, False),
+    'chunk_tokens': ('GEMINI_CHUNK_TOKENS', int, 100000),
+    'max_file_tokens': ('GEMINI_MAX_FILE_TOKENS', int, 500000),
+    'diff_base': ('GEMINI_DIFF_BASE', str, None),
+    'diff_context': ('GEMINI_DIFF_CONTEXT', parse_count, DIFF_CONTEXT_LINES),
+    'stream': ('GEMINI_STREAM', parse_flag, False),
+    'deadline': ('GEMINI_DEADLINE', _parse_deadline, None),
+    'priority_patterns': ('GEMINI_PRIORITY_PATTERNS', _parse_patterns, []),
+    'resume': ('GEMINI_RESUME', parse_flag, False),
+    'file_retries': ('GEMINI_FILE_RETRIES', parse_count, 1),
+    'failure_threshold': ('GEMINI_FAILURE_THRESHOLD', parse_ratio, 0.0),
+    'file_token_budget': ('GEMINI_FILE_TOKEN_BUDGET', parse_count, 0),
+    'run_token_budget': ('GEMINI_RUN_TOKEN_BUDGET', parse_count, 0),
+    'run_cost_budget': ('GEMINI_RUN_COST_BUDGET', parse_amount, 0.0),
+}
+
+
+@dataclass
+class BatchReviewOptions:
+    """batch_review_files の動作を調整するオプション（None は未指定）
+
+    各項目の意味は batch_review_files を参照。resolved() で未指定の項目を環境変数・既定値で補う。
+    result_cache_dir（False でキャッシュ無効）・rpm / tpm・token_counter は
+    open_result_cache / open_rate_limiter / open_token_counter が決める。
+    """
+
+    concurrency: int = None
+    result_cache_dir: str = None
+    rpm: float = None
+    tpm: float = None
+    max_retries: int = None
+    lazy_prompts: bool = None
+    pack_token_budget: int = None
+    context_cache: bool = None
+    chunk_tokens: int = None
+    max_file_tokens: int = None
+    diff_base: str = None
+    diff_context: int = None
+    stream: bool = None
+    schedule: str = None
+    deadline: float = None
+    priority_patterns: list = None
+    resume: bool = None
+    file_retries: int = None
+    failure_threshold: float = None
+    token_counter: str = None
+    file_token_budget: int = None
+    run_token_budget: int = None
+    run_cost_budget: float = None
+
+    def resolved(self):
+        """明示値 -> 環境変数 -> 既定値の順で決定したオプションを返す"""
+        values = {
+            name: resolve_option(getattr(self, name), env_name, parse, default, name)
+            for name, (env_name, parse, default) in _BATCH_OPTION_SOURCES.items()
+        }
+        # 制限時間内にできるだけ多くのファイルをレビューするため、既定では小さいものから投入する
+        values['schedule'] = resolve_option(
+            self.schedule, 'GEMINI_SCHEDULE', choice_parser(SCHEDULES), SCHEDULE_SJF if values['deadline'] else SCHEDULE_FIFO,
+            'schedule',
+        )
+        values['max_file_tokens'] = max(values['max_file_tokens'], values['chunk_tokens'])
+        return replace(self, **values)
+
+
+class ReviewSession:
+    """1 プロセス内の複数回の batch_review_files で共有する状態（スレッドセーフ）
+
+    genai の設定・アップロード済みプロンプトの対応表とパーツ・プロンプトの指紋・レート制限・
+    同時に送信するリクエスト数の上限を共有し、ファイルリストごとに初期化やプロンプトのアップロードを
+    やり直さないようにする。並列に実行したバッチ同士でも、送信中のリクエストは合わせて concurrency 件までになる。
+    """
+
+    def __init__(self):
+        self.prompt_parts_cache = {}
+        self.uploaded_prompt_ids = {}
+        self.attempted_prompt_paths = set()
+        self.prompt_infos = {}
+        self._output_layouts = {}
+        self._configured = False
+        self._rate_limiter = None
+        self._rate_limiter_opened = False
+        self._request_slots = None
+        self._lock = threading.RLock()
+
+    def setup(self):
+        """genai を設定する（2 回目以降は何もしない）"""
+        with self._lock:
+            if not self._configured:
+                setup_genai()
+                self._configured = True
+
+    def ensure_prompts_uploaded(self, prompt_paths):
+        """未アップロードのプロンプトだけをアップロードする（見つからないファイルは再試行しない）"""
+        with self._lock:
+            missing = [p for p in prompt_paths if p not in self.attempted_prompt_paths]
+            if missing:
+                self.attempted_prompt_paths.update(missing)
+                self.uploaded_prompt_ids.update(upload_prompt_files(missing, self.prompt_parts_cache))
+
+    def output_layout(self, output_dir):
+        """出力ディレクトリごとのレビュー Markdown の配置を返す（同じディレクトリに書く並列のバッチで共有する）"""
+        with self._lock:
+            key = os.path.abspath(output_dir)
+            if key not in self._output_layouts:
+                self._output_layouts[key] = ReviewOutputLayout(output_dir)
+            return self._output_layouts[key]
+
+    def rate_limiter(self, rpm=None, tpm=None):
+        """共有のレート制限を返す（最初の呼び出しの rpm / tpm で作成する）"""
+        with self._lock:
+            if not self._rate_limiter_opened:
+                self._rate_limiter = open_rate_limiter(rpm, tpm)
+                self._rate_limiter_opened = True
+            return self._rate_limiter
+
+    def request_slots(self, concurrency):
+        """送信中のリクエスト数を制限する共有のセマフォを返す（最初の呼び出しの concurrency で作成する）"""
+        with self._lock:
+            if self._request_slots is None:
+                self._request_slots = threading.BoundedSemaphore(concurrency)
+            return self._request_slots
+
+
 def batch_review_files(
     file_list_path,
     output_dir,
@@ -231,151 +1511,815 @@ def batch_review_files(
     default_custom_prompt_path=None,
     prompt_map_path=None,
     model_name=None,
+    *,
+    options=None,
+    session=None,
+    file_source=None,
+    **option_values,
 ):
-    """複数ファイルを一括レビュー（genaiの初期化は1回のみ）"""
-    setup_genai()
-    print("✅ Gemini APIのセットアップ完了", file=sys.stderr)
+    """複数ファイルを一括レビュー（genaiの初期化は1回のみ）
+
+    以下のオプションは options（BatchReviewOptions）か、同じ名前のキーワード引数で渡す（キーワード引数が優先）。
+    concurrency に 2 以上を指定すると generate_content をスレッドプールで並列に呼び出す。
+    レビュー結果はレビューが完了した順に書き込み、そのたびにジャーナルに記録する。
+    ファイル内容・使用するプロンプトの内容・モデル名が前回と同一であれば、
+    レビュー結果キャッシュ（open_result_cache を参照）の Markdown をそのまま書き出す。
+    generate_content は共有レート制限（open_rate_limiter を参照）の範囲で送信し、
+    429/503 などのリトライ可能なエラーは max_retries 回までバックオフして再試行する。
+    プロンプトはファイルリストから必要なものだけをアップロードする。
+    lazy_prompts を有効にすると、各プロンプトを最初に必要になった時点でアップロードする。
+    pack_token_budget を指定すると、同じプロンプトを使う小さなファイルを
+    推定トークン数の合計がその範囲に収まるようまとめて 1 リクエストでレビューする（plan_review_packs を参照）。
+    context_cache を有効にすると、複数リクエストで共有するプロンプトの組を
+    Gemini のコンテキストキャッシュに載せて参照する（create_context_cached_model を参照）。
+    推定トークン数が chunk_tokens を超えるファイルは関数・行の境界で重なりを持たせて分割し、
+    範囲ごとのレビューを 1 つの Markdown にまとめる。max_file_tokens を超えるファイルはスキップする。
+    diff_base を指定すると、各ファイルの diff_base からの変更ハンク（前後 diff_context 行付き）のみを送信する。
+    差分が取れないファイル（新規・git 管理外など）はファイル全体をレビューする（git_diff_for_file を参照）。
+    prompt_map_path の CSV で review_mode が image の拡張子のファイルは、テキストとして読まずに
+    画像をリクエストに添付してレビューする（image_content_part を参照）。まとめ・分割・差分レビューの対象外。
+    stream を有効にすると、1 ファイル 1 リクエストのレビューはレスポンスを受信しながら
+    `<出力ファイル>.part` に追記し、完了時に出力ファイルへ置き換える。途中で失敗した場合は
+    受信済みの内容をエラー内容と一緒に出力ファイルへ残す。
+    ファイルごとの処理時間・トークン数・リトライ回数・キャッシュヒットは
+    出力ディレクトリの review_metrics.json に追記する（scripts/review_metrics.py を参照）。
+    session（ReviewSession）を渡すと、genai の設定・アップロード済みプロンプト・レート制限・
+    同時に送信するリクエスト数の上限（concurrency）を同じ session を使う他の呼び出し（並列実行を含む）と共有する。
+    file_source（ファイルパスの iterable）を渡すと file_list_path は読まず、file_source から
+    ファイルが届くたびにレビューを投入する（OCR など前段の処理とレビューを重ねて実行するため）。
+    この場合、まとめレビューとコンテキストキャッシュは使わず、プロンプトは初めて使う時点でアップロードする。
+    schedule（fifo / sjf / ljf）でリクエストを投入する順序を、推定トークン数に基づいて決める
+    （order_review_jobs を参照）。priority_patterns に一致するファイルは schedule より優先する。
+    deadline（秒）を指定すると、開始からその時間を過ぎた時点で未着手のファイルはリクエストを送らず
+    スキップ（失敗ではない）として記録する。送信済みのリクエストは完了まで待つ。
+    ファイルごとの結果は出力ディレクトリの review_journal.jsonl に完了のたびに fsync して追記する
+    （scripts/review_journal.py を参照）。resume を有効にすると、ジャーナルで ok と記録され、
+    内容の SHA-256 とレビュー Markdown が記録時のままのファイルはリクエストを送らずにレビュー済みとして扱う。
+    レビューに失敗したファイルは、全ファイルの処理後に並列数を半分ずつ下げながら最大 file_retries 回
+    再レビューする。それでも失敗したファイルは review_failures.json に記録し、失敗の割合が
+    failure_threshold を超えた場合のみ非ゼロ終了する（成功したレビューはそのまま出力に残る）。
+    リクエストを送る前に、ファイルごとの入力トークン数（ファイル全体＋プロンプト×リクエスト数）・
+    出力トークン数（GEMINI_EXPECTED_OUTPUT_TOKENS×リクエスト数）・費用を見積もり（pre-flight）、
+    review_metrics.json に記録する。トークン数は token_counter（estimate / api、scripts/token_preflight.py を参照）で数える。
+    見積もりはキャッシュヒットや差分レビューを考慮しない上限値。入力トークン数が file_token_budget を超えるファイルと、
+    schedule の順に積み上げた合計が run_token_budget・run_cost_budget（USD）を超えるファイルは
+    リクエストを送らずスキップとして記録する。
+    """
+    started = time.monotonic()
+    options = replace(options or BatchReviewOptions(), **option_values).resolved()
+    session = session or ReviewSession()
+    session.setup()
+    log.progress("✅ Gemini APIのセットアップ完了")
 
     prompt_map = load_prompt_mapping(prompt_map_path) if prompt_map_path else {}
-    docs_dir = os.path.dirname(os.path.abspath(prompt_map_path)) if prompt_map_path else os.path.abspath('docs')
-
-    prompt_paths = set()
-    for path in (default_prompt_path, default_custom_prompt_path):
-        if path:
-            prompt_paths.add(os.path.abspath(path))
-
-    # prompt_mapに指定されているファイルを収集
-    for base_path, custom_path in prompt_map.values():
-        if base_path:
-            prompt_paths.add(os.path.abspath(base_path))
-        if custom_path:
-            prompt_paths.add(os.path.abspath(custom_path))
-
-    # docs配下のmdファイルをすべて追加してアップロード対象にする
-    docs_path = Path(docs_dir)
-    if docs_path.exists():
-        for md_file in docs_path.glob('*.md'):
-            prompt_paths.add(str(md_file.resolve()))
-
-    uploaded_prompt_ids = upload_prompt_files(prompt_paths)
-    prompt_parts_cache = {}
+    review_modes = load_review_modes(prompt_map_path) if prompt_map_path else {}
 
     model_name = _resolve_model_name(model_name)
     model = genai.GenerativeModel(model_name)
 
     os.makedirs(output_dir, exist_ok=True)
+    output_layout = session.output_layout(output_dir)
+    journal = ReviewJournal(output_dir)
 
-    if not os.path.exists(file_list_path):
-        print(f"Error: File list not found: {file_list_path}", file=sys.stderr)
-        sys.exit(1)
-
-    with open(file_list_path, 'r', encoding='utf-8') as f:
-        files = [line.strip() for line in f if line.strip()]
+    if file_source is not None:
+        files = []
+        log.progress("Processing files as they arrive...")
+    else:
+        if not os.path.exists(file_list_path):
+            log.error(f"File list not found: {file_list_path}")
+            sys.exit(1)
 
-    print(f"Processing {len(files)} files...", file=sys.stderr)
-    review_count = 0
-    had_failure = False
+        with open(file_list_path, 'r', encoding='utf-8') as f:
+            # 同じファイルが複数回書かれていても 1 回だけレビューする
+            files = list(dict.fromkeys(line.strip() for line in f if line.strip()))
+
+        log.progress(f"Processing {len(files)} files...")
+    metrics = ReviewMetrics()
+    results = ReviewResults(output_dir, output_layout, journal, metrics, files, journal.latest() if options.resume else {})
+    # ジャーナルでレビュー済みのファイル（--resume）はプロンプトの準備もリクエストも行わない
+    resumed_files = results.resumed_files
+    resumed_files.update(f for f in files if results.already_reviewed(f))
+    if resumed_files:
+        log.progress(f"Resuming: {len(resumed_files)} file(s) already reviewed in {output_dir}")
+    results.mark_pending([f for f in files if f not in resumed_files])
+    image_files = {f for f in files if review_mode_for_file(f, review_modes) == REVIEW_MODE_IMAGE}
+    if image_files:
+        log.info(f"Reviewing {len(image_files)} image file(s) as multimodal input")
 
     default_prompt_paths = [
         os.path.abspath(p)
         for p in (default_prompt_path, default_custom_prompt_path)
-        if p and os.path.abspath(p) in uploaded_prompt_ids
+        if p
     ]
 
-    def resolve_prompt_paths_for_file(file_path):
-        """ファイルの拡張子に基づいて使用するプロンプトファイルパスのリストを返す"""
-        path_obj = Path(file_path)
-        suffixes = [s.lower() for s in path_obj.suffixes]
-        candidates = []
-        if suffixes:
-            combined = ''.join(suffixes)
-            candidates.append(combined)
-            for suf in reversed(suffixes):
-                candidates.append(suf)
-        
-        # 拡張子に対応するプロンプトを検索
-        for ext in candidates:
-            if ext in prompt_map:
-                base_path, custom_path = prompt_map[ext]
-                paths = []
-                # 拡張子専用のプロンプトを優先的に追加
-                for candidate_path in (base_path, custom_path):
-                    abs_candidate = os.path.abspath(candidate_path) if candidate_path else None
-                    if abs_candidate and abs_candidate in uploaded_prompt_ids:
-                        paths.append(abs_candidate)
-                print(f"Info: Using extension-specific prompts for {file_path} ({ext}): {[os.path.basename(p) for p in paths]}", file=sys.stderr)
-                return paths
-        
-        # fallback: デフォルトプロンプトを使用
-        print(f"Info: No extension mapping for {file_path}, using default prompts", file=sys.stderr)
-        return list(default_prompt_paths)
-
-    for file_path in files:
-        if not file_path:
-            continue
+    # 今回のファイル群が実際に使うプロンプトだけを事前に洗い出してアップロードする
+    resolved_prompts = [
+        resolve_prompt_paths_for_file(file_path, prompt_map, default_prompt_paths)
+        for file_path in files
+    ]
+    if options.deadline:
+        log.info(f"Review deadline: {options.deadline:g}s")
+    chunk_overlap_lines = env_number('GEMINI_CHUNK_OVERLAP_LINES', 20, int)
+    rate_limiter = session.rate_limiter(options.rpm, options.tpm)
+    request_slots = session.request_slots(options.concurrency)
+
+    # 送信前の見積もり（pre-flight）と予算。count_tokens もレート制限の範囲で送信する
+    token_counter = open_token_counter(
+        options.token_counter, model, model_name, options.max_file_tokens, rate_limiter, options.max_retries,
+    )
+    budget = PreflightBudget(
+        token_counter,
+        resolve_prices(model_name),
+        max(0, env_number('GEMINI_EXPECTED_OUTPUT_TOKENS', 1000, int)),
+        options.file_token_budget,
+        options.run_token_budget,
+        options.run_cost_budget,
+    )
+    # 予算超過でリクエストを送らないファイル -> レビュー結果に書き込む本文
+    over_budget = budget.over_budget
+
+    # pre-flight で読み込んだ内容は上限まで保持し、read_for_review が取り出す（残りはレビュー時に読み直す）
+    preflight = ReviewPreflight(
+        budget, metrics, open_preload_cache(), image_files,
+        options.chunk_tokens, chunk_overlap_lines, options.max_file_tokens,
+    )
+    if file_source is None:
+        preflight_files = [i for i, f in enumerate(files) if f not in resumed_files]
+        preflight.run(
+            [files[i] for i in preflight_files], [resolved_prompts[i][1] for i in preflight_files],
+            options.concurrency, options.schedule, options.priority_patterns,
+        )
+        log.info(budget.summary_line())
+    # ジャーナルでレビュー済み・予算超過のファイルにはリクエストを送らない
+    not_requested = resumed_files | set(over_budget)
 
-        filename = os.path.basename(file_path)
-        review_filename = os.path.splitext(filename)[0] + '.md'
-        review_file_path = os.path.join(output_dir, review_filename)
+    prompt_parts_cache = session.prompt_parts_cache
+    uploaded_prompt_ids = session.uploaded_prompt_ids
+    lazy_prompts = options.lazy_prompts or file_source is not None
 
-        print(f"✅ レビュー対象: {file_path} -> {review_file_path}", file=sys.stderr)
+    ensure_prompts_uploaded = session.ensure_prompts_uploaded
 
-        try:
-            if not os.path.exists(file_path):
-                print(f"Error: File does not exist: {file_path}", file=sys.stderr)
-                with open(review_file_path, 'w', encoding='utf-8') as out:
-                    out.write("自動レビューに失敗しました。ファイルが見つかりません。")
-                had_failure = True
-                continue
+    prompt_upload_seconds = 0.0
+    if lazy_prompts:
+        log.info("Uploading prompt files lazily on first use")
+    else:
+        needed_prompt_paths = sorted({
+            p for file_path, (_ext, paths) in zip(files, resolved_prompts) if file_path not in not_requested for p in paths
+        })
+        log.info(f"Uploading {len(needed_prompt_paths)} prompt file(s) needed by this batch")
+        upload_started = time.monotonic()
+        ensure_prompts_uploaded(needed_prompt_paths)
+        prompt_upload_seconds = time.monotonic() - upload_started
+
+    def prompt_paths_for(file_path, matched_ext, candidate_paths):
+        """アップロード済みのプロンプトパスだけを返す（lazy モードではここで初めてアップロードする）"""
+        ensure_prompts_uploaded(candidate_paths)
+        paths = [p for p in candidate_paths if p in uploaded_prompt_ids]
+        if matched_ext:
+            log.info(f"Using extension-specific prompts for {file_path} ({matched_ext}): {[os.path.basename(p) for p in paths]}")
+        else:
+            # fallback: デフォルトプロンプトを使用
+            log.info(f"No extension mapping for {file_path}, using default prompts")
+        return paths
+
+    result_cache = open_result_cache(options.result_cache_dir)
+    token_usage = TokenUsage()
+    diff_base = options.diff_base
+    if diff_base and not verify_git_revision(diff_base):
+        log.warning(f"Diff base '{diff_base}' is not a valid revision; reviewing whole files")
+        diff_base = None
+    if diff_base:
+        log.info(f"Reviewing changes since {diff_base} (context {options.diff_context} lines)")
+    prompt_infos = session.prompt_infos
+    prompt_sets = {}
+    created_context_caches = []
+    uploaded_images = []
+
+    def prompt_fingerprint(prompt_paths_for_file):
+        """プロンプトファイル群の (内容ハッシュを順序どおりに連結した文字列, 推定トークン数) を返す"""
+        hashes = []
+        tokens = 0
+        for prompt_path in prompt_paths_for_file:
+            if prompt_path not in prompt_infos:
+                with open(prompt_path, 'r', encoding='utf-8') as f:
+                    prompt_tokens = estimate_tokens(f.read())
+                prompt_infos[prompt_path] = (sha256_file(prompt_path), prompt_tokens)
+            prompt_hash, prompt_tokens = prompt_infos[prompt_path]
+            hashes.append(prompt_hash)
+            tokens += prompt_tokens
+        return ','.join(hashes), tokens
+
+    def get_prompt_set(prompt_paths_for_file, request_count):
+        """プロンプトの組ごとに、送信するパーツ・使用するモデル・キャッシュ用の指紋をまとめて返す
+
+        コンテキストキャッシュが有効で、同じ組を複数リクエストで使う場合は
+        サーバー側のキャッシュを作成し、プロンプトを毎回送らずにキャッシュを参照するモデルを使う。
+        """
+        prompt_key = tuple(prompt_paths_for_file)
+        if prompt_key in prompt_sets:
+            return prompt_sets[prompt_key]
+        prompt_parts = get_prompt_parts_for_paths(prompt_paths_for_file, uploaded_prompt_ids, prompt_parts_cache)
+        fingerprint, prompt_tokens = prompt_fingerprint(prompt_paths_for_file)
+        prompt_set = {
+            'key': prompt_key,
+            'model': model,
+            'parts': prompt_parts,
+            'fingerprint': fingerprint,
+            'tokens': prompt_tokens,
+        }
+        if options.context_cache and prompt_parts and request_count >= 2:
+            cached_model = create_context_cached_model(model_name, prompt_parts, prompt_tokens, created_context_caches)
+            if cached_model is not None:
+                prompt_set.update(model=cached_model, parts=[])
+        prompt_sets[prompt_key] = prompt_set
+        return prompt_set
+
+    def log_retry(label, metric_files):
+        def on_retry(attempt, exc, delay):
+            log.warning(f"Retryable error for {label} (retry {attempt}/{options.max_retries} in {delay:.1f}s): {exc}")
+            for file_path in metric_files:
+                metrics.add(file_path, 'retries', 1)
+        return on_retry
+
+    def record_response(metric_files, response, elapsed):
+        """レスポンスのトークン数と所要時間を集計する（まとめレビューのトークン数はファイル数で等分する）"""
+        token_usage.add(response)
+        counts = [_split_evenly(count, len(metric_files)) for count in usage_counts(response)]
+        for file_path, input_tokens, cached_tokens, output_tokens in zip(metric_files, *counts):
+            metrics.add(file_path, 'requests', 1)
+            metrics.add(file_path, 'request_seconds', elapsed)
+            metrics.add(file_path, 'input_tokens', input_tokens)
+            metrics.add(file_path, 'cached_tokens', cached_tokens)
+            metrics.add(file_path, 'output_tokens', output_tokens)
+
+    def request_review(request_model, contents, tokens, label, metric_files=None):
+        """generate_content をレート制限・リトライ付きで呼び出し、レスポンス本文を返す
+
+        計測値は metric_files（省略時は label）のファイルに記録する。
+        """
+        metric_files = metric_files or [label]
+        log_request(label, model_name, request_model, contents)
+        started = time.monotonic()
+        def attempt():
+            with request_slots:
+                return request_model.generate_content(contents)
+
+        response = call_with_retry(
+            attempt,
+            limiter=rate_limiter,
+            tokens=tokens,
+            max_retries=options.max_retries,
+            on_retry=log_retry(label, metric_files),
+        )
+        record_response(metric_files, response, time.monotonic() - started)
+        return response.text
+
+    def stream_review(request_model, contents, tokens, label, part_path):
+        """generate_content をストリーミングで呼び出し、受信した断片を part_path に書き込む
+
+        (最初の断片を受信するまでの秒数, 全体の秒数) を返す。リトライ時は part_path を書き直す。
+        失敗した場合は最後の試行で受信済みの断片を part_path に残したまま例外を送出する。
+        """
+        log_request(label, model_name, request_model, contents)
+        timing = {}
+
+        def attempt():
+            started = time.monotonic()
+            timing.clear()
+            with request_slots, open(part_path, 'w', encoding='utf-8') as out:
+                response = request_model.generate_content(contents, stream=True)
+                for chunk in response:
+                    text = _stream_chunk_text(chunk)
+                    if not text:
+                        continue
+                    if 'first' not in timing:
+                        timing['first'] = time.monotonic() - started
+                    out.write(text)
+                    out.flush()
+            timing['total'] = time.monotonic() - started
+            return response
+
+        started = time.monotonic()
+        response = call_with_retry(
+            attempt,
+            limiter=rate_limiter,
+            tokens=tokens,
+            max_retries=options.max_retries,
+            on_retry=log_retry(label, [label]),
+        )
+        record_response([label], response, time.monotonic() - started)
+        first_seconds = timing.get('first', timing['total'])
+        metrics.set(label, 'first_token_seconds', first_seconds)
+        return first_seconds, timing['total']
+
+    def deadline_passed():
+        return options.deadline is not None and time.monotonic() - started >= options.deadline
+
+    def deadline_skip(file_path, metric_file=None):
+        """制限時間切れでレビューしなかったファイル（または範囲）の (状態, 本文) を返す"""
+        log.warning(f"Skipping {file_path}: review deadline of {options.deadline:g}s reached")
+        metrics.set(metric_file or file_path, 'skip_reason', 'deadline')
+        body = (
+            f"自動レビューをスキップしました。レビュー全体の制限時間（{options.deadline:g} 秒）に達したため、"
+            "レビューしていません。\n"
+        )
+        return REVIEW_SKIPPED, body
+
+    def failure_result(file_path, e, metric_file=None):
+        # 例外の詳細をstderrに出力し、レビュー結果ファイルにエラー内容を記録する
+        tb = traceback.format_exc()
+        log.error(f"🚨 レビュー失敗: {file_path}: {e}")
+        metrics.set(metric_file or file_path, 'last_error', f"{type(e).__name__}: {e}"[:500])
+        results.transient_failures[metric_file or file_path] = classify_error(e) == RETRYABLE
+        log.progress(tb.rstrip())
+        body = (
+            "自動レビューに失敗しました。担当者に確認してください。\n\n"
+            "エラー内容: "
+            f"{e}\n\n"
+            "トレースバック:\n"
+            f"{tb}"
+        )
+        return REVIEW_FAILED, body
 
-            with open(file_path, 'r', encoding='utf-8') as f:
-                file_content = f.read()
+    def review_file(file_path, prompt_set, loaded=None, stream_path=None):
+        """1ファイル分のレビューを実行し、(結果の状態, 書き込む本文) を返す（ワーカースレッドで実行）
 
-            full_prompt = f"File: {file_path}\n\n```\n{file_content}\n```"
-            prompt_paths_for_file = resolve_prompt_paths_for_file(file_path)
-            prompt_parts = get_prompt_parts_for_paths(prompt_paths_for_file, uploaded_prompt_ids, prompt_parts_cache)
+        stream_path を指定するとレスポンスを受信しながら書き込み、成功時は本文の代わりに None を返す
+        （stream_path に書き込み済み）。
+        """
+        try:
+            if loaded is None:
+                loaded = load_for_review(file_path, prompt_set['fingerprint'])
+            file_content, cache_key, cached_review, diff_text = loaded
+            if file_content is None:
+                metrics.set(file_path, 'last_error', 'File not found')
+                return REVIEW_FAILED, "自動レビューに失敗しました。ファイルが見つかりません。"
+            if cached_review is not None:
+                return REVIEW_OK, cached_review
+            if deadline_passed():
+                return deadline_skip(file_path)
+
+            if file_path in image_files:
+                full_prompt = build_image_review_prompt(file_path)
+                contents = [full_prompt, image_content_part(file_path, file_content, uploaded_images)]
+                tokens = estimate_tokens(full_prompt) + IMAGE_TOKEN_ESTIMATE + prompt_set['tokens']
+            else:
+                full_prompt = build_review_prompt(file_path, file_content, diff_text, diff_base)
+                contents = [full_prompt]
+                tokens = estimate_tokens(full_prompt) + prompt_set['tokens']
+            contents.extend(prompt_set['parts'])
+            if stream_path is not None:
+                return stream_file_review(file_path, prompt_set['model'], contents, tokens, cache_key, stream_path)
+            review_text = request_review(prompt_set['model'], contents, tokens, file_path)
+            if cache_key is not None:
+                result_cache.put(cache_key, review_text)
+            return REVIEW_OK, review_text
 
-            contents = [full_prompt]
-            contents.extend(prompt_parts)
-            # Print model info and the contents passed to the Gemini SDK so we can
-            # verify exactly what is being sent.
-            print(f"モデル名（変数）: {model_name}", file=sys.stderr)
-            print(f"モデルオブジェクト repr: {repr(model)}", file=sys.stderr)
-            print("generate_content に渡す contents:", contents, file=sys.stderr)
-            response = model.generate_content(contents)
+        except Exception as e:
+            return failure_result(file_path, e)
 
-            with open(review_file_path, 'w', encoding='utf-8') as out:
-                out.write(response.text)
+    def stream_file_review(file_path, request_model, contents, tokens, cache_key, stream_path):
+        part_path = f"{stream_path}.part"
+        try:
+            first_seconds, total_seconds = stream_review(request_model, contents, tokens, file_path, part_path)
+        except Exception as e:
+            partial = _read_partial_output(part_path)
+            status, body = failure_result(file_path, e)
+            if partial.strip():
+                body = (
+                    f"{partial.rstrip()}\n\n---\n\n"
+                    "（以上はレスポンスの受信が途中で途切れるまでに出力された内容です）\n\n"
+                    f"{body}"
+                )
+            return status, body
+
+        log.info(f"Streamed review for {file_path}: first token {first_seconds:.2f}s, total {total_seconds:.2f}s")
+        if cache_key is not None:
+            with open(part_path, 'r', encoding='utf-8') as f:
+                result_cache.put(cache_key, f.read())
+        os.replace(part_path, stream_path)
+        return REVIEW_OK, None
+
+    def load_for_review(file_path, fingerprint):
+        """レビュー対象を読み込み (内容, キャッシュキー, キャッシュ済みレビュー, 変更ハンク) を返す
+
+        ファイルが存在しない場合の内容は None。画像としてレビューするファイルの内容はバイト列。変更ハンクは差分レビューでない・差分が取れない場合は None。
+        読み込み・デコードの失敗は例外として送出する。
+        """
+        with metrics.timed(file_path, 'read_seconds'):
+            return read_for_review(file_path, fingerprint)
+
+    def read_for_review(file_path, fingerprint):
+        file_bytes = preflight.take(file_path)
+        if file_bytes is None:
+            if not os.path.exists(file_path):
+                log.error(f"File does not exist: {file_path}")
+                return None, None, None, None
+            with open(file_path, 'rb') as f:
+                file_bytes = f.read()
+        if file_path in image_files:
+            file_content = file_bytes
+            diff_text = None
+            metrics.set(file_path, 'review_mode', REVIEW_MODE_IMAGE)
+        else:
+            file_content = file_bytes.decode('utf-8')
+            diff_text = git_diff_for_file(file_path, diff_base, options.diff_context) if diff_base else None
+        metrics.set(file_path, 'bytes', len(file_bytes))
+        if diff_text is not None:
+            metrics.set(file_path, 'diff_bytes', len(diff_text.encode('utf-8')))
+
+        cache_key = None
+        if result_cache is not None:
+            if file_path in image_files:
+                cache_key = build_cache_key(model_name, fingerprint, 'image', file_bytes)
+            elif diff_text is None:
+                cache_key = build_cache_key(model_name, fingerprint, file_bytes)
+            else:
+                # 差分レビューの結果は送信したハンク（コンテキスト行を含む）に対してのみ再利用する
+                cache_key = build_cache_key(model_name, fingerprint, 'diff', diff_text)
+            cached_review = result_cache.get(cache_key)
+            if cached_review is not None:
+                log.info(f"Review cache hit for {file_path}")
+                metrics.add(file_path, 'cache_hits', 1)
+                return file_content, cache_key, cached_review, diff_text
+        return file_content, cache_key, None, diff_text
+
+    def review_pack(file_paths, prompt_set):
+        """同じプロンプトを使う複数ファイルを 1 リクエストでレビューし、ファイルごとの結果のリストを返す
+
+        キャッシュ済み・読み込み失敗のファイルは個別に扱い、残りが 2 件以上ある場合のみまとめて送信する。
+        モデルの出力を区切り行で分割できなかった場合はファイルごとのリクエストにフォールバックする。
+        """
+        results = [None] * len(file_paths)
+        pending = []
+        for index, file_path in enumerate(file_paths):
+            try:
+                loaded = load_for_review(file_path, prompt_set['fingerprint'])
+            except Exception as e:
+                results[index] = failure_result(file_path, e)
+                continue
+            if loaded[0] is None or loaded[2] is not None:
+                results[index] = review_file(file_path, prompt_set, loaded)
+            else:
+                pending.append((index, file_path, loaded))
+
+        if pending and deadline_passed():
+            for index, file_path, _loaded in pending:
+                results[index] = deadline_skip(file_path)
+            return results
+
+        if len(pending) >= 2:
+            for _, file_path, _ in pending:
+                metrics.set(file_path, 'packed_with', len(pending))
+            packed_prompt = build_packed_prompt([
+                (file_path, loaded[0]) if loaded[3] is None
+                else (f"{file_path} (changes since {diff_base}, unified diff)", loaded[3])
+                for _, file_path, loaded in pending
+            ])
+            label = f"packed request ({len(pending)} files)"
+            try:
+                reviews = split_packed_response(
+                    request_review(
+                        prompt_set['model'],
+                        [packed_prompt] + list(prompt_set['parts']),
+                        estimate_tokens(packed_prompt) + prompt_set['tokens'],
+                        label,
+                        [file_path for _, file_path, _ in pending],
+                    ),
+                    len(pending),
+                )
+            except Exception as e:
+                log.warning(f"{label} failed: {e}")
+                reviews = None
+            if reviews is not None:
+                for (index, _file_path, loaded), review_text in zip(pending, reviews):
+                    if loaded[1] is not None:
+                        result_cache.put(loaded[1], review_text)
+                    results[index] = (REVIEW_OK, review_text)
+                return results
+            log.warning(f"Could not split {label}; falling back to per-file requests")
+
+        for index, file_path, loaded in pending:
+            results[index] = review_file(file_path, prompt_set, loaded)
+        return results
+
+    def review_chunk(file_path, prompt_set, chunk, chunk_count, total_lines, is_diff=False):
+        """大きなファイル（または差分）の 1 範囲をレビューし、(結果の状態, 本文) を返す（ワーカースレッドで実行）"""
+        label = f"{file_path} L{chunk.start_line}-L{chunk.end_line}"
+        if deadline_passed():
+            return deadline_skip(label, file_path)
+        try:
+            chunk_prompt = build_chunk_prompt(file_path, chunk, chunk_count, total_lines, diff_base if is_diff else None)
+            contents = [chunk_prompt]
+            contents.extend(prompt_set['parts'])
+            review_text = request_review(
+                prompt_set['model'], contents, estimate_tokens(chunk_prompt) + prompt_set['tokens'], label, [file_path],
+            )
+            return REVIEW_OK, review_text
+        except Exception as e:
+            return failure_result(label, e, file_path)
 
-            review_count += 1
+    def submit_large_file(executor, file_path, prompt_set, stream_path=None):
+        """大きい可能性のあるファイルを読み込み、上限超過ならスキップ、分割が必要なら範囲ごとに投入する
 
+        PendingReview を返す（結果はメインスレッドで書き込み時に取り出す）。
+        """
+        try:
+            loaded = load_for_review(file_path, prompt_set['fingerprint'])
         except Exception as e:
-            # 例外の詳細をstderrに出力し、レビュー結果ファイルにエラー内容を記録する
-            tb = traceback.format_exc()
-            print(f"🚨 レビュー失敗: {file_path}: {e}", file=sys.stderr)
-            print(tb, file=sys.stderr)
-            with open(review_file_path, 'w', encoding='utf-8') as out:
-                out.write("自動レビューに失敗しました。担当者に確認してください。\n\n")
-                out.write("エラー内容: ")
-                out.write(f"{e}\n\n")
-                out.write("トレースバック:\n")
-                out.write(tb)
-            had_failure = True
-
-    print(f"完了: {review_count}/{len(files)} ファイルをレビューしました", file=sys.stderr)
-    # いずれかのレビューに失敗していたら非ゼロ終了させることでGitHub Actionsを失敗させる
-    if had_failure:
-        print("Error: One or more reviews failed; failing process to surface as GitHub Actions failure.", file=sys.stderr)
-        sys.exit(1)
+            return PendingReview.finished(*failure_result(file_path, e))
+        file_content, cache_key, cached_review, diff_text = loaded
+        if file_content is None or cached_review is not None:
+            return PendingReview.finished(*review_file(file_path, prompt_set, loaded))
+
+        # 差分レビューでは送信する変更ハンクの大きさで判断する
+        review_content = file_content if diff_text is None else diff_text
+        file_tokens = estimate_tokens(review_content)
+        if file_tokens > options.max_file_tokens:
+            log.warning(f"Skipping {file_path}: ~{file_tokens} tokens exceeds limit {options.max_file_tokens}")
+            return PendingReview.finished(REVIEW_SKIPPED, oversized_file_review(file_tokens, options.max_file_tokens))
+        if file_tokens <= options.chunk_tokens:
+            return PendingReview.of_future(executor.submit(review_file, file_path, prompt_set, loaded, stream_path))
+
+        chunks = split_source_chunks(review_content, options.chunk_tokens, chunk_overlap_lines)
+        total_lines = review_content.count('\n') + 1
+        log.info(f"Splitting {file_path} (~{file_tokens} tokens) into {len(chunks)} chunk(s)")
+        metrics.set(file_path, 'chunks', len(chunks))
+        futures = [
+            executor.submit(review_chunk, file_path, prompt_set, chunk, len(chunks), total_lines, diff_text is not None)
+            for chunk in chunks
+        ]
+
+        def merged_result():
+            status, body = merge_chunk_reviews(file_path, chunks, [f.result() for f in futures])
+            if status == REVIEW_OK and cache_key is not None:
+                result_cache.put(cache_key, body)
+            return status, body
+        return PendingReview(merged_result, futures)
+
+    if options.concurrency > 1:
+        log.info(f"Reviewing with concurrency {options.concurrency}")
+
+    def submit_arriving_files(executor, result_for_index):
+        """file_source から届いたファイルを順に 1 ファイル 1 リクエストで投入する"""
+        for file_path in file_source:
+            index = len(files)
+            files.append(file_path)
+            if review_mode_for_file(file_path, review_modes) == REVIEW_MODE_IMAGE:
+                image_files.add(file_path)
+            review_file_path = results.review_path(index)
+            if results.already_reviewed(file_path):
+                resumed_files.add(file_path)
+                log.progress(f"⏭️ レビュー済み: {file_path} -> {review_file_path}")
+                result_for_index[index] = PendingReview.finished(REVIEW_OK, None)
+                continue
+            results.mark_pending([file_path])
+            preflight.admit(
+                file_path, resolve_prompt_paths_for_file(file_path, prompt_map, default_prompt_paths)[1],
+                preflight.measure(file_path),
+            )
+            if file_path in over_budget:
+                result_for_index[index] = PendingReview.finished(REVIEW_SKIPPED, over_budget[file_path])
+            else:
+                log.progress(f"✅ レビュー対象: {file_path} -> {review_file_path}")
+                result_for_index[index] = submit_single_file(executor, file_path, review_file_path)
+            # 次のファイルが届くまでの間に、完了したレビューを書き込む
+            write_completed_results(result_for_index, results.write, block=False)
+
+    def submit_single_file(executor, file_path, review_file_path):
+        """1 ファイルを単独のリクエスト（大きければ分割）として投入し、PendingReview を返す"""
+        matched_ext, candidate_paths = resolve_prompt_paths_for_file(file_path, prompt_map, default_prompt_paths)
+        with metrics.timed(file_path, 'prompt_seconds'):
+            prompt_set = get_prompt_set(prompt_paths_for(file_path, matched_ext, candidate_paths), 1)
+        stream_path = review_file_path if options.stream else None
+        if file_path not in image_files and estimate_file_tokens(file_path) > options.chunk_tokens:
+            return submit_large_file(executor, file_path, prompt_set, stream_path)
+        return PendingReview.of_future(executor.submit(review_file, file_path, prompt_set, None, stream_path))
+
+    def submit_sweep(executor, index):
+        metrics.add(files[index], 'sweep_attempts', 1)
+        return submit_single_file(executor, files[index], results.review_path(index))
+
+    try:
+        with ThreadPoolExecutor(max_workers=options.concurrency) as executor:
+            # プロンプトの解決はメインスレッドで順に行い、API 呼び出しのみ並列化する
+            prompt_paths_per_file = []
+            # ファイル番号 -> まだ書き込んでいない結果（PendingReview）
+            result_for_index = {}
+            # file_source のファイルは届いた時点で 1 件ずつ投入する
+            if file_source is not None:
+                submit_arriving_files(executor, result_for_index)
+                log.info(budget.summary_line())
+            else:
+                for index, (file_path, (matched_ext, candidate_paths)) in enumerate(zip(files, resolved_prompts)):
+                    review_file_path = results.review_path(index)
+                    if file_path in resumed_files:
+                        log.progress(f"⏭️ レビュー済み: {file_path} -> {review_file_path}")
+                        # レビュー Markdown は前回の実行で書き込み済み
+                        result_for_index[index] = PendingReview.finished(REVIEW_OK, None)
+                        prompt_paths_per_file.append(None)
+                        continue
+                    if file_path in over_budget:
+                        log.progress(f"⏭️ 予算超過のためスキップ: {file_path} -> {review_file_path}")
+                        result_for_index[index] = PendingReview.finished(REVIEW_SKIPPED, over_budget[file_path])
+                        prompt_paths_per_file.append(None)
+                        continue
+
+                    log.progress(f"✅ レビュー対象: {file_path} -> {review_file_path}")
+
+                    with metrics.timed(file_path, 'prompt_seconds'):
+                        prompt_paths_per_file.append(tuple(prompt_paths_for(file_path, matched_ext, candidate_paths)))
+
+                jobs, large_indexes = plan_review_jobs(
+                    files, prompt_paths_per_file, image_files, not_requested, options.chunk_tokens,
+                    options.pack_token_budget, options.schedule, options.priority_patterns,
+                )
+                # プロンプトの組ごとのリクエスト数（コンテキストキャッシュを作る価値があるかの判断に使う）
+                requests_per_prompt_key = {}
+                for indexes in jobs:
+                    prompt_key = prompt_paths_per_file[indexes[0]]
+                    requests_per_prompt_key[prompt_key] = requests_per_prompt_key.get(prompt_key, 0) + 1
+
+                for indexes in jobs:
+                    prompt_key = prompt_paths_per_file[indexes[0]]
+                    with metrics.timed(files[indexes[0]], 'prompt_seconds'):
+                        prompt_set = get_prompt_set(list(prompt_key), requests_per_prompt_key[prompt_key])
+                    # ストリーミングは 1 ファイル 1 リクエストの場合のみ（まとめ・分割レビューは結果を組み立て直すため）
+                    stream_path = results.review_path(indexes[0]) if options.stream and len(indexes) == 1 else None
+                    if indexes[0] in large_indexes:
+                        result_for_index[indexes[0]] = submit_large_file(executor, files[indexes[0]], prompt_set, stream_path)
+                        continue
+                    if len(indexes) == 1:
+                        result_for_index[indexes[0]] = PendingReview.of_future(executor.submit(
+                            review_file, files[indexes[0]], prompt_set, None, stream_path,
+                        ))
+                        continue
+                    future = executor.submit(review_pack, [files[i] for i in indexes], prompt_set)
+                    for position, index in enumerate(indexes):
+                        result_for_index[index] = PendingReview.of_future(future, position)
+
+            # 完了した順に書き込み、ジャーナルに記録する（中断しても完了済みのファイルは再開時にレビュー済みになる）
+            write_completed_results(result_for_index, results.write)
+        sweep_failed_files(
+            results.failed_indexes, submit_sweep, results.write, deadline_passed, options.file_retries, options.concurrency,
+            options.deadline,
+        )
+    finally:
+        delete_context_caches(created_context_caches)
+        delete_uploaded_files(uploaded_images)
+
+    review_count = results.count(REVIEW_OK)
+    skipped_count = results.count(REVIEW_SKIPPED)
+    failed_count = results.count(REVIEW_FAILED)
+    log.progress(f"完了: {review_count}/{len(files)} ファイルをレビューしました")
+    if skipped_count:
+        log.info(f"{skipped_count} file(s) skipped")
+    deadline_skipped = metrics.values('skip_reason').count('deadline')
+    if deadline_skipped:
+        log.warning(f"{deadline_skipped} file(s) were not fully reviewed within the {options.deadline:g}s deadline")
+    if token_usage.requests:
+        log.info(token_usage.summary_line())
+    first_seconds = sorted(metrics.values('first_token_seconds'))
+    if first_seconds:
+        log.info(
+            f"Streaming: files={len(first_seconds)} "
+            f"median first token={first_seconds[len(first_seconds) // 2]:.2f}s max={first_seconds[-1]:.2f}s"
+        )
+    if result_cache is not None:
+        evicted = result_cache.evict()
+        log.info(f"{result_cache.stats_line('Review cache')} evicted={evicted}")
+    if token_counter.cache is not None:
+        evicted = token_counter.cache.evict()
+        log.info(
+            f"{token_counter.cache.stats_line('Token count cache')} evicted={evicted} "
+            f"count_tokens calls={token_counter.api_calls} fallbacks={token_counter.fallbacks}"
+        )
+    run_metrics = metrics.to_run(
+        files,
+        file_list=file_list_path if file_source is None else 'pipeline',
+        model=model_name,
+        concurrency=options.concurrency,
+        prompt_upload_seconds=prompt_upload_seconds,
+        stream=options.stream,
+        diff_base=diff_base,
+        schedule=options.schedule,
+        deadline_seconds=options.deadline,
+        file_retries=options.file_retries,
+        failure_threshold=options.failure_threshold,
+        preflight=budget.to_metrics(),
+    )
+    try:
+        metrics_path = append_metrics_run(output_dir, run_metrics)
+        log.info(f"Wrote metrics to {metrics_path}")
+    except OSError as e:
+        # 計測値の保存失敗はレビュー結果に影響しないため警告のみ
+        log.warning(f"Failed to write review metrics: {e}")
+    try:
+        index_entries = [
+            {
+                'source': record['file'],
+                'review': results.relative_path(record['output']),
+                'status': record.get('status'),
+            }
+            for record in run_metrics['file_metrics'] if 'output' in record
+        ]
+        update_review_index(output_dir, index_entries)
+    except OSError as e:
+        log.warning(f"Failed to write review index: {e}")
+    try:
+        update_failure_manifest(
+            output_dir,
+            [
+                {
+                    'source': record['file'],
+                    'review': results.relative_path(record['output']),
+                    'error': record.get('last_error'),
+                    'attempts': 1 + record.get('sweep_attempts', 0),
+                }
+                for record in run_metrics['file_metrics'] if record.get('status') == REVIEW_FAILED
+            ],
+            files,
+        )
+    except OSError as e:
+        log.warning(f"Failed to write failure manifest: {e}")
+    # 失敗の割合が許容値を超えていたら非ゼロ終了させることでGitHub Actionsを失敗させる
+    if failed_count:
+        failed_ratio = failed_count / max(1, len(files))
+        if failed_ratio > options.failure_threshold:
+            log.error(
+                f"{failed_count} review(s) failed (see {FAILURES_FILENAME}); "
+                "failing process to surface as GitHub Actions failure."
+            )
+            sys.exit(1)
+        log.warning(
+            f"{failed_count} review(s) failed (see {FAILURES_FILENAME}), "
+            f"within failure threshold {options.failure_threshold:g}"
+        )
 
     return review_count
 
+# batch-review のオプション -> (batch_review_files の引数名, 値の表記)。値の表記が文字列でないものはフラグで、その値を設定する
+BATCH_REVIEW_ARGS = {
+    '--default-prompt': ('default_prompt_path', '<path>'),
+    '--default-custom': ('default_custom_prompt_path', '<path>'),
+    '--prompt-map': ('prompt_map_path', '<csv-path>'),
+    '--model': ('model_name', '<model-name>'),
+    '--concurrency': ('concurrency', '<n>'),
+    '--result-cache-dir': ('result_cache_dir', '<dir>'),
+    '--no-result-cache': ('result_cache_dir', False),
+    '--rpm': ('rpm', '<n>'),
+    '--tpm': ('tpm', '<n>'),
+    '--max-retries': ('max_retries', '<n>'),
+    '--lazy-prompts': ('lazy_prompts', True),
+    '--pack-token-budget': ('pack_token_budget', '<n>'),
+    '--context-cache': ('context_cache', True),
+    '--chunk-tokens': ('chunk_tokens', '<n>'),
+    '--max-file-tokens': ('max_file_tokens', '<n>'),
+    '--diff-base': ('diff_base', '<rev>'),
+    '--diff-context': ('diff_context', '<n>'),
+    '--stream': ('stream', True),
+    '--schedule': ('schedule', '<fifo|sjf|ljf>'),
+    '--deadline': ('deadline', '<seconds>'),
+    '--priority': ('priority_patterns', '<glob,...>'),
+    '--resume': ('resume', True),
+    '--file-retries': ('file_retries', '<n>'),
+    '--failure-threshold': ('failure_threshold', '<ratio>'),
+    '--token-counter': ('token_counter', '<estimate|api>'),
+    '--file-token-budget': ('file_token_budget', '<n>'),
+    '--run-token-budget': ('run_token_budget', '<n>'),
+    '--run-cost-budget': ('run_cost_budget', '<usd>'),
+}
+BATCH_REVIEW_USAGE = "gemini batch-review <file-list-path> <output-dir> " + " ".join(
+    f"[{flag} {value}]" if isinstance(value, str) else f"[{flag}]" for flag, (_name, value) in BATCH_REVIEW_ARGS.items()
+)
+
+
+def parse_batch_review_args(args):
+    """batch-review の <output-dir> より後の引数を batch_review_files のキーワード引数に変換する"""
+    values = {}
+    idx = 0
+    while idx < len(args):
+        arg = args[idx]
+        name, value = BATCH_REVIEW_ARGS.get(arg, (None, None))
+        if name is None or (isinstance(value, str) and idx + 1 >= len(args)):
+            log.warning(f"Unrecognized argument {arg}")
+            idx += 1
+            continue
+        if isinstance(value, str):
+            values[name] = args[idx + 1]
+            idx += 2
+        else:
+            values[name] = value
+            idx += 1
+    return values
+
+
 def main():
     if len(sys.argv) < 2:
         print("Usage:", file=sys.stderr)
         print("  gemini ask <prompt> [--file-path <path>] [--prompt-file-id <id>]", file=sys.stderr)
         print("  gemini upload-prompt <prompt-file-path>", file=sys.stderr)
-        print("  gemini batch-review <file-list-path> <output-dir> [--default-prompt <path>] [--default-custom <path>] [--prompt-map <csv-path>] [--model <model-name>]", file=sys.stderr)
+        print(f"  {BATCH_REVIEW_USAGE}", file=sys.stderr)
         sys.exit(1)
     
     command = sys.argv[1]
@@ -383,48 +2327,10 @@ def main():
     if command == "batch-review":
         # バッチレビューコマンド
         if len(sys.argv) < 4:
-            print("Usage: gemini batch-review <file-list-path> <output-dir> [--default-prompt <path>] [--default-custom <path>] [--prompt-map <csv-path>] [--model <model-name>]", file=sys.stderr)
+            print(f"Usage: {BATCH_REVIEW_USAGE}", file=sys.stderr)
             sys.exit(1)
 
-        file_list_path = sys.argv[2]
-        output_dir = sys.argv[3]
-        default_prompt_path = None
-        default_custom_prompt_path = None
-        prompt_map_path = None
-        model_name = None
-
-        args = sys.argv[4:]
-        idx = 0
-        while idx < len(args):
-            arg = args[idx]
-            if arg == '--default-prompt' and idx + 1 < len(args):
-                default_prompt_path = args[idx + 1]
-                idx += 2
-                continue
-            if arg == '--default-custom' and idx + 1 < len(args):
-                default_custom_prompt_path = args[idx + 1]
-                idx += 2
-                continue
-            if arg == '--prompt-map' and idx + 1 < len(args):
-                prompt_map_path = args[idx + 1]
-                idx += 2
-                continue
-            if arg == '--model' and idx + 1 < len(args):
-                candidate = args[idx + 1].strip()
-                model_name = candidate if candidate else None
-                idx += 2
-                continue
-            print(f"Warning: Unrecognized argument {arg}", file=sys.stderr)
-            idx += 1
-
-        batch_review_files(
-            file_list_path,
-            output_dir,
-            default_prompt_path,
-            default_custom_prompt_path,
-            prompt_map_path,
-            model_name,
-        )
+        batch_review_files(sys.argv[2], sys.argv[3], **parse_batch_review_args(sys.argv[4:]))
         return
 
     # 既存のコマンド処理
@@ -439,7 +2345,7 @@ def main():
         return
 
     if command != "ask":
-        print(f"Unknown command: {command}", file=sys.stderr)
+        log.error(f"Unknown command: {command}")
         sys.exit(1)
 
     prompt = sys.argv[2] if len(sys.argv) > 2 else ""
@@ -468,8 +2374,5 @@ if __name__ == "__main__":
         main()
     except Exception as e:
         # 予期しない例外はstderrに出力して非ゼロ終了
-        print(f"Unhandled error: {e}", file=sys.stderr)
+        log.error(f"Unhandled error: {e}")
         sys.exit(1)
-
-if __name__ == "__main__":
-    main()
\ No newline at end of file
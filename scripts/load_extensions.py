@@ -4,28 +4,37 @@ target-extensions.csvから拡張子パターンを生成
 
 Usage:
     python load_extensions.py [csv_path]
+    python load_extensions.py --ocr-images [csv_path]
 
 Output:
     **/*.ts
     **/*.js
     ...
+
+    --ocr-images を指定した場合は、Tesseract で OCR する画像の glob パターン
+    （OCR_IMAGE_EXTENSIONS のうち review_mode が image でないもの）を出力する。
 """
 import csv
 import sys
 
+# Tesseract で OCR する画像の拡張子（CSV で review_mode=image を指定したものは Gemini に直接送る）
+OCR_IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg')
+IMAGE_REVIEW_MODE = 'image'
 
-def load_extension_patterns(csv_path: str = "docs/target-extensions.csv"):
-    """CSVから拡張子を読み込み、globパターンを生成"""
-    patterns = []
+
+def _read_rows(csv_path: str):
+    """CSV の各行を (拡張子, review_mode) として返す（ヘッダーの有無どちらにも対応）"""
+    rows = []
     try:
         with open(csv_path, 'r', encoding='utf-8') as f:
-            # Try DictReader first (CSV with header: extension,base_prompt,custom_prompt)
+            # Try DictReader first (CSV with header: extension,base_prompt,custom_prompt[,review_mode])
             reader = csv.DictReader(f)
             if 'extension' in reader.fieldnames:
                 for row in reader:
-                    ext = row.get('extension', '').strip()
+                    ext = (row.get('extension') or '').strip()
+                    mode = (row.get('review_mode') or '').strip().lower()
                     if ext:
-                        patterns.append(f"**/*{ext}")
+                        rows.append((ext, mode))
             else:
                 # Fallback: no header, read first column from raw rows
                 f.seek(0)
@@ -33,21 +42,51 @@ def load_extension_patterns(csv_path: str = "docs/target-extensions.csv"):
                     if not row:
                         continue
                     ext = row[0].strip()
+                    mode = row[3].strip().lower() if len(row) > 3 else ''
                     if ext:
-                        patterns.append(f"**/*{ext}")
+                        rows.append((ext, mode))
     except FileNotFoundError:
         print(f"Error: {csv_path} not found", file=sys.stderr)
         sys.exit(1)
     except Exception as e:
         print(f"Error reading CSV: {e}", file=sys.stderr)
         sys.exit(1)
-    
+    return rows
+
+
+def load_extension_patterns(csv_path: str = "docs/target-extensions.csv"):
+    """CSVから拡張子を読み込み、globパターンを生成"""
+    patterns = []
+    for ext, mode in _read_rows(csv_path):
+        patterns.append(f"**/*{ext}")
+        # 画像は大文字の拡張子（スクリーンショットの .PNG など）も対象にする
+        if mode == IMAGE_REVIEW_MODE and ext.upper() != ext:
+            patterns.append(f"**/*{ext.upper()}")
+
     if not patterns:
         print("Warning: No extensions found in CSV", file=sys.stderr)
-    
+
+    return '\n'.join(patterns)
+
+
+def load_ocr_image_patterns(csv_path: str = "docs/target-extensions.csv"):
+    """Tesseract で OCR する画像の glob パターンを生成（すべて review_mode=image の場合は空文字列）"""
+    multimodal = {ext.lower() for ext, mode in _read_rows(csv_path) if mode == IMAGE_REVIEW_MODE}
+    patterns = []
+    for ext in OCR_IMAGE_EXTENSIONS:
+        if ext in multimodal:
+            continue
+        patterns.append(f"**/*{ext}")
+        patterns.append(f"**/*{ext.upper()}")
     return '\n'.join(patterns)
 
 
 if __name__ == "__main__":
-    csv_path = sys.argv[1] if len(sys.argv) > 1 else "docs/target-extensions.csv"
-    print(load_extension_patterns(csv_path))
+    args = sys.argv[1:]
+    ocr_images = '--ocr-images' in args
+    args = [a for a in args if a != '--ocr-images']
+    csv_path = args[0] if args else "docs/target-extensions.csv"
+    if ocr_images:
+        print(load_ocr_image_patterns(csv_path))
+    else:
+        print(load_extension_patterns(csv_path))
@@ -3,11 +3,14 @@
 画像ファイルをOCR処理し、テキストファイルとして出力する（pyocr版）
 
 Usage:
-    python process_ocr.py <image_files_csv> [output_dir]
+    python process_ocr.py <image_files_csv> [output_dir] [--workers N] [--cache-dir DIR | --no-cache]
 
 Args:
     image_files_csv: カンマ区切りの画像ファイルパス
     output_dir: OCR結果の出力ベースディレクトリ（デフォルト: ocr_outputs）
+    --workers: OCR を並列に実行するプロセス数（デフォルト: 環境変数 OCR_WORKERS、未設定なら CPU 数）
+    --cache-dir: OCR 結果キャッシュのディレクトリ（デフォルト: 環境変数 OCR_RESULT_CACHE_DIR、未設定なら .ocr_result_cache）
+    --no-cache: OCR 結果キャッシュを使わない
 
 Output:
     ocr_output_dir=<出力ディレクトリパス>
@@ -15,23 +18,125 @@ Output:
 Requirements:
     pip install pyocr pillow
 """
+import multiprocessing
+import os
 import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from pathlib import Path
 from datetime import datetime, timezone, timedelta
-from PIL import Image, ImageEnhance, ImageFilter
+from PIL import Image, ImageChops, ImageFilter
 import pyocr
 import pyocr.builders
 
+from content_cache import ContentCache, build_cache_key, sha256_file
+from env_options import choice_parser, env_number, parse_positive_int, resolve_option
+from source_paths import source_relative_path
 # decode_file_paths.py から関数をインポート
 from decode_file_paths import decode_file_path
+import review_log as log
 
 # 二値化の閾値（0-255の範囲で、この値より大きいピクセルは白、以下は黒になる）
 BINARIZATION_THRESHOLD = 128
 # OCR画像前処理の定数
 CONTRAST_ENHANCEMENT_FACTOR = 2.0
+# 二値化の方式: fixed（コントラスト強調後に固定閾値）/ otsu（大津の方法）/ adaptive（局所平均との比較）
+THRESHOLD_METHODS = ('fixed', 'otsu', 'adaptive')
+# adaptive: 局所平均を取る範囲（半径ピクセル）と、局所平均からどれだけ暗ければ黒にするか
+ADAPTIVE_THRESHOLD_RADIUS = 15
+ADAPTIVE_THRESHOLD_OFFSET = 10
 
 
-def preprocess_image(image):
+def _resolve_threshold_method(explicit_method):
+    """二値化の方式を決定する（明示 -> 環境変数 OCR_THRESHOLD -> fixed）"""
+    return resolve_option(explicit_method, 'OCR_THRESHOLD', choice_parser(THRESHOLD_METHODS), 'fixed', 'threshold_method')
+
+
+def _parse_target_dpi(value):
+    """縮小の目標 DPI（0 以下は縮小しない = None）"""
+    dpi = float(str(value).strip())
+    return dpi if dpi > 0 else None
+
+
+def _resolve_target_dpi(explicit_dpi):
+    """縮小の目標 DPI を決定する（明示 -> 環境変数 OCR_TARGET_DPI -> 縮小しない）"""
+    return resolve_option(explicit_dpi, 'OCR_TARGET_DPI', _parse_target_dpi, None, 'target_dpi')
+
+
+def histogram_mean(histogram):
+    """256 階調のヒストグラムから平均輝度を返す"""
+    total = sum(histogram)
+    if not total:
+        return 0.0
+    return sum(value * count for value, count in enumerate(histogram)) / total
+
+
+def otsu_threshold(histogram):
+    """256 階調のヒストグラムから大津の方法でクラス間分散が最大になる閾値を返す"""
+    total = sum(histogram)
+    if not total:
+        return BINARIZATION_THRESHOLD
+    sum_all = sum(value * count for value, count in enumerate(histogram))
+    weight_background = 0
+    sum_background = 0
+    best_threshold = 0
+    best_variance = -1.0
+    for value, count in enumerate(histogram):
+        weight_background += count
+        if weight_background == 0:
+            continue
+        weight_foreground = total - weight_background
+        if weight_foreground == 0:
+            break
+        sum_background += value * count
+        mean_background = sum_background / weight_background
+        mean_foreground = (sum_all - sum_background) / weight_foreground
+        variance = weight_background * weight_foreground * (mean_background - mean_foreground) ** 2
+        if variance > best_variance:
+            best_variance = variance
+            best_threshold = value
+    return best_threshold
+
+
+def contrast_lut(mean, factor=CONTRAST_ENHANCEMENT_FACTOR):
+    """ImageEnhance.Contrast(image).enhance(factor) と同じ結果になる 256 要素の変換表を返す
+
+    ImageEnhance.Contrast は平均輝度（四捨五入）一色の画像とのブレンドで、0..255 に丸めて小数部を切り捨てる。
+    """
+    mean = int(mean + 0.5)
+    return [min(255, max(0, int(mean + (value - mean) * factor))) for value in range(256)]
+
+
+def threshold_lut(threshold):
+    """threshold より明るい画素を白、それ以外を黒にする 256 要素の変換表を返す"""
+    return [255 if value > threshold else 0 for value in range(256)]
+
+
+def downscale_to_dpi(image, target_dpi):
+    """画像の DPI が target_dpi より高い場合に target_dpi 相当まで縮小する（DPI 情報が無ければそのまま）"""
+    dpi = image.info.get('dpi') if hasattr(image, 'info') else None
+    if not target_dpi or not dpi:
+        return image
+    scale = target_dpi / max(float(dpi[0]), float(dpi[1]))
+    if scale >= 1:
+        return image
+    size = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+    resampling = getattr(Image, 'Resampling', Image).LANCZOS
+    return image.resize(size, resampling)
+
+
+def preprocessing_signature(threshold_method=None, target_dpi=None):
+    """前処理の結果を左右するパラメータを表す文字列を返す（OCR 結果のキャッシュキーなどに使う）"""
+    method = _resolve_threshold_method(threshold_method)
+    dpi = _resolve_target_dpi(target_dpi)
+    parts = [f"method={method}", f"dpi={dpi or 'none'}"]
+    if method == 'fixed':
+        parts.append(f"contrast={CONTRAST_ENHANCEMENT_FACTOR},sharpen,threshold={BINARIZATION_THRESHOLD}")
+    elif method == 'adaptive':
+        parts.append(f"radius={ADAPTIVE_THRESHOLD_RADIUS},offset={ADAPTIVE_THRESHOLD_OFFSET}")
+    return ';'.join(parts)
+
+
+def preprocess_image(image, threshold_method=None, target_dpi=None):
     """
     OCR精度向上のための画像前処理
 
@@ -39,34 +144,250 @@ def preprocess_image(image):
     そのため、カラー情報は失われます。カラー文字や複雑な背景を含む画像には適さない場合があります。
     単純な白黒テキスト画像や、色がOCR精度に影響しない場合にのみ適用してください。
 
+    fixed（既定）は従来と同じ順序（グレースケール化 → コントラスト強調 → シャープネス → 二値化）で、
+    同じ画素値になります。コントラスト強調は ImageEnhance.Contrast の代わりに変換表（point）で行い、
+    平均輝度の画像の生成とブレンドを省いています。
+
     Args:
         image: PIL.Image オブジェクト
+        threshold_method: 二値化の方式（THRESHOLD_METHODS。None の場合は環境変数 OCR_THRESHOLD）
+        target_dpi: この DPI を超える画像を縮小する（None の場合は環境変数 OCR_TARGET_DPI）
     Returns:
         前処理済みのPIL.Image オブジェクト
     """
-    # グレースケール化
+    method = _resolve_threshold_method(threshold_method)
+
+    # 大きな画像は先に縮小し、以降の処理の画素数を減らす
+    image = downscale_to_dpi(image, _resolve_target_dpi(target_dpi))
+
     image = image.convert('L')
-    
-    # コントラスト強調
-    enhancer = ImageEnhance.Contrast(image)
-    image = enhancer.enhance(CONTRAST_ENHANCEMENT_FACTOR)
-    
-    # シャープネス強化
+
+    if method == 'fixed':
+        # コントラスト強調 → シャープネス強化 → 固定閾値の二値化（白黒はっきりさせる）
+        image = image.point(contrast_lut(histogram_mean(image.histogram())))
+        image = image.filter(ImageFilter.SHARPEN)
+        return image.point(threshold_lut(BINARIZATION_THRESHOLD))
+
     image = image.filter(ImageFilter.SHARPEN)
-    
-    # 二値化（白黒はっきりさせる）
-    image = image.point(lambda p: 255 if p > BINARIZATION_THRESHOLD else 0)
-    
-    return image
+    if method == 'adaptive':
+        # 局所平均より OFFSET 以上暗い画素を黒にする（照明むらや背景色のある画像向け）
+        local_mean = image.filter(ImageFilter.BoxBlur(ADAPTIVE_THRESHOLD_RADIUS))
+        darkness = ImageChops.subtract(local_mean, image)
+        return darkness.point([0 if value > ADAPTIVE_THRESHOLD_OFFSET else 255 for value in range(256)])
+
+    # 大津の方法で画像ごとに閾値を決めて二値化する
+    return image.point(threshold_lut(otsu_threshold(image.histogram())))
+
+
+def _resolve_workers(explicit_workers):
+    """OCR を並列に実行するプロセス数を決定する（明示 -> 環境変数 OCR_WORKERS -> CPU 数）"""
+    return resolve_option(explicit_workers, 'OCR_WORKERS', parse_positive_int, os.cpu_count() or 1, 'workers')
+
+
+OCR_CACHE_DIR = '.ocr_result_cache'
+
+
+def open_ocr_cache(cache_dir=None):
+    """OCR 結果キャッシュを開く。
+
+    cache_dir が False の場合はキャッシュを無効にして None を返す。
+    None の場合は環境変数 OCR_RESULT_CACHE_DIR、未設定なら OCR_CACHE_DIR を使う。
+    容量と保持期間は OCR_RESULT_CACHE_MAX_MB / OCR_RESULT_CACHE_MAX_AGE_DAYS で調整できる。
+    """
+    if cache_dir is False:
+        return None
+    if not cache_dir:
+        env_dir = os.getenv('OCR_RESULT_CACHE_DIR')
+        cache_dir = env_dir.strip() if env_dir and env_dir.strip() else OCR_CACHE_DIR
+    max_mb = env_number('OCR_RESULT_CACHE_MAX_MB', 50.0)
+    max_age_days = env_number('OCR_RESULT_CACHE_MAX_AGE_DAYS', 30.0)
+    return ContentCache(
+        cache_dir,
+        max_bytes=int(max_mb * 1024 * 1024),
+        max_age_seconds=max_age_days * 24 * 60 * 60,
+    )
 
 
-def process_images_to_ocr(image_files_csv: str, output_base_dir: str = "ocr_outputs"):
+def ocr_cache_key(img_path, lang: str, tool_name: str = '') -> str:
+    """画像の内容・前処理のパラメータ・言語・OCR ツールから OCR 結果のキャッシュキーを作る
+
+    パスは含めないため、別のパスに置かれた同じ画像も同じキーになる。
+    """
+    return build_cache_key('ocr', sha256_file(img_path), preprocessing_signature(), lang, tool_name)
+
+
+# ワーカープロセスごとに 1 回だけ取得する OCR ツール
+_worker_tool = None
+
+
+def _init_ocr_worker():
+    """プロセスプールのワーカー初期化
+
+    Tesseract 自身のスレッド並列とプロセス並列が重なって CPU を取り合わないよう、
+    ワーカー内の Tesseract は 1 スレッドで動かす。
+    """
+    os.environ.setdefault('OMP_THREAD_LIMIT', '1')
+
+
+def ocr_image_file(img_path: str, lang: str, tool=None):
+    """
+    画像 1 枚を前処理して OCR する（プロセスプールのワーカーからも呼び出す）
+
+    Returns:
+        (画像パス, 抽出テキスト, エラーメッセージ)。成功時のエラーメッセージは None、失敗時のテキストは None
+    """
+    global _worker_tool
+    try:
+        if tool is None:
+            if _worker_tool is None:
+                _worker_tool = pyocr.get_available_tools()[0]
+            tool = _worker_tool
+        log.progress(f"Processing: {img_path}")
+
+        # 画像を開く
+        image = Image.open(img_path)
+
+        # 画像前処理（精度向上）
+        image = preprocess_image(image)
+
+        # OCR実行
+        text = tool.image_to_string(
+            image,
+            lang=lang,
+            builder=pyocr.builders.TextBuilder()
+        )
+        return img_path, text, None
+    except Exception as e:
+        return img_path, None, str(e)
+
+
+def iter_ocr(image_paths, lang: str, workers: int, tool=None):
+    """
+    画像群を OCR し、完了した順に (image_paths 内の番号, (画像パス, 抽出テキスト, エラーメッセージ)) を返す
+
+    workers が 2 以上かつ画像が複数ある場合はプロセスプールで並列に処理する。
+    それ以外はこのプロセス内で tool を使って順に処理する。
+    ワーカーは spawn で起動する（run_reviews のパイプラインではレビューのスレッドが gRPC やログのロックを
+    保持している最中にプールを作るため、fork すると子プロセスがロックを保持したままの状態を引き継いでデッドロックしうる）。
+    """
+    paths = [str(p) for p in image_paths]
+    if workers <= 1 or len(paths) <= 1:
+        for position, p in enumerate(paths):
+            yield position, ocr_image_file(p, lang, tool)
+        return
+    with ProcessPoolExecutor(
+        max_workers=min(workers, len(paths)),
+        initializer=_init_ocr_worker,
+        mp_context=multiprocessing.get_context('spawn'),
+    ) as executor:
+        futures = {executor.submit(ocr_image_file, p, lang): position for position, p in enumerate(paths)}
+        for future in as_completed(futures):
+            yield futures[future], future.result()
+
+
+def run_ocr(image_paths, lang: str, workers: int, tool=None):
+    """画像群を OCR し、(画像パス, 抽出テキスト, エラーメッセージ) を image_paths の順に返す（iter_ocr を参照）"""
+    results = [None] * len(image_paths)
+    for position, result in iter_ocr(image_paths, lang, workers, tool):
+        results[position] = result
+    return results
+
+
+def iter_ocr_cached(image_paths, lang: str, workers: int, tool=None, cache=None, tool_name: str = ''):
+    """
+    OCR 結果キャッシュを使って画像群を OCR し、完了した順に (image_paths 内の番号, 画像パス, テキスト, エラー) を返す
+
+    キャッシュにある画像は OCR せずに最初に返し、内容が同じ画像（別パスの重複など）は 1 回だけ OCR して
+    その完了時にまとめて返す。成功した結果はキャッシュに保存する。cache が None の場合は重複画像の集約のみ行う。
+    """
+    paths = [str(p) for p in image_paths]
+    keys = []
+    for p in paths:
+        try:
+            keys.append(ocr_cache_key(p, lang, tool_name))
+        except OSError:
+            # 読み込めない画像はキーを作らず、OCR 側でエラーとして報告させる
+            keys.append(None)
+
+    # キャッシュ済みの画像はすぐに返し、OCR が必要な画像はキーごとに最初のパスのみ OCR する
+    cached_texts = {}
+    duplicates = {}
+    pending = []
+    for index, (p, key) in enumerate(zip(paths, keys)):
+        if key is not None and key in cached_texts:
+            yield index, p, cached_texts[key], None
+            continue
+        if key is not None and key in duplicates:
+            duplicates[key].append(index)
+            continue
+        cached = cache.get(key) if cache is not None and key is not None else None
+        if cached is not None:
+            cached_texts[key] = cached
+            yield index, p, cached, None
+            continue
+        pending.append(index)
+        if key is not None:
+            duplicates[key] = []
+
+    for position, (_path, text, error) in iter_ocr([paths[i] for i in pending], lang, workers, tool):
+        index = pending[position]
+        key = keys[index]
+        if error is None and cache is not None and key is not None:
+            cache.put(key, text)
+        yield index, paths[index], text, error
+        for duplicate in duplicates.get(key, []) if key is not None else []:
+            yield duplicate, paths[duplicate], text, error
+
+
+def run_ocr_cached(image_paths, lang: str, workers: int, tool=None, cache=None, tool_name: str = ''):
+    """iter_ocr_cached の結果を (画像パス, テキスト, エラー) の形式で image_paths の順に返す"""
+    results = [None] * len(image_paths)
+    for index, path, text, error in iter_ocr_cached(image_paths, lang, workers, tool, cache, tool_name):
+        results[index] = (path, text, error)
+    return results
+
+
+def ocr_output_relative_path(img_path) -> Path:
+    """
+    OCR 結果の出力ディレクトリ内での相対パスを返す
+
+    画像のディレクトリ構成（カレントディレクトリからの相対パス）を保ち、拡張子を .txt に置き換える。
+    カレントディレクトリの外の画像の配置はレビュー Markdown と同じ（source_relative_path を参照）。
+    """
+    return source_relative_path(img_path).with_suffix('.txt')
+
+
+def assign_ocr_output_paths(image_paths):
+    """
+    画像ごとの OCR 結果の相対パスを image_paths の順に決める
+
+    同じディレクトリの同名画像（screen.png と screen.jpg など）は後の画像の出力名を `<ファイル名>.txt` にして
+    上書きを防ぐ。入力順で決まるため、同じ入力からは常に同じ出力名になる。
+    """
+    claimed = set()
+    outputs = []
+    for img_path in image_paths:
+        relative = ocr_output_relative_path(img_path)
+        if relative.as_posix().lower() in claimed:
+            relative = relative.with_name(f"{Path(img_path).name}.txt")
+        claimed.add(relative.as_posix().lower())
+        outputs.append(relative)
+    return outputs
+
+
+def process_images_to_ocr(image_files_csv: str, output_base_dir: str = "ocr_outputs", workers=None, cache_dir=None, on_output=None):
     """
     画像ファイルをOCR処理（pyocr使用）
+
+    結果は OCR が完了した順に書き出し、書き出すたびに on_output(出力ファイルパス) を呼び出す
+    （レビューを OCR と並行して始めるためのフック）。OCR 結果ファイルリストは入力順に作成する。
     
     Args:
         image_files_csv: カンマ区切りの画像ファイルパス
         output_base_dir: OCR結果の出力ベースディレクトリ
+        workers: OCR を並列に実行するプロセス数（None の場合は _resolve_workers を参照）
+        cache_dir: OCR 結果キャッシュのディレクトリ（False で無効、None の場合は open_ocr_cache を参照）
+        on_output: OCR 結果を書き出すたびに呼び出す関数（任意）
     
     Returns:
         (出力ディレクトリパス, OCR結果ファイルリストパス)
@@ -74,16 +395,16 @@ def process_images_to_ocr(image_files_csv: str, output_base_dir: str = "ocr_outp
     # Tesseractの初期化
     tools = pyocr.get_available_tools()
     if len(tools) == 0:
-        print("Error: No OCR tool found. Please install tesseract-ocr.", file=sys.stderr)
+        log.error("No OCR tool found. Please install tesseract-ocr.")
         return "", ""
     
     tool = tools[0]
-    print(f"Using OCR tool: {tool.get_name()}", file=sys.stderr)
+    log.info(f"Using OCR tool: {tool.get_name()}")
     
     # 日本語+英語でOCR
     langs = tool.get_available_languages()
     lang = 'jpn+eng' if 'jpn' in langs and 'eng' in langs else langs[0] if langs else 'eng'
-    print(f"OCR language: {lang}", file=sys.stderr)
+    log.info(f"OCR language: {lang}")
     
     # 出力ディレクトリの決定（yyyyMMdd形式、日本時間）
     date_dir = datetime.now(timezone(timedelta(hours=9))).strftime("%Y%m%d")
@@ -95,80 +416,106 @@ def process_images_to_ocr(image_files_csv: str, output_base_dir: str = "ocr_outp
         output_dir = Path(f"{base_path}_{index}")
     
     output_dir.mkdir(parents=True, exist_ok=True)
-    print(f"OCR結果ディレクトリ: {output_dir}", file=sys.stderr)
+    log.progress(f"OCR結果ディレクトリ: {output_dir}")
     
     # 画像ファイルを処理（デコード処理を追加）
     raw_files = [f.strip() for f in image_files_csv.split(',') if f.strip()]
     image_files = [decode_file_path(f) for f in raw_files]
     
     if not image_files:
-        print("Warning: No image files provided", file=sys.stderr)
+        log.warning("No image files provided")
         return "", ""
     
-    print(f"Processing {len(image_files)} image file(s)...", file=sys.stderr)
+    existing_files = []
+    for img_path in dict.fromkeys(image_files):
+        img_file = Path(img_path)
+        if not img_file.exists():
+            log.warning(f"Image not found: {img_file}", cwd=Path.cwd())
+            continue
+        existing_files.append(img_file)
+    
+    workers = min(_resolve_workers(workers), max(1, len(existing_files)))
+    log.progress(f"Processing {len(image_files)} image file(s) with {workers} worker(s)...")
     
     processed_count = 0
+    cache = open_ocr_cache(cache_dir)
+    # 画像のディレクトリ構成を保った出力先（別ディレクトリの同名画像が上書きし合わないようにする）
+    relative_outputs = assign_ocr_output_paths(existing_files)
+    written = {}
     
-    for img_path in image_files:
+    # 結果の書き込みは完了した順にこのプロセスで行う
+    for index, img_path, text, error in iter_ocr_cached(existing_files, lang, workers, tool, cache, tool.get_name()):
         img_file = Path(img_path)
-        if not img_file.exists():
-            print(f"Warning: Image not found: {img_file}", file=sys.stderr)
-            print(f"  Current working directory: {Path.cwd()}", file=sys.stderr)
+        if error is not None:
+            log.error(f"Failed to process {img_file}: {error}")
             continue
-        
         try:
-            print(f"Processing: {img_file}", file=sys.stderr)
-            
-            # 画像を開く
-            image = Image.open(img_file)
-            
-            # 画像前処理（精度向上）
-            image = preprocess_image(image)
-            
-            # OCR実行
-            text = tool.image_to_string(
-                image,
-                lang=lang,
-                builder=pyocr.builders.TextBuilder()
-            )
-            
             # 結果を保存
-            output_file = output_dir / f"{img_file.stem}.txt"
+            output_file = output_dir / relative_outputs[index]
+            output_file.parent.mkdir(parents=True, exist_ok=True)
             output_file.write_text(text, encoding='utf-8')
             
             processed_count += 1
-            print(f"OCR completed: {output_file.name} ({len(text)} chars)", file=sys.stderr)
+            written[index] = output_file
+            log.progress(f"OCR completed: {relative_outputs[index].as_posix()} ({len(text)} chars)")
             
         except Exception as e:
-            print(f"Error processing {img_file}: {e}", file=sys.stderr)
+            log.error(f"Failed to process {img_file}: {e}")
+            continue
+        if on_output is not None:
+            on_output(str(output_file))
+    if cache is not None:
+        evicted = cache.evict()
+        log.info(f"{cache.stats_line('OCR cache')} evicted={evicted}")
     
     # 処理完了メッセージ
-    print(f"Successfully processed {processed_count} of {len(image_files)} images", file=sys.stderr)
+    log.progress(f"Successfully processed {processed_count} of {len(image_files)} images")
     
-    # OCR結果ファイルリストを作成
-    ocr_files = sorted(output_dir.glob('*.txt'))
+    # OCR結果ファイルリストを作成（入力順）
+    ocr_files = [written[index] for index in sorted(written)]
     list_file = Path('ocr_files_list.txt')
     
     if ocr_files:
         with open(list_file, 'w', encoding='utf-8') as f:
             for txt_file in ocr_files:
                 f.write(f"{txt_file}\n")
-        print(f"OCR処理完了: {len(ocr_files)} ファイル生成", file=sys.stderr)
+        log.progress(f"OCR処理完了: {len(ocr_files)} ファイル生成")
         return str(output_dir), str(list_file)
     else:
-        print("Warning: OCR結果なし", file=sys.stderr)
+        log.warning("OCR結果なし")
         return "", ""
 
 
 def main():
-    if len(sys.argv) < 2:
-        print("Usage: python process_ocr.py <image_files_csv> [output_dir]", file=sys.stderr)
+    positional = []
+    workers = None
+    cache_dir = None
+    args = sys.argv[1:]
+    idx = 0
+    while idx < len(args):
+        if args[idx] == '--workers' and idx + 1 < len(args):
+            workers = args[idx + 1]
+            idx += 2
+            continue
+        if args[idx] == '--cache-dir' and idx + 1 < len(args):
+            cache_dir = args[idx + 1]
+            idx += 2
+            continue
+        if args[idx] == '--no-cache':
+            cache_dir = False
+            idx += 1
+            continue
+        positional.append(args[idx])
+        idx += 1
+
+    if not positional:
+        print("Usage: python process_ocr.py <image_files_csv> [output_dir] [--workers N] [--cache-dir DIR | --no-cache]", file=sys.stderr)
         sys.exit(1)
     
-    image_files = sys.argv[1]
-    output_dir = sys.argv[2] if len(sys.argv) > 2 else "ocr_outputs"
+    image_files = positional[0]
+    output_dir = positional[1] if len(positional) > 1 else "ocr_outputs"
     
-    ocr_dir, list_file = process_images_to_ocr(image_files, output_dir)
+    ocr_dir, list_file = process_images_to_ocr(image_files, output_dir, workers, cache_dir)
     
     # GitHub Actions出力用
     if ocr_dir:
@@ -179,7 +526,7 @@ def main():
         # （ワークフロー側で OCR 処理失敗と見なすため）
         raw_files = [f.strip() for f in image_files.split(',') if f.strip()]
         if raw_files:
-            print("Error: OCR processing failed or produced no outputs", file=sys.stderr)
+            log.error("OCR processing failed or produced no outputs")
             sys.exit(1)
 
 
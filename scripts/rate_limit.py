@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+"""
+Gemini API 呼び出し用のクライアント側レート制限とリトライ
+
+- TokenBucket / RateLimiter: リクエスト数/分・トークン数/分のトークンバケット（スレッド間で共有）
+- classify_error: 例外をリトライ可能（429/503 など）か致命的かに分類
+- call_with_retry: ジッター付き指数バックオフでリトライ。サーバーが返す待機時間の指示を優先する
+"""
+import random
+import re
+import threading
+import time
+
+# リトライ対象とする HTTP ステータスコード
+RETRYABLE_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+# google.api_core.exceptions のうちリトライ対象とする例外クラス名
+RETRYABLE_ERROR_NAMES = {
+    'ResourceExhausted',
+    'TooManyRequests',
+    'ServiceUnavailable',
+    'InternalServerError',
+    'BadGateway',
+    'GatewayTimeout',
+    'DeadlineExceeded',
+    'Aborted',
+}
+RETRYABLE = 'retryable'
+FATAL = 'fatal'
+
+# サーバーからの待機時間指示（RetryInfo / エラーメッセージ）を読み取るパターン
+_RETRY_HINT_PATTERNS = (
+    re.compile(r'retry_delay\s*\{\s*seconds:\s*(\d+)'),
+    re.compile(r'"retryDelay"\s*:\s*"([\d.]+)s"'),
+    re.compile(r'retry in ([\d.]+)\s*s', re.IGNORECASE),
+)
+
+
+class TokenBucket:
+    """一定速度で補充されるトークンバケット（スレッドセーフ）"""
+
+    def __init__(self, capacity, refill_per_second, clock=time.monotonic, sleep=time.sleep):
+        self.capacity = float(capacity)
+        self.refill_per_second = float(refill_per_second)
+        self._tokens = float(capacity)
+        self._updated = clock()
+        self._clock = clock
+        self._sleep = sleep
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        elapsed = max(0.0, now - self._updated)
+        self._tokens = min(self.capacity, self._tokens + elapsed * self.refill_per_second)
+        self._updated = now
+
+    def acquire(self, amount=1.0):
+        """amount 分のトークンが溜まるまで待ってから消費する。待機した秒数を返す
+
+        容量を超える要求はバケットが満杯になった時点で通す（永久に待たないため）。
+        """
+        amount = min(float(amount), self.capacity)
+        waited = 0.0
+        while True:
+            with self._lock:
+                self._refill(self._clock())
+                if self._tokens >= amount:
+                    self._tokens -= amount
+                    return waited
+                wait = (amount - self._tokens) / self.refill_per_second
+            self._sleep(wait)
+            waited += wait
+
+
+class RateLimiter:
+    """リクエスト数/分（rpm）とトークン数/分（tpm）の両方を満たすよう送信を待機させる
+
+    429 を受けた場合は pause() で全ワーカーの送信をまとめて止め、クォータ回復を待つ。
+    """
+
+    def __init__(self, rpm=None, tpm=None, clock=time.monotonic, sleep=time.sleep):
+        self.request_bucket = TokenBucket(rpm, rpm / 60.0, clock, sleep) if rpm else None
+        self.token_bucket = TokenBucket(tpm, tpm / 60.0, clock, sleep) if tpm else None
+        self._clock = clock
+        self._sleep = sleep
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def pause(self, seconds):
+        """指定秒数、以降の acquire を待機させる"""
+        with self._lock:
+            self._paused_until = max(self._paused_until, self._clock() + seconds)
+
+    def acquire(self, tokens=0):
+        """1 リクエスト分（推定トークン数 tokens）の送信枠を確保する。待機した秒数を返す"""
+        waited = 0.0
+        with self._lock:
+            pause = self._paused_until - self._clock()
+        if pause > 0:
+            self._sleep(pause)
+            waited += pause
+        if self.request_bucket is not None:
+            waited += self.request_bucket.acquire(1)
+        if self.token_bucket is not None and tokens:
+            waited += self.token_bucket.acquire(tokens)
+        return waited
+
+
+def _status_code(exc):
+    code = getattr(exc, 'code', None)
+    # google.api_core の例外は code に HTTP ステータス（int 互換）を持つ
+    try:
+        return int(code) if code is not None and not callable(code) else None
+    except (TypeError, ValueError):
+        return None
+
+
+def classify_error(exc):
+    """例外をリトライ可能（RETRYABLE）か致命的（FATAL）かに分類する"""
+    if isinstance(exc, (ConnectionError, TimeoutError)):
+        return RETRYABLE
+    if _status_code(exc) in RETRYABLE_STATUS_CODES:
+        return RETRYABLE
+    if type(exc).__name__ in RETRYABLE_ERROR_NAMES:
+        return RETRYABLE
+    return FATAL
+
+
+def retry_delay_hint(exc):
+    """サーバーが指示した待機秒数を返す。指示が無ければ None"""
+    response = getattr(exc, 'response', None)
+    headers = getattr(response, 'headers', None) or {}
+    retry_after = headers.get('Retry-After') if hasattr(headers, 'get') else None
+    if retry_after:
+        try:
+            return max(0.0, float(retry_after))
+        except ValueError:
+            pass
+    text = f"{exc} {getattr(exc, 'details', '')}"
+    for pattern in _RETRY_HINT_PATTERNS:
+        match = pattern.search(text)
+        if match:
+            return float(match.group(1))
+    return None
+
+
+def backoff_delay(attempt, base_delay=1.0, max_delay=60.0, rand=random.random):
+    """attempt 回目（0 始まり）のリトライ待機秒数を返す（上限付き指数バックオフ + ジッター）"""
+    ceiling = min(max_delay, base_delay * (2 ** attempt))
+    return ceiling / 2 + rand() * ceiling / 2
+
+
+def call_with_retry(
+    func,
+    limiter=None,
+    tokens=0,
+    max_retries=4,
+    base_delay=1.0,
+    max_delay=60.0,
+    on_retry=None,
+    sleep=None,
+):
+    """func() をレート制限付きで呼び出し、リトライ可能なエラーはバックオフして再試行する
+
+    致命的なエラーと、リトライ上限に達したエラーはそのまま送出する。
+    on_retry(attempt, exc, delay) はリトライ前に呼ばれる（ログ・計測用）。
+    """
+    attempt = 0
+    while True:
+        if limiter is not None:
+            limiter.acquire(tokens)
+        try:
+            return func()
+        except Exception as exc:
+            if classify_error(exc) == FATAL or attempt >= max_retries:
+                raise
+            delay = backoff_delay(attempt, base_delay, max_delay)
+            hint = retry_delay_hint(exc)
+            if hint is not None:
+                delay = max(delay, min(hint, max_delay))
+                if limiter is not None:
+                    # クォータ超過は全ワーカー共通なので、他のワーカーの送信も止める
+                    limiter.pause(delay)
+            if on_retry is not None:
+                on_retry(attempt + 1, exc, delay)
+            (sleep or time.sleep)(delay)
+            attempt += 1
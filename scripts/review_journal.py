@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+batch-review の進捗ジャーナル（出力ディレクトリの review_journal.jsonl）
+
+ファイルのレビューが完了するたびに 1 行の JSON を追記し、fsync してから次に進む。
+ワークフローのキャンセルやプロセスの異常終了で途中までしか進まなかった場合も、
+どのファイルがどの内容（SHA-256）でレビュー済みかが残るため、--resume で未完了のファイルだけを再実行できる。
+
+- ReviewJournal: 記録の追記（スレッドセーフ）と、ファイルごとの最新の記録の読み込み
+- journal_incomplete: 未完了（最新の状態が pending / failed）のファイルが残っているか
+- write_resume_key / read_resume_key: 再開してよい実行（コミット・ファイルリスト）を識別するキーの保存と読み込み
+
+ジャーナルと再開キーはリポジトリにコミットしない（.gitignore）。コミット済みのレビューディレクトリを
+別のコミットのレビューが再開することはない。
+"""
+import json
+import os
+import threading
+from datetime import datetime
+from pathlib import Path
+
+JOURNAL_FILENAME = 'review_journal.jsonl'
+JOURNAL_PENDING = 'pending'
+# 再実行しても結果が変わらない状態（スキップは予算・制限時間・ファイルサイズによる意図的なもの）
+JOURNAL_FINAL_STATUSES = ('ok', 'skipped')
+RESUME_KEY_FILENAME = '.review_resume_key'
+# 同じプロセス内で並列に実行した batch-review が同じジャーナルに書き込む行が混ざらないようにする
+_write_lock = threading.Lock()
+
+
+class ReviewJournal:
+    """出力ディレクトリの追記専用ジャーナル"""
+
+    def __init__(self, output_dir):
+        self.path = Path(output_dir) / JOURNAL_FILENAME
+
+    def record_many(self, entries):
+        """記録（file・status・sha256・review を持つ辞書）をまとめて追記し、fsync する"""
+        if not entries:
+            return
+        recorded_at = datetime.now().astimezone().isoformat(timespec='seconds')
+        lines = ''.join(
+            json.dumps({**entry, 'at': recorded_at}, ensure_ascii=False) + '\n' for entry in entries
+        )
+        with _write_lock:
+            if not self._ends_with_newline():
+                # 前回の実行が行の途中で中断していた場合は、その行と混ざらないよう改行してから追記する
+                lines = '\n' + lines
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(lines)
+                f.flush()
+                os.fsync(f.fileno())
+
+    def _ends_with_newline(self):
+        try:
+            with open(self.path, 'rb') as f:
+                f.seek(0, os.SEEK_END)
+                if f.tell() == 0:
+                    return True
+                f.seek(-1, os.SEEK_END)
+                return f.read(1) == b'\n'
+        except OSError:
+            return True
+
+    def record(self, file_path, status, sha256=None, review=None):
+        """1 ファイル分の結果を追記する"""
+        self.record_many([{'file': file_path, 'status': status, 'sha256': sha256, 'review': review}])
+
+    def latest(self):
+        """ファイルパス -> 最新の記録 を返す（ジャーナルが無い場合は空）
+
+        書き込み途中で中断した最終行など、JSON として読めない行は無視する。
+        """
+        records = {}
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue
+                    if isinstance(entry, dict) and entry.get('file'):
+                        records[entry['file']] = entry
+        except OSError:
+            pass
+        return records
+
+
+def journal_incomplete(output_dir):
+    """output_dir のジャーナルに、最新の状態が未着手（pending）・失敗のファイルがあるか"""
+    return any(
+        entry.get('status') not in JOURNAL_FINAL_STATUSES for entry in ReviewJournal(output_dir).latest().values()
+    )
+
+
+def write_resume_key(output_dir, key):
+    """output_dir を再開してよい実行のキーを保存する"""
+    (Path(output_dir) / RESUME_KEY_FILENAME).write_text(key, encoding='utf-8')
+
+
+def read_resume_key(output_dir):
+    """output_dir に保存された再開キーを返す（無い場合は None）"""
+    try:
+        return (Path(output_dir) / RESUME_KEY_FILENAME).read_text(encoding='utf-8').strip() or None
+    except OSError:
+        return None
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+レビュー系スクリプト共通のレベル付きログ出力（stderr）
+
+ログレベルは環境変数 REVIEW_LOG_LEVEL で指定する。
+- quiet: Warning / Error のみ
+- info（既定）: 進捗と、送信内容のサイズ・ハッシュ・プロンプト名などの要約
+- debug: 上記に加えて送信内容の全文などの詳細
+
+各行は `Info: メッセージ key=value ...` の形式で出力し、付加情報は key=value で後置する。
+"""
+import hashlib
+import os
+import sys
+import threading
+
+QUIET = 'quiet'
+INFO = 'info'
+DEBUG = 'debug'
+_LEVEL_ORDER = {QUIET: 0, INFO: 1, DEBUG: 2}
+
+_lock = threading.Lock()
+
+
+def log_level():
+    """現在のログレベルを返す（REVIEW_LOG_LEVEL が未設定・不正な場合は info）"""
+    level = os.getenv('REVIEW_LOG_LEVEL', '').strip().lower()
+    return level if level in _LEVEL_ORDER else INFO
+
+
+def enabled(level):
+    """level のログが出力されるか"""
+    return _LEVEL_ORDER[level] <= _LEVEL_ORDER[log_level()]
+
+
+def _format_value(value):
+    text = str(value)
+    return repr(text) if not text or any(ch.isspace() for ch in text) else text
+
+
+def _emit(prefix, message, fields):
+    line = f"{prefix}: {message}" if prefix else message
+    if fields:
+        line += ' ' + ' '.join(f"{key}={_format_value(value)}" for key, value in fields.items())
+    # 並列ワーカーからの出力が行の途中で混ざらないよう 1 行ずつ書き込む
+    with _lock:
+        print(line, file=sys.stderr, flush=True)
+
+
+def debug(message, **fields):
+    if enabled(DEBUG):
+        _emit('Debug', message, fields)
+
+
+def info(message, **fields):
+    if enabled(INFO):
+        _emit('Info', message, fields)
+
+
+def progress(message, **fields):
+    """接頭辞を付けない進捗表示（info レベル）"""
+    if enabled(INFO):
+        _emit(None, message, fields)
+
+
+def warning(message, **fields):
+    _emit('Warning', message, fields)
+
+
+def error(message, **fields):
+    _emit('Error', message, fields)
+
+
+def text_digest(text):
+    """ログ用にテキストの (文字数, UTF-8 バイト数, SHA-256 先頭 12 桁) を返す"""
+    data = text.encode('utf-8', errors='replace')
+    return len(text), len(data), hashlib.sha256(data).hexdigest()[:12]
@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+"""
+レビュー処理の計測値を集計し、出力ディレクトリの review_metrics.json に書き出す
+
+- ReviewMetrics: ファイルごとの処理時間（読み込み・プロンプト解決・リクエスト・書き込み）、
+  トークン数、リトライ回数、キャッシュヒットをスレッドセーフに記録する
+- append_metrics_run: batch-review 1 回分の計測値を review_metrics.json に追記する
+- summarize_metrics: review_metrics.json 全体の集計（GitHub Actions の出力用）を返す
+- update_review_index: レビュー対象のパスとレビュー Markdown の対応表 review_index.json を更新する
+- update_failure_manifest: レビューに失敗したファイルの一覧 review_failures.json を更新する
+"""
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+
+METRICS_FILENAME = 'review_metrics.json'
+REVIEW_INDEX_FILENAME = 'review_index.json'
+FAILURES_FILENAME = 'review_failures.json'
+# 同じプロセス内で並列に実行した batch-review が review_metrics.json を同時に書き換えないようにする
+_append_lock = threading.Lock()
+
+# ファイルごとの最新の status で数える項目（再開した実行で同じファイルを二重に数えない）
+STATUS_COUNT_KEYS = {'reviewed': 'ok', 'skipped': 'skipped', 'failed': 'failed'}
+
+# summarize_metrics で実行をまたいで集計する項目
+SUMMARY_KEYS = (
+    'files',
+    'reviewed',
+    'skipped',
+    'failed',
+    'total_seconds',
+    'request_seconds',
+    'input_tokens',
+    'cached_tokens',
+    'output_tokens',
+    'retries',
+    'cache_hits',
+    'projected_input_tokens',
+    'projected_output_tokens',
+    'projected_cost_usd',
+)
+
+
+def _rounded(value):
+    return round(value, 4) if isinstance(value, float) else value
+
+
+class ReviewMetrics:
+    """ファイル単位の計測値を記録する（スレッドセーフ）
+
+    計測値はファイルパスごとの辞書に、秒数は *_seconds、件数・トークン数は整数で加算していく。
+    """
+
+    def __init__(self, clock=time.monotonic):
+        self._clock = clock
+        self._started = clock()
+        self._started_at = datetime.now().astimezone().isoformat(timespec='seconds')
+        self._files = {}
+        self._lock = threading.Lock()
+
+    def _record(self, file_path):
+        record = self._files.get(file_path)
+        if record is None:
+            record = self._files[file_path] = {'file': file_path}
+        return record
+
+    def add(self, file_path, key, amount):
+        """file_path の key に amount を加算する"""
+        with self._lock:
+            record = self._record(file_path)
+            record[key] = record.get(key, 0) + amount
+
+    def set(self, file_path, key, value):
+        """file_path の key を value で上書きする"""
+        with self._lock:
+            self._record(file_path)[key] = value
+
+    @contextmanager
+    def timed(self, file_path, key):
+        """with ブロックの経過秒数を file_path の key に加算する"""
+        started = self._clock()
+        try:
+            yield
+        finally:
+            self.add(file_path, key, self._clock() - started)
+
+    def values(self, key):
+        """key を記録したファイルの値のリストを返す"""
+        with self._lock:
+            return [record[key] for record in self._files.values() if key in record]
+
+    def to_run(self, file_order, **fields):
+        """1 回分の実行の計測値（ファイルは file_order の順）を JSON 化できる辞書で返す"""
+        with self._lock:
+            records = [
+                {key: _rounded(value) for key, value in self._files[path].items()}
+                for path in dict.fromkeys(file_order) if path in self._files
+            ]
+        statuses = [record.get('status') for record in records]
+        run = {
+            'started_at': self._started_at,
+            'total_seconds': _rounded(self._clock() - self._started),
+            'files': len(records),
+            'reviewed': statuses.count('ok'),
+            'skipped': statuses.count('skipped'),
+            'failed': statuses.count('failed'),
+        }
+        for key in SUMMARY_KEYS:
+            if key not in run:
+                run[key] = _rounded(sum(record.get(key, 0) for record in records))
+        run.update(fields)
+        run['file_metrics'] = records
+        return run
+
+
+def load_metrics(path):
+    """review_metrics.json を読み込む。存在しない・壊れている場合は空の内容を返す"""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            metrics = json.load(f)
+        if isinstance(metrics, dict) and isinstance(metrics.get('runs'), list):
+            return metrics
+    except (OSError, ValueError):
+        pass
+    return {'runs': []}
+
+
+def save_metrics(path, metrics):
+    """一時ファイル経由で review_metrics.json を置き換える"""
+    path = Path(path)
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(metrics, f, ensure_ascii=False, indent=2)
+        f.write('\n')
+    os.replace(tmp_path, path)
+
+
+def append_metrics_run(output_dir, run):
+    """output_dir の review_metrics.json に実行 1 回分の計測値を追記し、ファイルのパスを返す"""
+    path = Path(output_dir) / METRICS_FILENAME
+    with _append_lock:
+        metrics = load_metrics(path)
+        metrics['runs'].append(run)
+        save_metrics(path, metrics)
+    return path
+
+
+def summarize_metrics(metrics):
+    """review_metrics.json に含まれる全実行の集計を返す
+
+    ファイル数と成功・スキップ・失敗の件数は、ファイルごとに最新の実行の status だけを数える
+    （--resume で同じ出力ディレクトリに実行を追記しても二重に数えない）。
+    時間・トークン数・リトライなどは実際にかかった量として全実行の合計を返す。
+    """
+    summary = {key: 0 for key in SUMMARY_KEYS}
+    latest_status = {}
+    for run in metrics.get('runs', []):
+        file_metrics = run.get('file_metrics')
+        per_file = isinstance(file_metrics, list)
+        for key in SUMMARY_KEYS:
+            # ファイルごとの記録がある実行の件数は latest_status で数える
+            if per_file and (key == 'files' or key in STATUS_COUNT_KEYS):
+                continue
+            value = run.get(key, 0)
+            if isinstance(value, (int, float)):
+                summary[key] += value
+        for record in file_metrics if per_file else []:
+            if isinstance(record, dict) and 'file' in record:
+                latest_status[record['file']] = record.get('status')
+    statuses = list(latest_status.values())
+    summary['files'] += len(statuses)
+    for key, status in STATUS_COUNT_KEYS.items():
+        summary[key] += statuses.count(status)
+    return {key: _rounded(value) for key, value in summary.items()}
+
+
+def update_review_index(output_dir, entries):
+    """output_dir の review_index.json に {source, review, status} のエントリを追加し、ファイルのパスを返す
+
+    同じ source のエントリは新しいもので置き換える。review は output_dir からの相対パス。
+    """
+    path = Path(output_dir) / REVIEW_INDEX_FILENAME
+    with _append_lock:
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                index = json.load(f)
+            reviews = index.get('reviews') if isinstance(index, dict) else None
+        except (OSError, ValueError):
+            reviews = None
+        merged = {entry['source']: entry for entry in (reviews if isinstance(reviews, list) else [])}
+        for entry in entries:
+            merged[entry['source']] = entry
+        save_metrics(path, {'reviews': list(merged.values())})
+    return path
+
+
+def update_failure_manifest(output_dir, failures, sources):
+    """output_dir の review_failures.json を更新し、残っている失敗の件数を返す
+
+    sources（今回レビューしたファイル）の既存エントリを取り除いてから failures（{source, review, error, attempts}）を追加する。
+    再実行で成功したファイルは一覧から消える。失敗が無く、ファイルも無い場合は作成しない。
+    """
+    path = Path(output_dir) / FAILURES_FILENAME
+    sources = set(sources)
+    with _append_lock:
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+            existing = manifest.get('failures') if isinstance(manifest, dict) else None
+        except (OSError, ValueError):
+            existing = None
+        if existing is None and not failures:
+            return 0
+        merged = {
+            entry['source']: entry
+            for entry in (existing if isinstance(existing, list) else [])
+            if isinstance(entry, dict) and entry.get('source') not in sources
+        }
+        for entry in failures:
+            merged[entry['source']] = entry
+        save_metrics(path, {'failures': list(merged.values())})
+    return len(merged)
@@ -3,26 +3,86 @@
 コードファイルとOCR結果のレビューを実行
 
 Usage:
-    python run_reviews.py
+    python run_reviews.py [--diff-base <rev>] [--resume]
 
 Environment Variables:
     GEMINI_API_KEY: Gemini APIキー（必須）
     GEMINI_MODEL: 使用するGeminiモデル（任意）
     REVIEW_BASE_DIR: レビュー結果の出力ベースディレクトリ（デフォルト: review）
+    REVIEW_PARALLEL_LISTS: false にするとコードと OCR 結果のレビューを順に実行する（デフォルト: 並列）
+    REVIEW_LOG_LEVEL: ログの詳細度 quiet / info / debug（デフォルト: info。debug のみ送信内容の全文を出力）
+    REVIEW_DIFF_BASE: 指定するとコードファイルはこのリビジョンからの変更ハンクのみをレビューする（任意）
+    REVIEW_OCR_IMAGES: カンマ区切りの画像パス。指定すると OCR もこのプロセスで行い、OCR が完了した画像から
+        順にレビューする（process_ocr.py を別に実行しない。任意）
+    REVIEW_RESUME: true にすると、同じコミット・同じファイルリストで中断したレビューディレクトリを再利用し、
+        ジャーナル（review_journal.jsonl）でレビュー済みのファイルを再実行しない（--resume と同じ。任意）
 
 Output:
     files_to_commit=review/yyyyMMdd_N
     review_count=5
+    ocr_output_dir=ocr_outputs/yyyyMMdd（REVIEW_OCR_IMAGES を指定した場合のみ）
+    metrics_total_seconds=12.3 など（review_metrics.json の合計。metrics_ 接頭辞付き）
 """
 import sys
 import os
+import queue
 import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from datetime import datetime
 
+from content_cache import build_cache_key
+from review_journal import JOURNAL_FILENAME, journal_incomplete, read_resume_key, write_resume_key
+from review_metrics import FAILURES_FILENAME, METRICS_FILENAME, load_metrics, save_metrics, summarize_metrics
 
-def determine_review_dir(base_dir: str = "review") -> Path:
-    """日付ベースのレビューディレクトリを決定"""
+
+def _git_head() -> str:
+    try:
+        result = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True)
+    except (OSError, subprocess.CalledProcessError):
+        return ''
+    return result.stdout.strip()
+
+
+def resume_key(code_list: str = 'decoded_files.txt', ocr_list: str = 'ocr_files_list.txt', diff_base: str = None) -> str:
+    """再開してよいレビューディレクトリを識別するキー（コミット・レビュー対象のファイルリスト・差分の比較元）"""
+    parts = [os.getenv('GITHUB_SHA', '').strip() or _git_head(), diff_base or '', _pipeline_images()]
+    for p in (code_list, ocr_list):
+        try:
+            parts.append(Path(p).read_bytes())
+        except OSError:
+            parts.append(b'')
+    return build_cache_key('review-resume', *parts)
+
+
+def find_resumable_review_dir(base_dir: str = "review", key: str = None):
+    """再開キーが key と一致し、ジャーナルに未完了のファイルが残っているレビューディレクトリを返す（無ければ None）
+
+    キーの無いディレクトリ（コミット済みの過去のレビューなど）や別のコミット・ファイルリストのものは再開しない。
+    """
+    base_path = Path(base_dir)
+    if not key or not base_path.is_dir():
+        return None
+    journals = sorted(
+        (p for p in base_path.glob(f"*/{JOURNAL_FILENAME}") if p.is_file()),
+        key=lambda p: p.stat().st_mtime,
+        reverse=True,
+    )
+    for journal in journals:
+        if read_resume_key(journal.parent) == key and journal_incomplete(journal.parent):
+            return journal.parent
+    return None
+
+
+def determine_review_dir(base_dir: str = "review", resume: bool = False, key: str = None) -> Path:
+    """日付ベースのレビューディレクトリを決定（resume の場合は同じキーで中断したレビューのディレクトリを優先する）"""
+    if resume:
+        resumable = find_resumable_review_dir(base_dir, key)
+        if resumable is not None:
+            print(f"中断したレビューを再開: {resumable}", file=sys.stderr)
+            return resumable
     date_dir = datetime.now().strftime("%Y%m%d")
     base_path = Path(base_dir) / date_dir
     output_dir = base_path
@@ -32,6 +92,8 @@ def determine_review_dir(base_dir: str = "review") -> Path:
         output_dir = Path(f"{base_path}_{index}")
     
     output_dir.mkdir(parents=True, exist_ok=True)
+    if resume and key:
+        write_resume_key(output_dir, key)
     print(f"レビュー結果ディレクトリ: {output_dir}", file=sys.stderr)
     return output_dir
 
@@ -40,8 +102,11 @@ def _has_review_targets(code_list: str = 'decoded_files.txt', ocr_list: str = 'o
     """デコード済みファイルリストまたはOCRファイルリストに実際のレビュー対象が含まれているか判定する
 
     - 指定ファイルが存在し、かつ空行以外の行がある場合に True を返す
+    - REVIEW_OCR_IMAGES に画像が指定されている場合も True を返す
     - 存在しない / 空のみ の場合は False を返す
     """
+    if _pipeline_images():
+        return True
     for p in (code_list, ocr_list):
         path = Path(p)
         if not path.exists():
@@ -57,41 +122,147 @@ def _has_review_targets(code_list: str = 'decoded_files.txt', ocr_list: str = 'o
     return False
 
 
-def run_batch_review(file_list: str, output_dir: Path, use_prompt_map: bool = False) -> bool:
-    """バッチレビューを実行"""
-    if not Path(file_list).exists():
+def resolve_diff_base(argv=None) -> str:
+    """差分レビューの比較元リビジョンを決定する（--diff-base 引数 -> REVIEW_DIFF_BASE -> なし）"""
+    argv = sys.argv[1:] if argv is None else argv
+    for index, arg in enumerate(argv):
+        if arg == '--diff-base' and index + 1 < len(argv):
+            return argv[index + 1].strip() or None
+    return os.getenv('REVIEW_DIFF_BASE', '').strip() or None
+
+
+def resolve_resume(argv=None) -> bool:
+    """中断したレビューを再開するか（--resume 引数 -> REVIEW_RESUME -> 無効）"""
+    argv = sys.argv[1:] if argv is None else argv
+    if '--resume' in argv:
+        return True
+    return os.getenv('REVIEW_RESUME', '').strip().lower() in ('1', 'true', 'yes')
+
+
+_session = None
+
+
+def _review_session():
+    """プロセス内で共有する gemini_cli_wrapper とレビューセッションを返す（初回のみ import・作成する）"""
+    global _session
+    import gemini_cli_wrapper
+    if _session is None:
+        _session = gemini_cli_wrapper.ReviewSession()
+    return gemini_cli_wrapper, _session
+
+
+def run_batch_review(
+    file_list: str,
+    output_dir: Path,
+    use_prompt_map: bool = False,
+    diff_base: str = None,
+    file_source=None,
+    resume: bool = False,
+) -> bool:
+    """バッチレビューを実行
+
+    gemini_cli_wrapper をこのプロセス内で呼び出し、genai の設定・アップロード済みプロンプト・
+    レート制限は同じプロセス内の他のバッチレビューと共有する。
+    file_source を渡すと file_list の代わりに file_source から届くファイルを順にレビューする。
+    resume を有効にすると output_dir のジャーナルでレビュー済みのファイルは再実行しない。
+    """
+    if file_source is None and not Path(file_list).exists():
         return False
     
     try:
-        cmd = [
-            'python', 'scripts/gemini_cli_wrapper.py', 'batch-review',
+        gemini_cli_wrapper, session = _review_session()
+        gemini_cli_wrapper.batch_review_files(
             file_list,
             str(output_dir),
-            '--default-prompt', 'docs/instruction-review.md',
-            '--default-custom', 'docs/instruction-review-custom.md'
-        ]
-        if use_prompt_map:
-            cmd.extend(['--prompt-map', 'docs/target-extensions.csv'])
-
-        result = subprocess.run(cmd, capture_output=True, text=True)
-        
-        if result.returncode != 0:
-            print(f"Error during review: {result.stderr}", file=sys.stderr)
-            return False
-        
-        # 標準出力をそのまま表示
-        if result.stdout:
-            print(result.stdout, file=sys.stderr)
-        
+            default_prompt_path='docs/instruction-review.md',
+            default_custom_prompt_path='docs/instruction-review-custom.md',
+            prompt_map_path='docs/target-extensions.csv' if use_prompt_map else None,
+            diff_base=diff_base,
+            session=session,
+            file_source=file_source,
+            resume=resume,
+        )
         return True
+    except SystemExit as e:
+        # batch_review_files はレビュー失敗時に CLI と同じく sys.exit(1) する
+        if e.code in (None, 0):
+            return True
+        print(f"Error during review: batch-review exited with status {e.code}", file=sys.stderr)
+        return False
     except Exception as e:
         print(f"Error executing batch review: {e}", file=sys.stderr)
         return False
 
 
+def _pipeline_images() -> str:
+    """OCR とレビューをパイプラインで実行する画像（REVIEW_OCR_IMAGES、カンマ区切り）を返す"""
+    return os.getenv('REVIEW_OCR_IMAGES', '').strip()
+
+
+def run_pipelined_ocr_review(image_files_csv: str, output_dir: Path, ocr_base_dir: str = 'ocr_outputs', resume: bool = False):
+    """画像の OCR とレビューをパイプラインで実行し、(成功したか, OCR 結果ディレクトリ) を返す
+
+    OCR は別スレッドで実行し、OCR 結果が書き出されるたびにキュー経由でレビューに渡す。
+    全画像の OCR を待たずにレビューを始めるため、OCR と Gemini へのリクエストの待ち時間が重なる。
+    """
+    import process_ocr
+
+    ready = queue.Queue()
+    finished = object()
+    ocr_result = {'dir': ''}
+
+    def ocr_worker():
+        try:
+            ocr_result['dir'], _list_file = process_ocr.process_images_to_ocr(
+                image_files_csv, ocr_base_dir, on_output=ready.put,
+            )
+        except Exception as e:
+            print(f"Error during OCR: {e}", file=sys.stderr)
+        finally:
+            ready.put(finished)
+
+    def arriving_files():
+        while True:
+            item = ready.get()
+            if item is finished:
+                return
+            yield item
+
+    thread = threading.Thread(target=ocr_worker, name='ocr-pipeline', daemon=True)
+    thread.start()
+    success = run_batch_review(None, output_dir, file_source=arriving_files(), resume=resume)
+    thread.join()
+    if not ocr_result['dir']:
+        print("Error: OCR processing failed or produced no outputs", file=sys.stderr)
+        success = False
+    return success, ocr_result['dir']
+
+
+def _parallel_lists_enabled() -> bool:
+    """コードと OCR 結果のファイルリストを並列にレビューするか（REVIEW_PARALLEL_LISTS、既定 有効）"""
+    return os.getenv('REVIEW_PARALLEL_LISTS', 'true').strip().lower() not in ('0', 'false', 'no')
+
+
+def record_orchestration(output_dir: Path, batches: list, total_seconds: float) -> dict:
+    """バッチごとの所要時間を review_metrics.json に追記し、全体の集計値を返す"""
+    metrics_path = output_dir / METRICS_FILENAME
+    metrics = load_metrics(metrics_path)
+    metrics['orchestrator'] = {
+        'total_seconds': round(total_seconds, 4),
+        'batches': batches,
+    }
+    try:
+        save_metrics(metrics_path, metrics)
+    except OSError as e:
+        print(f"Warning: Failed to write review metrics: {e}", file=sys.stderr)
+    summary = summarize_metrics(metrics)
+    summary['wall_seconds'] = round(total_seconds, 4)
+    return summary
+
+
 def count_reviews(output_dir: Path) -> int:
-    """生成されたレビューファイル数をカウント"""
-    return len(list(output_dir.glob('*.md')))
+    """生成されたレビューファイル数をカウント（ソースのディレクトリ構成を保ったサブディレクトリも含む）"""
+    return len(list(output_dir.rglob('*.md')))
 
 
 def main():
@@ -110,29 +281,58 @@ def main():
     
     # レビューディレクトリ決定
     review_base = os.getenv('REVIEW_BASE_DIR', 'review')
-    output_dir = determine_review_dir(review_base)
-    
-    # コードファイルのレビュー
+    resume = resolve_resume()
+    diff_base = resolve_diff_base()
+    output_dir = determine_review_dir(review_base, resume, resume_key(diff_base=diff_base) if resume else None)
+    started = time.monotonic()
+
+    ocr_outputs = {}
+
+    def run_pipeline(image_files_csv):
+        success, ocr_outputs['dir'] = run_pipelined_ocr_review(image_files_csv, output_dir, resume=resume)
+        return success
+
+    def timed_batch(file_list, runner):
+        batch_started = time.monotonic()
+        success = runner()
+        return {'file_list': file_list, 'seconds': round(time.monotonic() - batch_started, 4), 'success': success}
+
+    # (ファイルリスト, 失敗時のメッセージ, レビューを実行して成否を返す関数)
+    # コードファイルは拡張子マップを使う。OCR結果はリポジトリ外の生成物のため差分レビューの対象外
+    targets = []
     code_files = 'decoded_files.txt'
     if Path(code_files).exists():
         print(f"コードファイルのレビューを開始: {code_files}", file=sys.stderr)
-        success = run_batch_review(code_files, output_dir, use_prompt_map=True)
-        if not success:
-            print("Error: Batch review for code files failed.", file=sys.stderr)
-            sys.exit(1)
-    
-    # OCR結果のレビュー
+        targets.append((
+            code_files,
+            "Error: Batch review for code files failed.",
+            lambda: run_batch_review(code_files, output_dir, use_prompt_map=True, diff_base=diff_base, resume=resume),
+        ))
     ocr_files = 'ocr_files_list.txt'
-    if Path(ocr_files).exists():
+    pipeline_images = _pipeline_images()
+    if pipeline_images:
+        print("画像の OCR とレビューをパイプラインで開始", file=sys.stderr)
+        targets.append(('ocr-pipeline', "Error: OCR pipeline review failed.", lambda: run_pipeline(pipeline_images)))
+    elif Path(ocr_files).exists():
         print(f"OCR結果のレビューを開始: {ocr_files}", file=sys.stderr)
-        success = run_batch_review(ocr_files, output_dir)
-        if not success:
-            print("Error: Batch review for OCR files failed.", file=sys.stderr)
-            sys.exit(1)
-    
+        targets.append((ocr_files, "Error: Batch review for OCR files failed.", lambda: run_batch_review(ocr_files, output_dir, resume=resume)))
+
+    # 一方のバッチが失敗しても他方は実行し、成功したレビューはコミットできるよう出力してから非ゼロ終了する
+    if len(targets) > 1 and _parallel_lists_enabled():
+        # 同じプロセス内のレビューセッション（プロンプト・レート制限・同時送信数の上限）を共有したまま並列に実行する
+        with ThreadPoolExecutor(max_workers=len(targets)) as executor:
+            futures = [executor.submit(timed_batch, file_list, runner) for file_list, _message, runner in targets]
+            batches = [future.result() for future in futures]
+    else:
+        batches = [timed_batch(file_list, runner) for file_list, _message, runner in targets]
+    if pipeline_images:
+        print(f"ocr_output_dir={ocr_outputs.get('dir', '')}")
+    failure_messages = [message for batch, (_file_list, message, _runner) in zip(batches, targets) if not batch['success']]
+
     # 結果カウント
     review_count = count_reviews(output_dir)
     print(f"生成されたレビューファイル数: {review_count}", file=sys.stderr)
+    summary = record_orchestration(output_dir, batches, time.monotonic() - started)
     
     # GitHub Actions出力
     if review_count > 0:
@@ -141,6 +341,19 @@ def main():
     else:
         print("files_to_commit=")
         print("review_count=0")
+    for key, value in summary.items():
+        print(f"metrics_{key}={value}")
+
+    if failure_messages:
+        for message in failure_messages:
+            print(message, file=sys.stderr)
+        if review_count > 0:
+            print(
+                f"Error: Some reviews failed; see {FAILURES_FILENAME} in {output_dir}. "
+                "Completed reviews are still reported in files_to_commit.",
+                file=sys.stderr,
+            )
+        sys.exit(1)
 
 
 if __name__ == "__main__":
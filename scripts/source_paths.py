@@ -0,0 +1,29 @@
+#!/usr/bin/env python3
+"""
+入力ファイルのパスから出力先の相対パスを決める
+
+レビュー Markdown（gemini_cli_wrapper.py）と OCR 結果（process_ocr.py）は、入力のディレクトリ構成を保って
+出力する。どちらも同じ規則で配置し、チェックアウト先の絶対パスによって出力先が変わらないようにする。
+"""
+import os
+from pathlib import Path
+
+from content_cache import sha256_bytes
+
+EXTERNAL_DIR = '_external'
+
+
+def source_relative_path(file_path) -> Path:
+    """入力ファイルの、カレントディレクトリからの相対パスを返す
+
+    カレントディレクトリの外のファイルは `_external/<親ディレクトリの相対パスのハッシュ>/<ファイル名>` にする。
+    ハッシュには絶対パスではなくカレントディレクトリからの相対パス（../shared など）を使うため、
+    リポジトリを別の場所にチェックアウトしても同じ出力先になる。
+    """
+    path = Path(file_path).resolve()
+    cwd = Path.cwd().resolve()
+    try:
+        return path.relative_to(cwd)
+    except ValueError:
+        parent_hash = sha256_bytes(Path(os.path.relpath(path.parent, cwd)).as_posix().encode('utf-8'))[:12]
+        return Path(EXTERNAL_DIR) / parent_hash / path.name
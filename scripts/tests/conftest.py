@@ -0,0 +1,36 @@
+import os
+import sys
+import types
+from pathlib import Path
+
+import pytest
+
+# scripts/ 配下のスクリプトは同じディレクトリのモジュールをトップレベル名で import するため、
+# テスト実行時も scripts/ を import パスに含める
+SCRIPTS_DIR = Path(__file__).resolve().parents[1]
+if str(SCRIPTS_DIR) not in sys.path:
+    sys.path.insert(0, str(SCRIPTS_DIR))
+
+# google-generativeai が無い環境でも gemini_cli_wrapper を import できるよう、テストモジュールの import 前に
+# 空の google.generativeai を登録する（登録済みならそれを使う）。API を呼ぶテストは fake_genai で差し替える
+_google = sys.modules.setdefault('google', types.ModuleType('google'))
+_google.generativeai = sys.modules.setdefault('google.generativeai', types.ModuleType('google.generativeai'))
+
+
+@pytest.fixture
+def fake_genai(monkeypatch):
+    """gemini_cli_wrapper が参照する genai をネットワークに接続しない stub に差し替える
+
+    テスト側で GenerativeModel を設定して利用する。
+    """
+    import scripts.gemini_cli_wrapper as gcw
+
+    fake = types.SimpleNamespace(
+        configure=lambda api_key: None,
+        upload_file=lambda path: types.SimpleNamespace(name=f"fileid-{os.path.basename(path)}"),
+        get_file=lambda name: types.SimpleNamespace(name=name, state=types.SimpleNamespace(name='ACTIVE')),
+        GenerativeModel=None,
+    )
+    monkeypatch.setattr(gcw, 'genai', fake)
+    monkeypatch.setenv('GEMINI_API_KEY', 'dummy')
+    return fake
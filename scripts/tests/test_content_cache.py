@@ -0,0 +1,47 @@
+import os
+import time
+
+from scripts.content_cache import ContentCache, build_cache_key
+
+
+def test_cache_roundtrip_counts_hits_and_misses(tmp_path):
+    cache = ContentCache(tmp_path / 'cache', suffix='.md')
+    key = build_cache_key('model', 'prompt-hash', b'print(1)\n')
+
+    assert cache.get(key) is None
+    cache.put(key, '# review')
+    assert cache.get(key) == '# review'
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_cache_key_changes_with_any_part():
+    base = build_cache_key('model', 'p', b'code')
+    assert base != build_cache_key('model2', 'p', b'code')
+    assert base != build_cache_key('model', 'p2', b'code')
+    assert base != build_cache_key('model', 'p', b'code2')
+    # 要素の境界をずらしても同じキーにならない
+    assert build_cache_key('ab', 'c') != build_cache_key('a', 'bc')
+
+
+def test_evict_removes_expired_and_least_recently_used(tmp_path):
+    cache = ContentCache(tmp_path, max_bytes=10, max_age_seconds=3600)
+    cache.put('old', 'x' * 4)
+    cache.put('mid', 'y' * 4)
+    cache.put('new', 'z' * 4)
+    now = time.time()
+    os.utime(tmp_path / 'old.txt', (now - 7200, now - 7200))
+    os.utime(tmp_path / 'mid.txt', (now - 60, now - 60))
+
+    removed = cache.evict()
+
+    assert removed == 1
+    assert cache.get('old') is None
+    assert cache.get('new') == 'zzzz'
+    assert cache.get('mid') == 'yyyy'
+
+    # 容量上限を下げると最も古く参照されたものから削除される
+    os.utime(tmp_path / 'mid.txt', (now - 60, now - 60))
+    cache.max_bytes = 6
+    assert cache.evict() == 1
+    assert cache.get('mid') is None
+    assert cache.get('new') == 'zzzz'
@@ -0,0 +1,40 @@
+import pytest
+
+import env_options
+from token_preflight import resolve_prices, resolve_token_counter
+
+
+def test_resolve_option_prefers_explicit_then_env_and_names_bad_source(monkeypatch, capsys):
+    monkeypatch.setenv('TEST_OPTION', ' 7 ')
+    assert env_options.resolve_option(None, 'TEST_OPTION', int, 1) == 7
+    assert env_options.resolve_option('3', 'TEST_OPTION', int, 1) == 3
+    assert env_options.resolve_option('  ', 'TEST_OPTION', int, 1) == 7
+    monkeypatch.setenv('TEST_OPTION', 'x')
+    assert env_options.resolve_option('bad', 'TEST_OPTION', int, 1, 'retries') == 1
+
+    err = capsys.readouterr().err
+    assert "Invalid explicit retries ignored: 'bad'" in err
+    assert "Invalid env TEST_OPTION ignored: 'x'" in err
+
+
+def test_parsers_clamp_and_validate():
+    assert env_options.parse_count('-2') == 0
+    assert env_options.parse_ratio('1.5') == 1.0
+    assert env_options.parse_flag('Yes') is True and env_options.parse_flag(False) is False
+    assert env_options.choice_parser(('fifo', 'sjf'))('SJF') == 'sjf'
+    with pytest.raises(ValueError):
+        env_options.choice_parser(('fifo', 'sjf'))('ljf')
+    with pytest.raises(ValueError):
+        env_options.parse_positive_int('0')
+
+
+def test_token_preflight_uses_shared_resolution(monkeypatch, capsys):
+    monkeypatch.setenv('GEMINI_TOKEN_COUNTER', 'API')
+    assert resolve_token_counter(None) == 'api'
+    assert resolve_token_counter('bogus') == 'api'
+    monkeypatch.setenv('GEMINI_INPUT_PRICE_PER_M', 'cheap')
+    assert resolve_prices('gemini-2.5-flash') == (0.30, 2.50)
+
+    err = capsys.readouterr().err
+    assert "Invalid explicit token_counter ignored: 'bogus'" in err
+    assert "Invalid env GEMINI_INPUT_PRICE_PER_M ignored: 'cheap'" in err
@@ -0,0 +1,75 @@
+import json
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / 'benchmarks'))
+import gemini_cli_wrapper  # noqa: E402
+from fake_gemini import FakeApiError, FakeGemini, LatencyModel  # noqa: E402
+from rate_limit import RETRYABLE, classify_error, retry_delay_hint  # noqa: E402
+import review_throughput_benchmark  # noqa: E402
+from review_throughput_benchmark import percentile, run_benchmark  # noqa: E402
+
+
+def test_fake_backend_errors_streaming_and_uploads():
+    fake = FakeGemini(error_rates={429: 1.0}, retry_delay=3, seed=1, sleep=lambda seconds: None)
+    model = fake.GenerativeModel('gemini-2.5-flash')
+    with pytest.raises(FakeApiError) as excinfo:
+        model.generate_content(['File: a.py'])
+    assert classify_error(excinfo.value) == RETRYABLE
+    assert retry_delay_hint(excinfo.value) == 3
+
+    fake.error_rates = {}
+    packed = "=== id=1 File: a.py ===\nx\n=== id=2 File: b.py ===\ny"
+    response = model.generate_content([packed], stream=True)
+    text = ''.join(chunk.text for chunk in response)
+    assert '<<<REVIEW-BEGIN id=1>>>' in text and '<<<REVIEW-END id=2>>>' in text
+    assert response.usage_metadata.candidates_token_count == fake.output_tokens
+
+    uploaded = fake.upload_file('prompt.md')
+    assert uploaded.state.name == 'PROCESSING'
+    assert fake.get_file(uploaded.name).state.name == 'ACTIVE'
+    fake.delete_file(uploaded.name)
+    with pytest.raises(FakeApiError):
+        fake.get_file(uploaded.name)
+    assert LatencyModel.parse('uniform:1:0.5').sample(fake._rng) == pytest.approx(1, abs=0.5)
+
+
+@pytest.mark.parametrize('driver, stream', [('batch', False), ('run_reviews', True)])
+def test_benchmark_reviews_every_file_despite_injected_failures(monkeypatch, driver, stream):
+    monkeypatch.setattr(gemini_cli_wrapper, 'genai', gemini_cli_wrapper.genai)
+    monkeypatch.setattr('time.sleep', lambda seconds: None)
+
+    result = run_benchmark(
+        file_count=12,
+        driver=driver,
+        concurrency=4,
+        latency=LatencyModel('fixed', 0.0),
+        error_rates={429: 0.2, 503: 0.1},
+        stream=stream,
+        disconnect_rate=0.2 if stream else 0.0,
+        seed=3,
+    )
+
+    assert result['reviews'] == 12
+    assert result['requests'] > 12
+    assert result['peak_rss_mb'] > 0
+    assert percentile([1, 2, 3, 4, 5], 0.5) == 3
+
+
+@pytest.mark.parametrize('driver', ['batch', 'run_reviews'])
+def test_benchmark_reports_timings_when_the_driver_exits_nonzero(monkeypatch, tmp_path, capsys, driver):
+    monkeypatch.setattr('time.sleep', lambda seconds: None)
+    monkeypatch.setenv('GEMINI_MAX_RETRIES', '0')
+    json_path = tmp_path / 'bench.json'
+    monkeypatch.setattr(sys, 'argv', [
+        'review_throughput_benchmark.py', '--files', '10', '--driver', driver, '--concurrency', '2',
+        '--latency', 'fixed:0', '--error-429', '1', '--json', str(json_path),
+    ])
+
+    review_throughput_benchmark.main()
+
+    [result] = json.loads(json_path.read_text(encoding='utf-8'))
+    assert result['exit_code'] == 1 and result['reviews'] >= 10 and result['seconds'] > 0
+    assert f"driver={driver}" in capsys.readouterr().out
@@ -1,21 +1,15 @@
 import os
 import json
+import time
 from pathlib import Path
 
 import pytest
-import sys
 import types
 
-# Ensure a fake google.generativeai exists during import
-google = types.ModuleType('google')
-google.generativeai = types.ModuleType('google.generativeai')
-sys.modules['google'] = google
-sys.modules['google.generativeai'] = google.generativeai
-
 import scripts.gemini_cli_wrapper as gcw
 
 
-def test_prompt_cache_roundtrip(tmp_path, monkeypatch):
+def test_prompt_cache_roundtrip(tmp_path, monkeypatch, fake_genai):
     # set working dir to tmp
     monkeypatch.chdir(tmp_path)
     # ensure no cache file exists
@@ -27,26 +21,103 @@ def test_prompt_cache_roundtrip(tmp_path, monkeypatch):
 
     def fake_upload(path):
         called['uploads'] += 1
-        return f"fileid-{os.path.basename(path)}"
+        return types.SimpleNamespace(name=f"fileid-{os.path.basename(path)}-{called['uploads']}")
 
-    # monkeypatch upload_prompt_file to the fake (but keep original cache handling)
-    monkeypatch.setattr(gcw, 'upload_prompt_file', fake_upload)
+    fake_genai.upload_file = fake_upload
 
     paths = [str(tmp_path / 'p1.md'), str(tmp_path / 'p2.md')]
     for p in paths:
         Path(p).write_text('# prompt')
 
-    # First call -> should call upload
+    # First call -> should call upload and persist the cache
     uploaded_map = gcw.upload_prompt_files(paths)
     assert called['uploads'] == 2
     assert len(uploaded_map) == 2
-
-    # Save a cache file like the module would have done, to simulate persistence across runs
-    cache = {str(Path(p).resolve()): f"fileid-{os.path.basename(p)}" for p in paths}
-    cache_file.write_text(json.dumps(cache, ensure_ascii=False, indent=2), encoding='utf-8')
+    cache = json.loads(cache_file.read_text(encoding='utf-8'))
+    entry = cache[str(Path(paths[0]).resolve())]
+    assert entry['file_id'] == uploaded_map[str(Path(paths[0]).resolve())]
+    assert entry['sha256'] and entry['expires_at'] > entry['uploaded_at']
 
     # Now simulate calling again; cache file exists so our fake upload should not be called
     called['uploads'] = 0
     uploaded_map2 = gcw.upload_prompt_files(paths)
     assert called['uploads'] == 0
-    assert 'p1.md' in uploaded_map2[list(uploaded_map2.keys())[0]] or len(uploaded_map2) == 2
\ No newline at end of file
+    assert uploaded_map2 == uploaded_map
+
+
+def test_prompt_cache_refreshes_changed_and_expiring_entries(tmp_path, monkeypatch, fake_genai):
+    monkeypatch.chdir(tmp_path)
+    uploads = []
+
+    def fake_upload(path):
+        uploads.append(os.path.basename(path))
+        return types.SimpleNamespace(name=f"fileid-{len(uploads)}")
+
+    fake_genai.upload_file = fake_upload
+    p1, p2, p3 = (tmp_path / 'p1.md', tmp_path / 'p2.md', tmp_path / 'p3.md')
+    for p in (p1, p2, p3):
+        p.write_text('# prompt', encoding='utf-8')
+    gcw.upload_prompt_files([str(p1), str(p2), str(p3)])
+    assert len(uploads) == 3
+
+    # p1: edited, p2: expiring soon, p3: legacy cache format (file_id only)
+    p1.write_text('# edited prompt', encoding='utf-8')
+    cache_file = tmp_path / '.prompt_upload_cache.json'
+    cache = json.loads(cache_file.read_text(encoding='utf-8'))
+    cache[str(p2)]['expires_at'] = time.time() + 60
+    cache[str(p3)] = cache[str(p3)]['file_id']
+    cache_file.write_text(json.dumps(cache), encoding='utf-8')
+
+    uploads.clear()
+    uploaded = gcw.upload_prompt_files([str(p1), str(p2), str(p3)])
+
+    assert sorted(uploads) == ['p1.md', 'p2.md', 'p3.md']
+    refreshed = json.loads(cache_file.read_text(encoding='utf-8'))
+    for p in (p1, p2, p3):
+        assert refreshed[str(p)]['file_id'] == uploaded[str(p)]
+    assert not list(tmp_path.glob('*.tmp'))
+
+
+def test_upload_polls_pending_files_together_and_reuses_file_objects(tmp_path, monkeypatch, fake_genai):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr('time.sleep', lambda seconds: None)
+    polls = {}
+
+    def fake_upload(path):
+        return types.SimpleNamespace(name=f"fileid-{os.path.basename(path)}")
+
+    def fake_get_file(name):
+        polls[name] = polls.get(name, 0) + 1
+        if name == 'fileid-gone':
+            raise Exception('404 File not found')
+        # 2 回目の確認で ACTIVE になる
+        state = 'ACTIVE' if polls[name] >= 2 else 'PROCESSING'
+        return types.SimpleNamespace(name=name, state=types.SimpleNamespace(name=state))
+
+    fake_genai.upload_file = fake_upload
+    fake_genai.get_file = fake_get_file
+    paths = [tmp_path / 'p1.md', tmp_path / 'p2.md']
+    for p in paths:
+        p.write_text('# prompt', encoding='utf-8')
+
+    parts_cache = {}
+    uploaded = gcw.upload_prompt_files([str(p) for p in paths], parts_cache)
+
+    assert polls == {'fileid-p1.md': 2, 'fileid-p2.md': 2}
+    assert set(parts_cache) == set(uploaded.values())
+    assert parts_cache['fileid-p1.md'][0].name == 'fileid-p1.md'
+
+    # パーツ取得時は取得済みの File を使うため get_file は呼ばれない
+    polls.clear()
+    parts = gcw.get_prompt_parts_for_paths([str(p) for p in paths], uploaded, parts_cache)
+    assert len(parts) == 2
+    assert polls == {}
+
+    # サーバー側で消えたキャッシュ済み ID はその場で再アップロードする
+    cache_file = tmp_path / '.prompt_upload_cache.json'
+    cache = json.loads(cache_file.read_text(encoding='utf-8'))
+    cache[str(paths[0])]['file_id'] = 'fileid-gone'
+    cache_file.write_text(json.dumps(cache), encoding='utf-8')
+    uploaded = gcw.upload_prompt_files([str(p) for p in paths])
+    assert uploaded[str(paths[0])] == 'fileid-p1.md'
+    assert json.loads(cache_file.read_text(encoding='utf-8'))[str(paths[0])]['file_id'] == 'fileid-p1.md'
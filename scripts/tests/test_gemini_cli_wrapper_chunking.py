@@ -0,0 +1,132 @@
+import re
+import types
+
+import scripts.gemini_cli_wrapper as gcw
+
+
+def make_source(function_count, body_lines=8):
+    lines = []
+    for n in range(function_count):
+        lines.append(f"def func_{n}(value):")
+        lines.extend(f"    value = value + {i}" for i in range(body_lines))
+        lines.append("    return value")
+        lines.append("")
+    return "\n".join(lines)
+
+
+def test_split_source_chunks_prefers_definition_boundaries_with_overlap():
+    source = make_source(10)
+    chunks = gcw.split_source_chunks(source, max_tokens=120, overlap_lines=2)
+
+    assert len(chunks) > 1
+    assert chunks[0].start_line == 1
+    assert chunks[-1].end_line == len(source.split('\n'))
+    for previous, current in zip(chunks, chunks[1:]):
+        # 前の範囲の末尾 2 行と重なって始まる
+        assert current.start_line == previous.end_line - 1
+        # 分割位置は関数定義の直前
+        assert source.split('\n')[previous.end_line].startswith('def ')
+    assert all(gcw.estimate_tokens(c.text) + c.text.count('\n') + 1 <= 120 for c in chunks)
+
+
+def test_large_file_is_reviewed_in_chunks_and_merged(monkeypatch, tmp_path, fake_genai):
+    monkeypatch.chdir(tmp_path)
+    requests = []
+
+    class Model:
+        def __init__(self, name):
+            self.name = name
+
+        def generate_content(self, contents):
+            part = re.search(r'part (\d+)/(\d+)', contents[0])
+            requests.append(part.group(0) if part else 'whole')
+            return types.SimpleNamespace(text=f"findings for {part.group(0) if part else 'whole'}")
+
+    fake_genai.GenerativeModel = Model
+    big = tmp_path / 'big.py'
+    big.write_text(make_source(20), encoding='utf-8')
+    small = tmp_path / 'small.py'
+    small.write_text('x = 1\n', encoding='utf-8')
+    file_list = tmp_path / 'files.txt'
+    file_list.write_text(f"{big}\n{small}\n", encoding='utf-8')
+
+    count = gcw.batch_review_files(str(file_list), str(tmp_path / 'out'), chunk_tokens=200, max_file_tokens=10000)
+
+    assert count == 2
+    merged = (tmp_path / 'out' / 'big.py.md').read_text(encoding='utf-8')
+    chunk_requests = [r for r in requests if r != 'whole']
+    assert len(chunk_requests) > 1
+    assert merged.startswith(f"# 分割レビュー: {big}")
+    total = len(chunk_requests)
+    for n in range(1, total + 1):
+        assert f"## 範囲 {n}/{total}" in merged
+        assert f"findings for part {n}/{total}" in merged
+    assert (tmp_path / 'out' / 'small.py.md').read_text(encoding='utf-8') == 'findings for whole'
+
+
+def test_file_over_hard_cap_is_skipped_not_failed(monkeypatch, tmp_path, fake_genai, capsys):
+    monkeypatch.chdir(tmp_path)
+
+    class Model:
+        def __init__(self, name):
+            self.name = name
+
+        def generate_content(self, contents):
+            raise AssertionError('should not be called')
+
+    fake_genai.GenerativeModel = Model
+    big = tmp_path / 'bundle.js'
+    big.write_text('var a=1;' * 2000, encoding='utf-8')
+    file_list = tmp_path / 'files.txt'
+    file_list.write_text(f"{big}\n", encoding='utf-8')
+
+    count = gcw.batch_review_files(str(file_list), str(tmp_path / 'out'), chunk_tokens=100, max_file_tokens=1000)
+
+    assert count == 0
+    assert 'スキップしました' in (tmp_path / 'out' / 'bundle.js.md').read_text(encoding='utf-8')
+    assert '1 file(s) skipped' in capsys.readouterr().err
+
+
+def test_multibyte_file_size_bound_does_not_underestimate(monkeypatch, tmp_path, fake_genai, capsys):
+    monkeypatch.chdir(tmp_path)
+    requests = []
+
+    class Model:
+        def __init__(self, name):
+            self.name = name
+
+        def generate_content(self, contents):
+            part = re.search(r'part (\d+)/(\d+)', contents[0])
+            requests.append(part.group(0) if part else 'whole')
+            return types.SimpleNamespace(text='ok')
+
+    fake_genai.GenerativeModel = Model
+    # 2 バイト文字 1000 個（2000 バイト）は estimate_tokens では 1000 トークン
+    wide = tmp_path / 'wide.txt'
+    wide.write_text('\n'.join(['é' * 99] * 10) + '\n', encoding='utf-8')
+    tokens = gcw.estimate_tokens(wide.read_text(encoding='utf-8'))
+    assert gcw.min_file_tokens(str(wide)) <= tokens <= gcw.estimate_file_tokens(str(wide))
+    file_list = tmp_path / 'files.txt'
+    file_list.write_text(f"{wide}\n", encoding='utf-8')
+
+    assert gcw.batch_review_files(str(file_list), str(tmp_path / 'out'), chunk_tokens=900, max_file_tokens=tokens) == 1
+    assert len(requests) > 1 and 'whole' not in requests
+
+    requests.clear()
+    count = gcw.batch_review_files(
+        str(file_list), str(tmp_path / 'out2'), chunk_tokens=900, max_file_tokens=tokens - 1, result_cache_dir=False,
+    )
+    assert count == 0 and requests == []
+    assert 'スキップしました' in (tmp_path / 'out2' / 'wide.txt.md').read_text(encoding='utf-8')
+
+
+def test_chunk_prompt_describes_range_of_file_or_diff():
+    chunk = gcw.SourceChunk(2, 41, 80, 'body')
+
+    prompt = gcw.build_chunk_prompt('big.py', chunk, 3, 120)
+    assert prompt.startswith('File: big.py (part 2/3, lines 41-80 of 120)\n')
+    assert prompt.endswith('```\nbody\n```')
+    diff_prompt = gcw.build_chunk_prompt('big.py', chunk, 3, 120, diff_base='HEAD~1')
+    assert diff_prompt.startswith('File: big.py (changes since HEAD~1, part 2/3, diff lines 41-80 of 120)\n')
+    assert diff_prompt.endswith('```diff\nbody\n```')
+    assert '推定 900 トークン / 上限 500 トークン' in gcw.oversized_file_review(900, 500)
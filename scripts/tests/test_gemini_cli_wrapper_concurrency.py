@@ -0,0 +1,207 @@
+import types
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import scripts.gemini_cli_wrapper as gcw
+
+
+def make_files(tmp_path, count):
+    paths = []
+    for i in range(count):
+        code_file = tmp_path / f'file{i}.py'
+        code_file.write_text(f'print({i})\n', encoding='utf-8')
+        paths.append(code_file)
+    file_list = tmp_path / 'files.txt'
+    file_list.write_text(''.join(f"{p}\n" for p in paths), encoding='utf-8')
+    return file_list
+
+
+def test_batch_review_runs_requests_in_parallel(monkeypatch, tmp_path, fake_genai):
+    monkeypatch.chdir(tmp_path)
+    state = {'active': 0, 'peak': 0}
+    lock = threading.Lock()
+
+    class SlowModel:
+        def __init__(self, name):
+            self.name = name
+
+        def generate_content(self, contents):
+            with lock:
+                state['active'] += 1
+                state['peak'] = max(state['peak'], state['active'])
+            time.sleep(0.05)
+            with lock:
+                state['active'] -= 1
+            return types.SimpleNamespace(text=f"review of {contents[0].splitlines()[0]}")
+
+    fake_genai.GenerativeModel = SlowModel
+    file_list = make_files(tmp_path, 6)
+    outdir = tmp_path / 'out'
+
+    count = gcw.batch_review_files(str(file_list), str(outdir), concurrency=3)
+
+    assert count == 6
+    assert state['peak'] > 1
+    for i in range(6):
+        content = (outdir / f'file{i}.py.md').read_text(encoding='utf-8')
+        assert content.endswith(f'file{i}.py')
+
+
+def test_batch_review_concurrent_failure_still_exits_nonzero(monkeypatch, tmp_path, fake_genai):
+    monkeypatch.chdir(tmp_path)
+
+    class FlakyModel:
+        def __init__(self, name):
+            self.name = name
+
+        def generate_content(self, contents):
+            if 'file1.py' in contents[0]:
+                raise Exception("model error: simulated failure")
+            return types.SimpleNamespace(text="ok")
+
+    fake_genai.GenerativeModel = FlakyModel
+    file_list = make_files(tmp_path, 3)
+    outdir = tmp_path / 'out'
+
+    with pytest.raises(SystemExit) as ex:
+        gcw.batch_review_files(str(file_list), str(outdir), concurrency=2)
+
+    assert ex.value.code == 1
+    assert 'model error: simulated failure' in (outdir / 'file1.py.md').read_text(encoding='utf-8')
+    assert (outdir / 'file0.py.md').read_text(encoding='utf-8') == 'ok'
+    assert (outdir / 'file2.py.md').read_text(encoding='utf-8') == 'ok'
+
+
+def test_write_completed_results_writes_in_completion_order():
+    release = threading.Event()
+    written = []
+
+    def slow_review():
+        release.wait(5)
+        return 'ok', 'slow'
+
+    def write(index, status, body):
+        written.append((index, status, body))
+        if len(written) == 3:
+            release.set()
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        slow = executor.submit(slow_review)
+        pack = executor.submit(lambda: [('ok', 'packed 1'), ('failed', 'packed 2')])
+        pending = {
+            0: gcw.PendingReview.of_future(slow),
+            1: gcw.PendingReview.of_future(pack, 0),
+            2: gcw.PendingReview.of_future(pack, 1),
+            3: gcw.PendingReview.finished('skipped', 'over budget'),
+        }
+        pack.result()
+        gcw.write_completed_results(pending, write, block=False)
+        assert written == [(1, 'ok', 'packed 1'), (2, 'failed', 'packed 2'), (3, 'skipped', 'over budget')]
+        assert list(pending) == [0]
+        gcw.write_completed_results(pending, write)
+
+    # リスト順で先の 0 番は、完了した最後に書き込む
+    assert written[-1] == (0, 'ok', 'slow') and pending == {}
+
+
+def test_resolve_concurrency(monkeypatch, capsys):
+    monkeypatch.delenv('GEMINI_CONCURRENCY', raising=False)
+    assert gcw.BatchReviewOptions().resolved().concurrency == 1
+    monkeypatch.setenv('GEMINI_CONCURRENCY', '4')
+    assert gcw.BatchReviewOptions().resolved().concurrency == 4
+    assert gcw.BatchReviewOptions(concurrency='2').resolved().concurrency == 2
+    monkeypatch.setenv('GEMINI_CONCURRENCY', 'abc')
+    assert gcw.BatchReviewOptions(concurrency=0).resolved().concurrency == 1
+
+    # 警告は不正な値がどこから渡されたかを示す
+    err = capsys.readouterr().err
+    assert "Invalid explicit concurrency ignored: 0 (must be >= 1)" in err
+    assert "Invalid env GEMINI_CONCURRENCY ignored: 'abc'" in err
+
+
+def test_batch_review_args_map_to_options():
+    values = gcw.parse_batch_review_args([
+        '--concurrency', '3', '--stream', '--no-result-cache', '--model', 'm', '--bogus', '--deadline',
+    ])
+
+    assert values == {'concurrency': '3', 'stream': True, 'result_cache_dir': False, 'model_name': 'm'}
+    options = gcw.BatchReviewOptions(**{k: v for k, v in values.items() if k != 'model_name'}).resolved()
+    assert (options.concurrency, options.stream, options.result_cache_dir) == (3, True, False)
+    assert '[--no-result-cache]' in gcw.BATCH_REVIEW_USAGE and '[--schedule <fifo|sjf|ljf>]' in gcw.BATCH_REVIEW_USAGE
+
+
+def test_file_source_submits_reviews_before_source_is_exhausted(monkeypatch, tmp_path, fake_genai):
+    monkeypatch.chdir(tmp_path)
+    first_requested = threading.Event()
+
+    class SignalingModel:
+        def __init__(self, name):
+            self.name = name
+
+        def generate_content(self, contents):
+            first_requested.set()
+            return types.SimpleNamespace(text=f"review of {contents[0].splitlines()[0]}")
+
+    fake_genai.GenerativeModel = SignalingModel
+    make_files(tmp_path, 2)
+
+    def arriving():
+        yield 'file0.py'
+        # 2 件目が届く前に 1 件目のリクエストが送られている
+        assert first_requested.wait(5)
+        yield 'file1.py'
+
+    count = gcw.batch_review_files(
+        None, str(tmp_path / 'out'), concurrency=2, result_cache_dir=False,
+        pack_token_budget=100000, file_source=arriving(),
+    )
+
+    assert count == 2
+    assert (tmp_path / 'out' / 'file1.py.md').read_text(encoding='utf-8') == 'review of File: file1.py'
+
+
+def test_parallel_batches_share_one_concurrency_budget(monkeypatch, tmp_path, fake_genai):
+    monkeypatch.chdir(tmp_path)
+    state = {'active': 0, 'peak': 0}
+    lock = threading.Lock()
+
+    class SlowModel:
+        def __init__(self, name):
+            self.name = name
+
+        def generate_content(self, contents):
+            with lock:
+                state['active'] += 1
+                state['peak'] = max(state['peak'], state['active'])
+            time.sleep(0.05)
+            with lock:
+                state['active'] -= 1
+            return types.SimpleNamespace(text='ok')
+
+    fake_genai.GenerativeModel = SlowModel
+    lists = []
+    for batch in ('code', 'ocr'):
+        (tmp_path / batch).mkdir()
+        for i in range(4):
+            (tmp_path / batch / f'file{i}.py').write_text(f'print({i})\n', encoding='utf-8')
+        file_list = tmp_path / f'{batch}.txt'
+        file_list.write_text(''.join(f'{batch}/file{i}.py\n' for i in range(4)), encoding='utf-8')
+        lists.append(file_list)
+    session = gcw.ReviewSession()
+
+    # run_reviews と同じく、同じ session を使う 2 つのバッチを並列に実行する
+    threads = [
+        threading.Thread(target=gcw.batch_review_files, args=(str(file_list), str(tmp_path / 'out')),
+                         kwargs={'concurrency': 2, 'session': session, 'result_cache_dir': False})
+        for file_list in lists
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(list((tmp_path / 'out').rglob('*.md'))) == 8
+    assert state['peak'] == 2
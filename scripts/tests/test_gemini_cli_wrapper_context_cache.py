@@ -0,0 +1,91 @@
+import types
+
+import scripts.gemini_cli_wrapper as gcw
+
+
+def test_shared_prompt_set_uses_context_cache(monkeypatch, tmp_path, fake_genai, capsys):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv('GEMINI_CONTEXT_CACHE_MIN_TOKENS', '1')
+    created = []
+    deleted = []
+    requests = []
+
+    class FakeCachedContent:
+        def __init__(self, contents):
+            self.name = f"cachedContents/{len(created)}"
+            self.contents = contents
+
+        @classmethod
+        def create(cls, model, contents, ttl):
+            cached = cls(contents)
+            created.append((model, [part.name for part in contents]))
+            return cached
+
+        def delete(self):
+            deleted.append(self.name)
+
+    class Model:
+        def __init__(self, name, cached_content=None):
+            self.name = name
+            self.cached_content = cached_content
+
+        @classmethod
+        def from_cached_content(cls, cached_content):
+            return cls('cached', cached_content)
+
+        def generate_content(self, contents):
+            requests.append((self.cached_content, len(contents)))
+            cached_tokens = 900 if self.cached_content else 0
+            return types.SimpleNamespace(
+                text='ok',
+                usage_metadata=types.SimpleNamespace(
+                    prompt_token_count=1000, cached_content_token_count=cached_tokens, candidates_token_count=50,
+                ),
+            )
+
+    fake_genai.GenerativeModel = Model
+    fake_genai.caching = types.SimpleNamespace(CachedContent=FakeCachedContent)
+    prompt = tmp_path / 'prompt.md'
+    prompt.write_text('# review rules\n' * 10, encoding='utf-8')
+    files = []
+    for name in ('a.py', 'b.py', 'c.py'):
+        (tmp_path / name).write_text(f'name = "{name}"\n', encoding='utf-8')
+        files.append(str(tmp_path / name))
+    file_list = tmp_path / 'files.txt'
+    file_list.write_text(''.join(f"{f}\n" for f in files), encoding='utf-8')
+
+    count = gcw.batch_review_files(str(file_list), str(tmp_path / 'out'), str(prompt), context_cache=True)
+
+    assert count == 3
+    assert created == [('models/gemini-2.5-flash', ['fileid-prompt.md'])]
+    # プロンプトはキャッシュ側にあるので、各リクエストはファイル内容だけを送る
+    assert [n for _, n in requests] == [1, 1, 1]
+    assert all(cached is not None for cached, _ in requests)
+    assert deleted == ['cachedContents/0']
+    err = capsys.readouterr().err
+    assert 'Info: Token usage: requests=3 input=3000 cached=2700 uncached=300 output=150' in err
+
+
+def test_context_cache_skipped_for_single_use_prompt_set(monkeypatch, tmp_path, fake_genai):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv('GEMINI_CONTEXT_CACHE_MIN_TOKENS', '1')
+    fake_genai.caching = types.SimpleNamespace(CachedContent=None)
+    requests = []
+
+    class Model:
+        def __init__(self, name):
+            self.name = name
+
+        def generate_content(self, contents):
+            requests.append(len(contents))
+            return types.SimpleNamespace(text='ok')
+
+    fake_genai.GenerativeModel = Model
+    prompt = tmp_path / 'prompt.md'
+    prompt.write_text('# review rules\n', encoding='utf-8')
+    (tmp_path / 'a.py').write_text('x = 1\n', encoding='utf-8')
+    file_list = tmp_path / 'files.txt'
+    file_list.write_text(f"{tmp_path / 'a.py'}\n", encoding='utf-8')
+
+    assert gcw.batch_review_files(str(file_list), str(tmp_path / 'out'), str(prompt), context_cache=True) == 1
+    assert requests == [2]
@@ -0,0 +1,77 @@
+import subprocess
+import types
+
+import pytest
+
+import scripts.gemini_cli_wrapper as gcw
+
+
+def git(repo, *args):
+    subprocess.run(
+        ['git', '-c', 'user.name=test', '-c', 'user.email=test@example.com', *args],
+        cwd=repo, check=True, capture_output=True,
+    )
+
+
+@pytest.fixture
+def repo(tmp_path, monkeypatch):
+    git(tmp_path, 'init', '-q')
+    source = "\n".join(f"line_{n} = {n}" for n in range(1, 201)) + "\n"
+    (tmp_path / 'app.py').write_text(source, encoding='utf-8')
+    git(tmp_path, 'add', 'app.py')
+    git(tmp_path, 'commit', '-q', '-m', 'base')
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+def test_git_diff_for_file_returns_only_changed_hunks(repo):
+    source = (repo / 'app.py').read_text(encoding='utf-8').replace('line_100 = 100', 'line_100 = -100')
+    (repo / 'app.py').write_text(source, encoding='utf-8')
+
+    diff_text = gcw.git_diff_for_file('app.py', 'HEAD', context_lines=3)
+
+    assert diff_text.startswith('@@ -97,7 +97,7 @@')
+    assert '-line_100 = 100' in diff_text
+    assert '+line_100 = -100' in diff_text
+    assert 'line_90 = 90' not in diff_text
+    assert 'diff --git' not in diff_text
+
+
+def test_git_diff_for_file_falls_back_for_new_and_unchanged_files(repo):
+    (repo / 'new.py').write_text('x = 1\n', encoding='utf-8')
+    git(repo, 'add', 'new.py')
+
+    assert gcw.git_diff_for_file('new.py', 'HEAD') is None
+    assert gcw.git_diff_for_file('app.py', 'HEAD') is None
+    assert gcw.verify_git_revision('HEAD')
+    assert not gcw.verify_git_revision('0000000000000000000000000000000000000000')
+
+
+def test_batch_review_sends_hunks_in_diff_mode(repo, fake_genai):
+    prompts = []
+
+    class Model:
+        def __init__(self, name):
+            self.name = name
+
+        def generate_content(self, contents):
+            prompts.append(contents[0])
+            return types.SimpleNamespace(text='review')
+
+    fake_genai.GenerativeModel = Model
+    source = (repo / 'app.py').read_text(encoding='utf-8').replace('line_150 = 150', 'line_150 = 0')
+    (repo / 'app.py').write_text(source, encoding='utf-8')
+    (repo / 'untracked.py').write_text('y = 2\n', encoding='utf-8')
+    file_list = repo / 'files.txt'
+    file_list.write_text('app.py\nuntracked.py\n', encoding='utf-8')
+
+    count = gcw.batch_review_files(
+        str(file_list), str(repo / 'out'), result_cache_dir=False, diff_base='HEAD', diff_context=2,
+    )
+
+    assert count == 2
+    assert prompts[0].startswith('File: app.py (changes since HEAD)')
+    assert '```diff\n@@ -148,5 +148,5 @@' in prompts[0]
+    assert 'line_1 = 1\n' not in prompts[0]
+    # 差分が取れないファイルは全体をレビューする
+    assert prompts[1] == 'File: untracked.py\n\n```\ny = 2\n\n```'
@@ -1,20 +1,15 @@
-import sys
+import json
+import time
 import types
 import os
 import traceback
 from pathlib import Path
 import pytest
 
-# Ensure a fake google.generativeai exists during import
-google = types.ModuleType('google')
-google.generativeai = types.ModuleType('google.generativeai')
-sys.modules['google'] = google
-sys.modules['google.generativeai'] = google.generativeai
-
 import scripts.gemini_cli_wrapper as gcw
 
 
-def test_batch_review_files_logs_error_message(monkeypatch, tmp_path, capsys):
+def test_batch_review_files_logs_error_message(monkeypatch, tmp_path, capsys, fake_genai):
     # change cwd
     monkeypatch.chdir(tmp_path)
     # set env api key
@@ -43,9 +38,8 @@ def test_batch_review_files_logs_error_message(monkeypatch, tmp_path, capsys):
             mime_type = 'text/plain'
         return F()
 
-    google.generativeai.configure = lambda api_key: None
-    google.generativeai.upload_file = fake_upload_file
-    google.generativeai.get_file = fake_get_file
+    fake_genai.upload_file = fake_upload_file
+    fake_genai.get_file = fake_get_file
 
     # Fake model that raises an exception in generate_content
     class BadModel:
@@ -55,7 +49,7 @@ def test_batch_review_files_logs_error_message(monkeypatch, tmp_path, capsys):
         def generate_content(self, contents):
             raise Exception("model error: simulated failure")
 
-    google.generativeai.GenerativeModel = BadModel
+    fake_genai.GenerativeModel = BadModel
 
     # Output directory
     outdir = tmp_path / 'out'
@@ -66,7 +60,7 @@ def test_batch_review_files_logs_error_message(monkeypatch, tmp_path, capsys):
     assert ex.value.code == 1
 
     # The review file should include original cause and traceback
-    mdfile = outdir / 'sample.md'
+    mdfile = outdir / 'sample.py.md'
     assert mdfile.exists()
     content = mdfile.read_text(encoding='utf-8')
     assert '自動レビューに失敗しました。担当者に確認してください。' in content
@@ -78,3 +72,138 @@ def test_batch_review_files_logs_error_message(monkeypatch, tmp_path, capsys):
     assert 'model error: simulated failure' in captured.err
 
 
+
+
+def test_batch_review_retries_quota_errors(monkeypatch, tmp_path, fake_genai):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr('time.sleep', lambda seconds: None)
+
+    class QuotaError(Exception):
+        code = 429
+
+    calls = []
+
+    class BusyModel:
+        def __init__(self, name):
+            self.name = name
+
+        def generate_content(self, contents):
+            calls.append(1)
+            if len(calls) == 1:
+                raise QuotaError("429 Resource has been exhausted")
+            return types.SimpleNamespace(text="review ok")
+
+    fake_genai.GenerativeModel = BusyModel
+    code_file = tmp_path / 'sample.py'
+    code_file.write_text('print("hello")\n', encoding='utf-8')
+    file_list = tmp_path / 'files.txt'
+    file_list.write_text(str(code_file) + '\n', encoding='utf-8')
+
+    count = gcw.batch_review_files(str(file_list), str(tmp_path / 'out'), max_retries=2)
+
+    assert count == 1
+    assert len(calls) == 2
+    assert (tmp_path / 'out' / 'sample.py.md').read_text(encoding='utf-8') == 'review ok'
+
+
+class UnavailableError(Exception):
+    code = 503
+
+
+def test_failed_files_are_retried_and_tolerated_within_threshold(monkeypatch, tmp_path, fake_genai):
+    monkeypatch.chdir(tmp_path)
+    attempts = {}
+
+    class FlakyModel:
+        def __init__(self, name):
+            self.name = name
+
+        def generate_content(self, contents):
+            file_path = contents[0].splitlines()[0][len('File: '):]
+            attempts[file_path] = attempts.get(file_path, 0) + 1
+            if file_path == 'broken.py':
+                raise ValueError(f"bad request for {file_path}")
+            if file_path == 'flaky.py' and attempts[file_path] == 1:
+                raise UnavailableError("503 service unavailable")
+            return types.SimpleNamespace(text=f"review of {file_path}")
+
+    fake_genai.GenerativeModel = FlakyModel
+    for name in ('ok.py', 'flaky.py', 'broken.py'):
+        (tmp_path / name).write_text(f'# {name}\n', encoding='utf-8')
+    file_list = tmp_path / 'files.txt'
+    file_list.write_text('ok.py\nflaky.py\nbroken.py\n', encoding='utf-8')
+    outdir = tmp_path / 'out'
+
+    count = gcw.batch_review_files(
+        str(file_list), str(outdir), concurrency=4, result_cache_dir=False, max_retries=0, failure_threshold=0.5,
+    )
+
+    assert count == 2
+    # 致命的なエラーで失敗したファイルは再送しない
+    assert attempts == {'ok.py': 1, 'flaky.py': 2, 'broken.py': 1}
+    assert (outdir / 'flaky.py.md').read_text(encoding='utf-8') == 'review of flaky.py'
+    manifest = json.loads((outdir / 'review_failures.json').read_text(encoding='utf-8'))
+    assert manifest['failures'] == [{
+        'source': 'broken.py',
+        'review': 'broken.py.md',
+        'error': 'ValueError: bad request for broken.py',
+        'attempts': 1,
+    }]
+
+    # 閾値を超える場合は従来どおり非ゼロ終了する
+    with pytest.raises(SystemExit):
+        gcw.batch_review_files(str(file_list), str(outdir), result_cache_dir=False, max_retries=0, file_retries=0)
+
+
+def test_failures_are_not_swept_into_skips_after_the_deadline(monkeypatch, tmp_path, fake_genai):
+    monkeypatch.chdir(tmp_path)
+    requests = []
+
+    class SlowUnavailableModel:
+        def __init__(self, name):
+            self.name = name
+
+        def generate_content(self, contents):
+            requests.append(1)
+            time.sleep(0.2)
+            raise UnavailableError("503 service unavailable")
+
+    fake_genai.GenerativeModel = SlowUnavailableModel
+    (tmp_path / 'a.py').write_text('# a\n', encoding='utf-8')
+    file_list = tmp_path / 'files.txt'
+    file_list.write_text('a.py\n', encoding='utf-8')
+    outdir = tmp_path / 'out'
+
+    with pytest.raises(SystemExit):
+        gcw.batch_review_files(
+            str(file_list), str(outdir), result_cache_dir=False, max_retries=0, file_retries=2, deadline=0.1,
+        )
+
+    assert len(requests) == 1
+    assert '自動レビューに失敗しました' in (outdir / 'a.py.md').read_text(encoding='utf-8')
+    manifest = json.loads((outdir / 'review_failures.json').read_text(encoding='utf-8'))
+    assert [f['source'] for f in manifest['failures']] == ['a.py']
+
+
+def test_sweep_failed_files_halves_concurrency_until_nothing_fails():
+    failing = {0: 2, 3: 1}
+    rounds = []
+    written = []
+
+    def failed_indexes():
+        return sorted(i for i, remaining in failing.items() if remaining)
+
+    def submit(executor, index):
+        rounds.append((executor._max_workers, index))
+        failing[index] -= 1
+        status = gcw.REVIEW_FAILED if failing[index] else gcw.REVIEW_OK
+        return gcw.PendingReview.finished(status, f"review {index}")
+
+    gcw.sweep_failed_files(failed_indexes, submit, lambda *result: written.append(result), lambda: False, 3, 8)
+
+    assert rounds == [(4, 0), (4, 3), (2, 0)]
+    assert written == [(0, 'failed', 'review 0'), (3, 'ok', 'review 3'), (0, 'ok', 'review 0')]
+    # 制限時間を過ぎていれば再レビューしない
+    failing[1] = 1
+    gcw.sweep_failed_files(failed_indexes, submit, lambda *result: written.append(result), lambda: True, 3, 8, 5.0)
+    assert len(rounds) == 3
@@ -0,0 +1,94 @@
+import types
+
+import scripts.gemini_cli_wrapper as gcw
+from scripts.load_extensions import load_extension_patterns, load_ocr_image_patterns
+
+PNG_BYTES = b'\x89PNG\r\n\x1a\n\x00\xff binary'
+
+
+def write_prompt_map(tmp_path):
+    (tmp_path / 'base.md').write_text('base', encoding='utf-8')
+    (tmp_path / 'image.md').write_text('image', encoding='utf-8')
+    prompt_map = tmp_path / 'map.csv'
+    prompt_map.write_text(
+        'extension,base_prompt,custom_prompt,review_mode\n'
+        '.py,base.md,,\n'
+        '.png,image.md,,image\n',
+        encoding='utf-8',
+    )
+    return prompt_map
+
+
+def test_review_modes_are_read_from_fourth_column(tmp_path):
+    prompt_map = write_prompt_map(tmp_path)
+
+    modes = gcw.load_review_modes(str(prompt_map))
+
+    assert modes == {'.png': 'image'}
+    assert gcw.review_mode_for_file('shots/Screen.PNG', modes) == 'image'
+    assert gcw.review_mode_for_file('main.py', modes) == 'text'
+    assert '**/*.PNG' in load_extension_patterns(str(prompt_map))
+    ocr_patterns = load_ocr_image_patterns(str(prompt_map)).splitlines()
+    assert '**/*.png' not in ocr_patterns and '**/*.jpg' in ocr_patterns
+    assert load_ocr_image_patterns('docs/target-extensions.csv').splitlines()[:2] == ['**/*.png', '**/*.PNG']
+
+
+def test_image_files_are_sent_inline_and_never_packed(monkeypatch, tmp_path, fake_genai):
+    monkeypatch.chdir(tmp_path)
+    prompt_map = write_prompt_map(tmp_path)
+    requests = []
+
+    class RecordingModel:
+        def __init__(self, name):
+            pass
+
+        def generate_content(self, contents):
+            requests.append(contents)
+            return types.SimpleNamespace(text='image review' if isinstance(contents[1], dict) else 'text review')
+
+    fake_genai.GenerativeModel = RecordingModel
+    (tmp_path / 'a.png').write_bytes(PNG_BYTES)
+    (tmp_path / 'b.png').write_bytes(PNG_BYTES + b'2')
+    (tmp_path / 'c.py').write_text('x = 1\n', encoding='utf-8')
+    file_list = tmp_path / 'files.txt'
+    file_list.write_text('a.png\nb.png\nc.py\n', encoding='utf-8')
+
+    count = gcw.batch_review_files(
+        str(file_list), str(tmp_path / 'out'), prompt_map_path=str(prompt_map),
+        pack_token_budget=100000, result_cache_dir=str(tmp_path / 'cache'),
+    )
+
+    assert count == 3
+    image_requests = [c for c in requests if isinstance(c[1], dict)]
+    assert len(image_requests) == 2
+    assert image_requests[0][0].startswith('File: a.png (image)')
+    assert image_requests[0][1] == {'mime_type': 'image/png', 'data': PNG_BYTES}
+    assert image_requests[0][2].name == 'fileid-image.md'
+    assert (tmp_path / 'out' / 'a.png.md').read_text(encoding='utf-8') == 'image review'
+    assert (tmp_path / 'out' / 'c.py.md').read_text(encoding='utf-8') == 'text review'
+
+    # 画像のレビュー結果も内容ハッシュでキャッシュされる
+    requests.clear()
+    gcw.batch_review_files(
+        str(file_list), str(tmp_path / 'out2'), prompt_map_path=str(prompt_map),
+        result_cache_dir=str(tmp_path / 'cache'),
+    )
+    assert requests == []
+
+
+def test_large_images_are_uploaded_and_deleted(monkeypatch, tmp_path, fake_genai):
+    monkeypatch.setattr(gcw, 'INLINE_IMAGE_MAX_BYTES', 4)
+    uploads = []
+    deleted = []
+    fake_genai.upload_file = lambda path, mime_type=None: uploads.append((path, mime_type)) or types.SimpleNamespace(name='files/img')
+    fake_genai.delete_file = deleted.append
+    image = tmp_path / 'big.jpg'
+    image.write_bytes(PNG_BYTES)
+    uploaded = []
+
+    part = gcw.image_content_part(str(image), PNG_BYTES, uploaded)
+    gcw.delete_uploaded_files(uploaded)
+
+    assert uploads == [(str(image), 'image/jpeg')]
+    assert part.name == 'files/img'
+    assert deleted == ['files/img']
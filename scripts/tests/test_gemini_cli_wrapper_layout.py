@@ -0,0 +1,87 @@
+import json
+import types
+from pathlib import Path
+
+import pytest
+
+import scripts.gemini_cli_wrapper as gcw
+from source_paths import source_relative_path
+
+
+def test_reviews_mirror_source_paths_without_collisions(monkeypatch, tmp_path, fake_genai):
+    monkeypatch.chdir(tmp_path)
+
+    class EchoModel:
+        def __init__(self, name):
+            pass
+
+        def generate_content(self, contents):
+            return types.SimpleNamespace(text=contents[0].splitlines()[0])
+
+    fake_genai.GenerativeModel = EchoModel
+    sources = ['src/a/index.ts', 'src/b/index.ts', 'src/index.ts', 'src/index.js']
+    for source in sources:
+        (tmp_path / source).parent.mkdir(parents=True, exist_ok=True)
+        (tmp_path / source).write_text(f'// {source}\n', encoding='utf-8')
+    file_list = tmp_path / 'files.txt'
+    file_list.write_text('\n'.join(sources + ['src/a/index.ts']) + '\n', encoding='utf-8')
+
+    count = gcw.batch_review_files(str(file_list), str(tmp_path / 'out'), concurrency=4, result_cache_dir=False)
+
+    assert count == 4
+    expected = {
+        'src/a/index.ts': 'src/a/index.ts.md',
+        'src/b/index.ts': 'src/b/index.ts.md',
+        'src/index.ts': 'src/index.ts.md',
+        'src/index.js': 'src/index.js.md',
+    }
+    for source, review in expected.items():
+        assert (tmp_path / 'out' / review).read_text(encoding='utf-8') == f'File: {source}'
+    index = json.loads((tmp_path / 'out' / 'review_index.json').read_text(encoding='utf-8'))
+    assert {entry['source']: entry['review'] for entry in index['reviews']} == expected
+    assert {entry['status'] for entry in index['reviews']} == {'ok'}
+
+
+def test_layout_is_shared_per_output_dir_and_independent_of_claim_order(monkeypatch, tmp_path):
+    monkeypatch.chdir(tmp_path)
+    session = gcw.ReviewSession()
+    layout = session.output_layout(str(tmp_path / 'out'))
+    assert session.output_layout(str(tmp_path / 'out')) is layout
+
+    # 名前はファイル自身のパスだけで決まり、割り当てた順序に依存しない
+    sources = ['src/index.js', 'src/index.ts', '../shared/util.py']
+    forward = [layout.path_for(source) for source in sources]
+    backward = [gcw.ReviewOutputLayout(tmp_path / 'out').path_for(source) for source in reversed(sources)]
+    assert forward == list(reversed(backward))
+    assert forward[0].endswith('src/index.js.md') and forward[1].endswith('src/index.ts.md')
+    assert gcw.review_output_relative_path('../shared/util.py').parts[0] == '_external'
+
+    # 大文字小文字だけが異なるパスは相対パスのハッシュを付けた別の Markdown にする
+    first = layout.path_for('docs/Readme.txt')
+    second = layout.path_for('docs/README.txt')
+    assert first.endswith('Readme.txt.md') and second != first
+    assert layout.path_for('docs/Readme.txt') == first
+
+    # 候補がすべて埋まっている場合は他のファイルの Markdown を上書きせずに例外にする
+    crowded = gcw.ReviewOutputLayout(tmp_path / 'out2')
+    taken = crowded.path_for('docs/Readme.txt')
+    for length in (8, 16, 64):
+        digest = gcw.sha256_bytes(b'docs/README.txt.md')[:length]
+        crowded._claimed[f'docs/readme.txt-{digest}.md'] = f'other-{length}'
+    with pytest.raises(RuntimeError):
+        crowded.path_for('docs/README.txt')
+    assert crowded.path_for('docs/Readme.txt') == taken
+
+
+def test_external_files_map_to_the_same_path_in_any_checkout(monkeypatch, tmp_path):
+    # 外部ファイルの出力先は ../shared のような相対位置だけで決まり、チェックアウト先の絶対パスに依存しない
+    paths = []
+    for checkout in ('first', 'second/nested'):
+        repo = tmp_path / checkout / 'repo'
+        repo.mkdir(parents=True)
+        monkeypatch.chdir(repo)
+        paths.append((source_relative_path('../shared/screen.png'), gcw.review_output_relative_path('../shared/util.py')))
+    assert paths[0] == paths[1]
+    assert paths[0][0].parts[0] == '_external' and paths[0][0].name == 'screen.png'
+    assert paths[0][1].parent == paths[0][0].parent
+    assert source_relative_path(tmp_path / 'second' / 'nested' / 'repo' / 'src' / 'a.py') == Path('src/a.py')
@@ -0,0 +1,96 @@
+import re
+import types
+
+import scripts.gemini_cli_wrapper as gcw
+
+
+def write_files(tmp_path, names, content='x = 1\n'):
+    paths = []
+    for name in names:
+        path = tmp_path / name
+        path.write_text(content, encoding='utf-8')
+        paths.append(str(path))
+    file_list = tmp_path / 'files.txt'
+    file_list.write_text(''.join(f"{p}\n" for p in paths), encoding='utf-8')
+    return file_list, paths
+
+
+def test_plan_review_packs_groups_small_files_by_prompt_set(tmp_path):
+    _, paths = write_files(tmp_path, ['a.py', 'b.py', 'c.sh', 'd.py'])
+    big = tmp_path / 'big.py'
+    big.write_text('x' * 3000, encoding='utf-8')
+    entries = [
+        (paths[0], ('py',)), (str(big), ('py',)), (paths[1], ('py',)),
+        (paths[2], ('sh',)), (paths[3], ('py',)),
+    ]
+
+    singles, packs = gcw.plan_review_packs(entries, token_budget=100)
+
+    assert packs == [[0, 2, 4]]
+    assert singles == [1, 3]
+
+
+def test_plan_review_jobs_separates_large_image_and_excluded_files(tmp_path):
+    _, paths = write_files(tmp_path, ['a.py', 'b.py', 'skip.py'])
+    big = tmp_path / 'big.py'
+    big.write_text('x' * 3000, encoding='utf-8')
+    image = tmp_path / 'shot.png'
+    image.write_bytes(b'png')
+    files = paths[:2] + [str(big), str(image), paths[2]]
+    prompt_keys = [('py',), ('py',), ('py',), ('png',), None]
+
+    jobs, large = gcw.plan_review_jobs(files, prompt_keys, {str(image)}, {paths[2]}, 500, 100, 'fifo', [])
+
+    assert large == {2}
+    assert jobs == [[0, 1], [2], [3]]
+    jobs, _ = gcw.plan_review_jobs(files, prompt_keys, {str(image)}, {paths[2]}, 500, 0, 'ljf', [])
+    assert jobs == [[2], [3], [0], [1]]
+
+
+def test_packed_request_is_split_into_per_file_reviews(monkeypatch, tmp_path, fake_genai):
+    monkeypatch.chdir(tmp_path)
+    requests = []
+
+    class PackingModel:
+        def __init__(self, name):
+            self.name = name
+
+        def generate_content(self, contents):
+            requests.append(contents[0])
+            ids = re.findall(r'=== id=(\d+) File: (\S+) ===', contents[0])
+            return types.SimpleNamespace(text='\n'.join(
+                f"<<<REVIEW-BEGIN id={number}>>>\nreview of {path}\n<<<REVIEW-END id={number}>>>"
+                for number, path in ids
+            ))
+
+    fake_genai.GenerativeModel = PackingModel
+    file_list, paths = write_files(tmp_path, ['a.py', 'b.py', 'c.py'])
+
+    count = gcw.batch_review_files(str(file_list), str(tmp_path / 'out'), pack_token_budget=1000)
+
+    assert count == 3
+    assert len(requests) == 1
+    for name, path in zip(['a', 'b', 'c'], paths):
+        assert (tmp_path / 'out' / f'{name}.py.md').read_text(encoding='utf-8') == f'review of {path}'
+
+
+def test_unsplittable_packed_response_falls_back_to_per_file(monkeypatch, tmp_path, fake_genai):
+    monkeypatch.chdir(tmp_path)
+    requests = []
+
+    class SloppyModel:
+        def __init__(self, name):
+            self.name = name
+
+        def generate_content(self, contents):
+            requests.append(contents[0])
+            return types.SimpleNamespace(text='single review')
+
+    fake_genai.GenerativeModel = SloppyModel
+    file_list, _ = write_files(tmp_path, ['a.py', 'b.py'])
+
+    count = gcw.batch_review_files(str(file_list), str(tmp_path / 'out'), pack_token_budget=1000)
+
+    assert count == 2
+    assert len(requests) == 3
+    assert (tmp_path / 'out' / 'b.py.md').read_text(encoding='utf-8') == 'single review'
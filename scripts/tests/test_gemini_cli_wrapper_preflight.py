@@ -0,0 +1,231 @@
+import json
+import os
+import types
+
+import pytest
+
+import scripts.gemini_cli_wrapper as gcw
+from token_preflight import PreflightBudget, TokenCounter, projected_cost, resolve_prices
+from content_cache import ContentCache
+from review_metrics import ReviewMetrics
+
+
+def test_token_counter_caches_api_counts_and_falls_back(tmp_path):
+    calls = []
+
+    class CountingModel:
+        def count_tokens(self, contents):
+            calls.append(contents)
+            if contents == ['boom']:
+                raise ValueError('quota exceeded')
+            return types.SimpleNamespace(total_tokens=len(contents[0]))
+
+    cache = ContentCache(tmp_path / 'counts')
+    counter = TokenCounter(gcw.estimate_tokens, CountingModel(), 'gemini-2.5-flash', cache)
+    assert counter.count('abcdefgh') == 8
+    # 2 回目以降はディスクキャッシュから読み、API を呼ばない
+    assert TokenCounter(gcw.estimate_tokens, CountingModel(), 'gemini-2.5-flash', cache).count('abcdefgh') == 8
+    assert len(calls) == 1
+    assert counter.count('boom') == gcw.estimate_tokens('boom')
+    assert counter.fallbacks == 1
+
+
+def test_resolve_prices_prefers_longest_prefix_and_env(monkeypatch):
+    monkeypatch.delenv('GEMINI_INPUT_PRICE_PER_M', raising=False)
+    monkeypatch.delenv('GEMINI_OUTPUT_PRICE_PER_M', raising=False)
+    assert resolve_prices('gemini-2.5-flash-lite') == (0.10, 0.40)
+    assert resolve_prices('gemini-2.5-flash') == (0.30, 2.50)
+    assert resolve_prices('unknown-model') == (0.0, 0.0)
+    monkeypatch.setenv('GEMINI_OUTPUT_PRICE_PER_M', '3')
+    assert resolve_prices('gemini-2.5-flash') == (0.30, 3.0)
+    assert projected_cost(1_000_000, 1_000_000, (0.30, 2.50)) == pytest.approx(2.80)
+
+
+def test_preflight_budget_admits_in_call_order_and_records_skips(tmp_path):
+    prompt = tmp_path / 'prompt.md'
+    prompt.write_text('x' * 40, encoding='utf-8')
+    budget = PreflightBudget(TokenCounter(gcw.estimate_tokens), (1.0, 2.0), 10, run_token_budget=115)
+
+    input_tokens, output_tokens, cost, reason = budget.admit('a.py', 30, [str(prompt)], 1)
+    assert (input_tokens, output_tokens, reason) == (40, 10, None)
+    assert cost == pytest.approx((40 * 1.0 + 10 * 2.0) / 1_000_000)
+    # 読めないプロンプトは 0 トークン、プロンプトはリクエストごとに数える
+    assert budget.admit('b.py', 50, [str(prompt), str(tmp_path / 'missing.md')], 2)[::3] == (70, None)
+    assert budget.admit('c.py', 1, [str(prompt)], 1)[3] == 'token_budget'
+
+    assert (budget.files, budget.input_tokens, budget.output_tokens) == (2, 110, 30)
+    assert list(budget.over_budget) == ['c.py'] and '実行全体の上限 115 トークン' in budget.over_budget['c.py']
+    assert budget.to_metrics()['admitted_files'] == 2 and budget.to_metrics()['over_budget'] == 1
+    assert budget.summary_line().startswith('Pre-flight: files=2 input≈110 output≈30')
+
+
+def test_review_preflight_admits_in_schedule_order_without_a_batch(tmp_path):
+    files = []
+    for name, size in (('big.py', 400), ('small.py', 40), ('huge.py', 4000)):
+        path = tmp_path / name
+        path.write_text('x' * size, encoding='utf-8')
+        files.append(str(path))
+    budget = PreflightBudget(TokenCounter(gcw.estimate_tokens), (1.0, 2.0), 0, run_token_budget=105)
+    metrics = ReviewMetrics()
+    preflight = gcw.ReviewPreflight(budget, metrics, gcw.PreloadCache(1024), set(), 1000, 0, 500)
+
+    preflight.run(files, [[], [], []], 2, gcw.SCHEDULE_SJF, [])
+
+    # sjf では small.py（10 トークン）を先に積み上げるため big.py（100 トークン）が予算を超える
+    assert list(budget.over_budget) == [files[0]] and metrics.values('skip_reason') == ['token_budget']
+    assert sorted(metrics.values('projected_input_tokens')) == [10, 100]
+    # 受け入れたファイルの内容だけを保持し、max_file_tokens を確実に超えるファイルは読まない
+    assert preflight.take(files[1]) == b'x' * 40
+    assert preflight.take(files[0]) is None and preflight.take(files[2]) is None
+    assert preflight.measure(files[2]) is None and budget.files == 1
+
+
+def test_budgets_skip_files_before_any_request(monkeypatch, tmp_path, fake_genai):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv('GEMINI_EXPECTED_OUTPUT_TOKENS', '100')
+    requested = []
+
+    class RecordingModel:
+        def __init__(self, name):
+            pass
+
+        def generate_content(self, contents):
+            requested.append(contents[0].splitlines()[0])
+            return types.SimpleNamespace(text='ok')
+
+    fake_genai.GenerativeModel = RecordingModel
+    sizes = {'bundle.min.js': 40000, 'a.py': 400, 'b.py': 800, 'c.py': 1200}
+    for name, size in sizes.items():
+        (tmp_path / name).write_text('x' * size, encoding='utf-8')
+    file_list = tmp_path / 'files.txt'
+    file_list.write_text('\n'.join(sizes) + '\n', encoding='utf-8')
+    out = tmp_path / 'out'
+
+    count = gcw.batch_review_files(
+        str(file_list), str(out), result_cache_dir=False, schedule='sjf',
+        file_token_budget=5000, run_token_budget=500,
+    )
+
+    # 1 ファイルの上限を超える bundle と、小さい順に積み上げて実行全体の上限を超える c.py はスキップ
+    assert count == 2
+    assert requested == ['File: a.py', 'File: b.py']
+    assert '予算' in (out / 'bundle.min.js.md').read_text(encoding='utf-8')
+    run = json.loads((out / 'review_metrics.json').read_text(encoding='utf-8'))['runs'][-1]
+    assert (run['reviewed'], run['skipped'], run['failed']) == (2, 2, 0)
+    reasons = {r['file']: r.get('skip_reason') for r in run['file_metrics']}
+    assert reasons == {'bundle.min.js': 'token_budget', 'a.py': None, 'b.py': None, 'c.py': 'token_budget'}
+    preflight = run['preflight']
+    assert preflight['token_counter'] == 'estimate'
+    assert preflight['admitted_files'] == 2 and preflight['over_budget'] == 2
+    assert preflight['input_tokens'] == 300 and preflight['output_tokens'] == 200
+    assert run['projected_input_tokens'] == 10000 + 100 + 200 + 300
+
+
+def test_measure_source_tokens_counts_overlapping_chunks():
+    text = '\n'.join(f'line {i:03d} ' + 'x' * 30 for i in range(100))
+    counted = []
+
+    def count(part):
+        counted.append(part)
+        return gcw.estimate_tokens(part)
+
+    chunks = gcw.split_source_chunks(text, 300, overlap_lines=5)
+    tokens, requests = gcw.measure_source_tokens(text, count, 300, 5, 10000)
+
+    # 重なりの行も範囲ごとに送信するため、ファイル全体を 1 回数えるより多くなる
+    assert requests == len(chunks) > -(-gcw.estimate_tokens(text) // 300)
+    assert counted == [chunk.text for chunk in chunks]
+    assert tokens == sum(gcw.estimate_tokens(chunk.text) for chunk in chunks) > gcw.estimate_tokens(text)
+    assert gcw.measure_source_tokens('short', count, 300, 5, 10000) == (gcw.estimate_tokens('short'), 1)
+    assert gcw.measure_source_tokens(text, count, 300, 5, 100) is None
+
+
+def test_api_counts_go_through_rate_limiter_and_files_are_read_once(monkeypatch, tmp_path, capsys, fake_genai):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv('GEMINI_TOKEN_COUNT_CACHE_DIR', str(tmp_path / 'counts'))
+    acquired = []
+
+    class RecordingLimiter:
+        def acquire(self, tokens=0):
+            acquired.append(tokens)
+
+    class CountingModel:
+        def __init__(self, name):
+            pass
+
+        def count_tokens(self, contents):
+            return types.SimpleNamespace(total_tokens=len(contents[0]))
+
+        def generate_content(self, contents):
+            return types.SimpleNamespace(text='ok')
+
+    fake_genai.GenerativeModel = CountingModel
+    monkeypatch.setattr(gcw, 'open_rate_limiter', lambda rpm=None, tpm=None: RecordingLimiter())
+    for name in ('a.py', 'b.py'):
+        (tmp_path / name).write_text(f'# {name}\n', encoding='utf-8')
+    file_list = tmp_path / 'files.txt'
+    file_list.write_text('a.py\nb.py\n', encoding='utf-8')
+    opened = []
+    real_open = open
+
+    def recording_open(path, *args, **kwargs):
+        opened.append(os.path.basename(str(path)))
+        return real_open(path, *args, **kwargs)
+
+    monkeypatch.setattr(gcw, 'open', recording_open, raising=False)
+
+    count = gcw.batch_review_files(
+        str(file_list), str(tmp_path / 'out'), result_cache_dir=False, token_counter='api', concurrency=2,
+    )
+
+    assert count == 2
+    # count_tokens 2 回（ファイルごと）+ generate_content 2 回がレート制限を通る
+    assert len(acquired) == 4
+    # pre-flight で読んだ内容をレビューに使い、ファイルを読み直さない
+    assert opened.count('a.py') == 1 and opened.count('b.py') == 1
+    # 集計行の接頭辞は review_log が付ける（二重にならない）
+    err = capsys.readouterr().err
+    assert 'Info: Token count cache: hits=0 misses=2' in err
+    assert 'Info: Pre-flight: files=2' in err and 'Info: Info:' not in err
+
+
+def test_preload_cache_holds_contents_up_to_byte_cap(monkeypatch):
+    cache = gcw.PreloadCache(10)
+
+    assert cache.put('a.py', b'123456') and not cache.put('b.py', b'12345')
+    assert cache.put('c.py', b'1234') and cache.held_bytes == 10
+    assert cache.pop('a.py') == b'123456' and cache.pop('b.py') is None
+    assert cache.held_bytes == 4 and cache.put('b.py', b'12345')
+    monkeypatch.setenv('GEMINI_PRELOAD_MAX_MB', '0')
+    assert gcw.open_preload_cache().max_bytes == 0
+
+
+def test_files_over_preload_cap_are_reread_at_review_time(monkeypatch, tmp_path, fake_genai):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv('GEMINI_PRELOAD_MAX_MB', '0')
+    reviewed = []
+
+    class RecordingModel:
+        def __init__(self, name):
+            pass
+
+        def generate_content(self, contents):
+            reviewed.append(contents[0])
+            return types.SimpleNamespace(text='ok')
+
+    fake_genai.GenerativeModel = RecordingModel
+    (tmp_path / 'a.py').write_text('# a\n', encoding='utf-8')
+    (tmp_path / 'files.txt').write_text('a.py\n', encoding='utf-8')
+    opened = []
+    real_open = open
+
+    def recording_open(path, *args, **kwargs):
+        opened.append(os.path.basename(str(path)))
+        return real_open(path, *args, **kwargs)
+
+    monkeypatch.setattr(gcw, 'open', recording_open, raising=False)
+
+    assert gcw.batch_review_files(str(tmp_path / 'files.txt'), str(tmp_path / 'out'), result_cache_dir=False) == 1
+    # 保持しなかった内容はレビュー時に読み直す
+    assert opened.count('a.py') == 2
+    assert '# a' in reviewed[0]
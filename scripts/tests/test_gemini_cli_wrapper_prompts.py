@@ -0,0 +1,83 @@
+import os
+import types
+
+import scripts.gemini_cli_wrapper as gcw
+
+
+def make_docs(tmp_path):
+    docs = tmp_path / 'docs'
+    docs.mkdir()
+    for name in ('base.md', 'custom.md', 'sh.md', 'sh-custom.md', 'py.md', 'py-custom.md', 'other.md'):
+        (docs / name).write_text(f'# {name}', encoding='utf-8')
+    csv_path = docs / 'target-extensions.csv'
+    csv_path.write_text(
+        'extension,base_prompt,custom_prompt\n'
+        '.sh,sh.md,sh-custom.md\n'
+        '.py,py.md,py-custom.md\n',
+        encoding='utf-8',
+    )
+    return docs, csv_path
+
+
+def test_only_prompts_needed_by_batch_are_uploaded(monkeypatch, tmp_path, fake_genai):
+    monkeypatch.chdir(tmp_path)
+    docs, csv_path = make_docs(tmp_path)
+    uploads = []
+    fake_genai.upload_file = lambda path: uploads.append(os.path.basename(path)) or types.SimpleNamespace(name=f"id-{os.path.basename(path)}")
+    seen_parts = []
+
+    class Model:
+        def __init__(self, name):
+            self.name = name
+
+        def generate_content(self, contents):
+            seen_parts.append([part.name for part in contents[1:]])
+            return types.SimpleNamespace(text='ok')
+
+    fake_genai.GenerativeModel = Model
+    script = tmp_path / 'run.sh'
+    script.write_text('echo hi\n', encoding='utf-8')
+    file_list = tmp_path / 'files.txt'
+    file_list.write_text(f"{script}\n", encoding='utf-8')
+
+    gcw.batch_review_files(
+        str(file_list), str(tmp_path / 'out'),
+        str(docs / 'base.md'), str(docs / 'custom.md'), str(csv_path),
+    )
+
+    assert sorted(uploads) == ['sh-custom.md', 'sh.md']
+    assert seen_parts == [['id-sh.md', 'id-sh-custom.md']]
+
+
+def test_lazy_mode_uploads_prompt_on_first_use(monkeypatch, tmp_path, fake_genai):
+    monkeypatch.chdir(tmp_path)
+    docs, csv_path = make_docs(tmp_path)
+    events = []
+    fake_genai.upload_file = lambda path: events.append(f"upload {os.path.basename(path)}") or types.SimpleNamespace(name=f"id-{os.path.basename(path)}")
+
+    class Model:
+        def __init__(self, name):
+            self.name = name
+
+        def generate_content(self, contents):
+            events.append(f"review {os.path.basename(contents[0].splitlines()[0])}")
+            return types.SimpleNamespace(text='ok')
+
+    fake_genai.GenerativeModel = Model
+    files = []
+    for name in ('a.py', 'b.txt', 'c.py'):
+        (tmp_path / name).write_text('x = 1\n', encoding='utf-8')
+        files.append(str(tmp_path / name))
+    file_list = tmp_path / 'files.txt'
+    file_list.write_text(''.join(f"{f}\n" for f in files), encoding='utf-8')
+
+    gcw.batch_review_files(
+        str(file_list), str(tmp_path / 'out'),
+        str(docs / 'base.md'), str(docs / 'custom.md'), str(csv_path),
+        lazy_prompts=True,
+    )
+
+    uploads = [e for e in events if e.startswith('upload')]
+    assert sorted(uploads) == ['upload base.md', 'upload custom.md', 'upload py-custom.md', 'upload py.md']
+    # ファイルリストの順に必要になった時点でアップロードされる（a.py -> b.txt）
+    assert max(uploads.index('upload py.md'), uploads.index('upload py-custom.md')) < uploads.index('upload base.md')
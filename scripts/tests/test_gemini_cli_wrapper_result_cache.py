@@ -0,0 +1,42 @@
+import types
+
+import scripts.gemini_cli_wrapper as gcw
+
+
+def test_unchanged_file_is_served_from_result_cache(monkeypatch, tmp_path, fake_genai, capsys):
+    monkeypatch.chdir(tmp_path)
+    calls = []
+
+    class CountingModel:
+        def __init__(self, name):
+            self.name = name
+
+        def generate_content(self, contents):
+            calls.append(contents[0])
+            return types.SimpleNamespace(text=f"review #{len(calls)}")
+
+    fake_genai.GenerativeModel = CountingModel
+    code_file = tmp_path / 'sample.py'
+    code_file.write_text('print("hello")\n', encoding='utf-8')
+    file_list = tmp_path / 'files.txt'
+    file_list.write_text(f"{code_file}\n", encoding='utf-8')
+    cache_dir = tmp_path / 'cache'
+
+    gcw.batch_review_files(str(file_list), str(tmp_path / 'out1'), result_cache_dir=str(cache_dir))
+    gcw.batch_review_files(str(file_list), str(tmp_path / 'out2'), result_cache_dir=str(cache_dir))
+
+    assert len(calls) == 1
+    assert (tmp_path / 'out2' / 'sample.py.md').read_text(encoding='utf-8') == 'review #1'
+    err = capsys.readouterr().err
+    assert 'Info: Review cache: hits=1 misses=0' in err
+    assert 'Info: Info:' not in err
+
+    # 内容が変わればキャッシュは使われない
+    code_file.write_text('print("changed")\n', encoding='utf-8')
+    gcw.batch_review_files(str(file_list), str(tmp_path / 'out3'), result_cache_dir=str(cache_dir))
+    assert len(calls) == 2
+    assert (tmp_path / 'out3' / 'sample.py.md').read_text(encoding='utf-8') == 'review #2'
+
+    # モデル名が変わってもキャッシュは使われない
+    gcw.batch_review_files(str(file_list), str(tmp_path / 'out4'), model_name='other-model', result_cache_dir=str(cache_dir))
+    assert len(calls) == 3
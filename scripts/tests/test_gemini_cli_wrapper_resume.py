@@ -0,0 +1,153 @@
+import json
+import time
+import types
+
+import pytest
+
+import scripts.gemini_cli_wrapper as gcw
+import scripts.run_reviews as run_reviews
+from review_metrics import ReviewMetrics
+from scripts.review_journal import JOURNAL_FILENAME, ReviewJournal, journal_incomplete, read_resume_key, write_resume_key
+
+
+def test_resume_skips_files_completed_with_the_same_content(monkeypatch, tmp_path, fake_genai):
+    monkeypatch.chdir(tmp_path)
+    requested = []
+    failing = {'b.py'}
+
+    class FlakyModel:
+        def __init__(self, name):
+            pass
+
+        def generate_content(self, contents):
+            file_path = contents[0].splitlines()[0][len('File: '):]
+            requested.append(file_path)
+            if file_path in failing:
+                raise ValueError('connection dropped')
+            return types.SimpleNamespace(text=f'review of {file_path}')
+
+    fake_genai.GenerativeModel = FlakyModel
+    for name in ('a.py', 'b.py', 'c.py'):
+        (tmp_path / name).write_text(f'# {name}\n', encoding='utf-8')
+    file_list = tmp_path / 'files.txt'
+    file_list.write_text('a.py\nb.py\nc.py\n', encoding='utf-8')
+    out = tmp_path / 'out'
+
+    with pytest.raises(SystemExit):
+        gcw.batch_review_files(str(file_list), str(out), result_cache_dir=False)
+    latest = ReviewJournal(out).latest()
+    assert {f: e['status'] for f, e in latest.items()} == {'a.py': 'ok', 'b.py': 'failed', 'c.py': 'ok'}
+    assert journal_incomplete(out)
+
+    # 書き込み途中で中断した行は無視される
+    with open(out / JOURNAL_FILENAME, 'a', encoding='utf-8') as f:
+        f.write('{"file": "c.py", "sta')
+    requested.clear()
+    failing.clear()
+    (tmp_path / 'c.py').write_text('# changed\n', encoding='utf-8')
+
+    count = gcw.batch_review_files(str(file_list), str(out), result_cache_dir=False, resume=True)
+
+    assert count == 3
+    assert sorted(requested) == ['b.py', 'c.py']
+    assert (out / 'a.py.md').read_text(encoding='utf-8') == 'review of a.py'
+    assert not journal_incomplete(out)
+    run = json.loads((out / 'review_metrics.json').read_text(encoding='utf-8'))['runs'][-1]
+    assert [r['file'] for r in run['file_metrics'] if r.get('resumed')] == ['a.py']
+
+
+def test_completed_files_are_journaled_while_earlier_files_are_pending(monkeypatch, tmp_path, fake_genai):
+    monkeypatch.chdir(tmp_path)
+    out = tmp_path / 'out'
+    seen_while_pending = {}
+
+    class Model:
+        def __init__(self, name):
+            pass
+
+        def generate_content(self, contents):
+            file_path = contents[0].splitlines()[0][len('File: '):]
+            if file_path == 'slow.py':
+                # リスト順で先の slow.py の完了を待たずに、fast.py の結果が記録されるか
+                deadline = time.monotonic() + 5
+                while time.monotonic() < deadline and 'fast.py' not in seen_while_pending:
+                    entry = ReviewJournal(out).latest().get('fast.py')
+                    if entry and entry['status'] == 'ok' and (out / 'fast.py.md').exists():
+                        seen_while_pending['fast.py'] = entry
+                    time.sleep(0.01)
+            return types.SimpleNamespace(text=f'review of {file_path}')
+
+    fake_genai.GenerativeModel = Model
+    for name in ('slow.py', 'fast.py'):
+        (tmp_path / name).write_text(f'# {name}\n', encoding='utf-8')
+    file_list = tmp_path / 'files.txt'
+    file_list.write_text('slow.py\nfast.py\n', encoding='utf-8')
+
+    assert gcw.batch_review_files(str(file_list), str(out), result_cache_dir=False, concurrency=2) == 2
+    assert seen_while_pending['fast.py']['review'] == 'fast.py.md'
+    assert ReviewJournal(out).latest()['slow.py']['status'] == 'ok'
+
+
+def test_review_results_journal_writes_and_select_retryable_failures(monkeypatch, tmp_path):
+    monkeypatch.chdir(tmp_path)
+    files = ['a.py', 'b.py', 'c.py']
+    for name in files:
+        (tmp_path / name).write_text(f'# {name}\n', encoding='utf-8')
+    out = tmp_path / 'out'
+    out.mkdir()
+
+    def open_results(journaled=None):
+        return gcw.ReviewResults(str(out), gcw.ReviewOutputLayout(out), ReviewJournal(out), ReviewMetrics(), files, journaled)
+
+    results = open_results()
+    results.mark_pending(files)
+    assert {e['status'] for e in ReviewJournal(out).latest().values()} == {'pending'}
+    results.write(0, 'ok', 'review of a.py')
+    results.transient_failures.update({'b.py': True, 'c.py': False})
+    results.write(2, 'failed', 'fatal')
+    results.write(1, 'failed', 'rate limited')
+
+    assert (out / 'a.py.md').read_text(encoding='utf-8') == 'review of a.py'
+    latest = ReviewJournal(out).latest()
+    assert {f: e['status'] for f, e in latest.items()} == {'a.py': 'ok', 'b.py': 'failed', 'c.py': 'failed'}
+    assert latest['a.py']['review'] == 'a.py.md' and latest['a.py']['sha256']
+    # 一時的なエラーで失敗したファイルだけを再レビューする
+    assert results.failed_indexes() == [1] and results.count('failed') == 2
+
+    resumed = open_results(ReviewJournal(out).latest())
+    assert [f for f in files if resumed.already_reviewed(f)] == ['a.py']
+    (tmp_path / 'a.py').write_text('# changed\n', encoding='utf-8')
+    assert not resumed.already_reviewed('a.py')
+
+
+def test_run_reviews_resumes_only_incomplete_directory_with_same_key(monkeypatch, tmp_path):
+    base = tmp_path / 'review'
+    for name, status, key in (
+        ('20260101', 'pending', 'other-commit'),
+        ('20260102', 'failed', None),
+        ('20260103', 'skipped', 'this-commit'),
+        ('20260104', 'failed', 'this-commit'),
+    ):
+        (base / name).mkdir(parents=True)
+        ReviewJournal(base / name).record('x.py', status)
+        if key:
+            write_resume_key(base / name, key)
+
+    # 別のコミット・キーの無い（コミット済みの）ディレクトリ・スキップのみのディレクトリは再開しない
+    assert run_reviews.determine_review_dir(str(base), resume=True, key='this-commit') == base / '20260104'
+    assert run_reviews.find_resumable_review_dir(str(base), key=None) is None
+    assert not journal_incomplete(base / '20260103')
+    new_dir = run_reviews.determine_review_dir(str(base), resume=True, key='next-commit')
+    assert new_dir not in [base / name for name in ('20260101', '20260102', '20260103', '20260104')]
+    assert read_resume_key(new_dir) == 'next-commit'
+
+    monkeypatch.setenv('GITHUB_SHA', 'abc')
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'decoded_files.txt').write_text('x.py\n', encoding='utf-8')
+    key = run_reviews.resume_key()
+    assert key == run_reviews.resume_key()
+    (tmp_path / 'decoded_files.txt').write_text('y.py\n', encoding='utf-8')
+    assert run_reviews.resume_key() != key
+    assert run_reviews.resolve_resume(['--resume'])
+    monkeypatch.delenv('REVIEW_RESUME', raising=False)
+    assert not run_reviews.resolve_resume([])
@@ -0,0 +1,86 @@
+import json
+import time
+import types
+
+import scripts.gemini_cli_wrapper as gcw
+
+
+def test_order_review_jobs_by_schedule_and_priority():
+    jobs = [[0], [1], [2, 3]]
+    costs = [50, 10, 30]
+
+    assert gcw.order_review_jobs(jobs, costs, 'fifo') == [[0], [1], [2, 3]]
+    assert gcw.order_review_jobs(jobs, costs, 'sjf') == [[1], [2, 3], [0]]
+    assert gcw.order_review_jobs(jobs, costs, 'ljf') == [[0], [2, 3], [1]]
+    ranks = [gcw.priority_rank(path, ['src/*']) for path in ('docs/a.md', 'src/b.py', 'lib/c.py')]
+    assert ranks == [1, 0, 1]
+    assert gcw.order_review_jobs(jobs, costs, 'ljf', ranks) == [[1], [0], [2, 3]]
+
+
+def test_schedule_defaults_to_sjf_only_with_deadline(monkeypatch):
+    monkeypatch.delenv('GEMINI_SCHEDULE', raising=False)
+    monkeypatch.delenv('GEMINI_DEADLINE', raising=False)
+
+    assert gcw.BatchReviewOptions(deadline=30).resolved().schedule == 'sjf'
+    assert gcw.BatchReviewOptions(deadline=0).resolved().deadline is None
+    assert gcw.BatchReviewOptions(schedule='bogus').resolved().schedule == 'fifo'
+    monkeypatch.setenv('GEMINI_SCHEDULE', 'LJF')
+    assert gcw.BatchReviewOptions(deadline=30).resolved().schedule == 'ljf'
+
+
+def write_sources(tmp_path, sizes):
+    names = []
+    for name, size in sizes.items():
+        (tmp_path / name).write_text('x' * size, encoding='utf-8')
+        names.append(name)
+    file_list = tmp_path / 'files.txt'
+    file_list.write_text('\n'.join(names) + '\n', encoding='utf-8')
+    return file_list
+
+
+def test_shortest_job_first_dispatch_order(monkeypatch, tmp_path, fake_genai):
+    monkeypatch.chdir(tmp_path)
+    requested = []
+
+    class RecordingModel:
+        def __init__(self, name):
+            pass
+
+        def generate_content(self, contents):
+            requested.append(contents[0].splitlines()[0])
+            return types.SimpleNamespace(text='ok')
+
+    fake_genai.GenerativeModel = RecordingModel
+    file_list = write_sources(tmp_path, {'huge.py': 3000, 'small.py': 10, 'medium.py': 300})
+
+    gcw.batch_review_files(str(file_list), str(tmp_path / 'out'), result_cache_dir=False, schedule='sjf')
+
+    assert requested == ['File: small.py', 'File: medium.py', 'File: huge.py']
+    # 書き込み順・出力はファイルリストのまま
+    assert (tmp_path / 'out' / 'huge.py.md').read_text(encoding='utf-8') == 'ok'
+
+
+def test_deadline_skips_remaining_files_without_failing(monkeypatch, tmp_path, fake_genai):
+    monkeypatch.chdir(tmp_path)
+
+    class SlowModel:
+        def __init__(self, name):
+            pass
+
+        def generate_content(self, contents):
+            time.sleep(0.2)
+            return types.SimpleNamespace(text='reviewed')
+
+    fake_genai.GenerativeModel = SlowModel
+    file_list = write_sources(tmp_path, {'a.py': 10, 'b.py': 20, 'c.py': 30})
+
+    count = gcw.batch_review_files(
+        str(file_list), str(tmp_path / 'out'), result_cache_dir=False, concurrency=1, deadline=0.1,
+    )
+
+    assert count == 1
+    assert (tmp_path / 'out' / 'a.py.md').read_text(encoding='utf-8') == 'reviewed'
+    assert '制限時間' in (tmp_path / 'out' / 'c.py.md').read_text(encoding='utf-8')
+    run = json.loads((tmp_path / 'out' / 'review_metrics.json').read_text(encoding='utf-8'))['runs'][-1]
+    assert (run['reviewed'], run['skipped'], run['failed']) == (1, 2, 0)
+    assert run['schedule'] == 'sjf' and run['deadline_seconds'] == 0.1
@@ -0,0 +1,64 @@
+import types
+
+import pytest
+
+import scripts.gemini_cli_wrapper as gcw
+
+
+class StreamingModel:
+    """ファイル名に 'broken' を含むリクエストは 2 つ目の断片の後で接続が切れる"""
+
+    def __init__(self, name):
+        self.name = name
+
+    def generate_content(self, contents, stream=False):
+        assert stream
+        broken = 'broken' in contents[0]
+
+        def chunks():
+            yield types.SimpleNamespace(text='## 指摘\n')
+            yield types.SimpleNamespace(text='- 1 件目\n')
+            if broken:
+                raise ConnectionResetError('stream reset by peer')
+            yield types.SimpleNamespace(text='- 2 件目\n')
+
+        return chunks()
+
+
+def test_streamed_review_is_written_and_timed(monkeypatch, tmp_path, fake_genai, capsys):
+    monkeypatch.chdir(tmp_path)
+    fake_genai.GenerativeModel = StreamingModel
+    (tmp_path / 'ok.py').write_text('x = 1\n', encoding='utf-8')
+    file_list = tmp_path / 'files.txt'
+    file_list.write_text('ok.py\n', encoding='utf-8')
+
+    count = gcw.batch_review_files(str(file_list), str(tmp_path / 'out'), stream=True)
+
+    assert count == 1
+    assert (tmp_path / 'out' / 'ok.py.md').read_text(encoding='utf-8') == '## 指摘\n- 1 件目\n- 2 件目\n'
+    assert not list((tmp_path / 'out').glob('*.part'))
+    assert 'Info: Streamed review for ok.py: first token' in capsys.readouterr().err
+    # 結果キャッシュにも保存され、次回はリクエストせずに再利用される
+    fake_genai.GenerativeModel = lambda name: types.SimpleNamespace(generate_content=None)
+    assert gcw.batch_review_files(str(file_list), str(tmp_path / 'out2'), stream=True) == 1
+    assert (tmp_path / 'out2' / 'ok.py.md').read_text(encoding='utf-8') == '## 指摘\n- 1 件目\n- 2 件目\n'
+
+
+def test_interrupted_stream_keeps_partial_output_with_error(monkeypatch, tmp_path, fake_genai):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr('time.sleep', lambda seconds: None)
+    fake_genai.GenerativeModel = StreamingModel
+    (tmp_path / 'broken.py').write_text('y = 2\n', encoding='utf-8')
+    file_list = tmp_path / 'files.txt'
+    file_list.write_text('broken.py\n', encoding='utf-8')
+
+    with pytest.raises(SystemExit):
+        gcw.batch_review_files(
+            str(file_list), str(tmp_path / 'out'), result_cache_dir=False, max_retries=1, stream=True,
+        )
+
+    body = (tmp_path / 'out' / 'broken.py.md').read_text(encoding='utf-8')
+    assert body.startswith('## 指摘\n- 1 件目\n\n---\n')
+    assert '自動レビューに失敗しました' in body
+    assert 'stream reset by peer' in body
+    assert not list((tmp_path / 'out').glob('*.part'))
@@ -36,6 +36,7 @@ sys.modules['PIL'] = importlib.util.module_from_spec(importlib.machinery.ModuleS
 sys.modules['PIL.Image'] = FakeImageModule()
 sys.modules['PIL.ImageEnhance'] = FakeEnhance()
 sys.modules['PIL.ImageFilter'] = FakeFilter()
+sys.modules['PIL.ImageChops'] = types.SimpleNamespace(subtract=lambda a, b: a)
 
 import types
 
@@ -75,6 +76,8 @@ class DummyOCR:
 
 
 def test_ocr_fails_with_no_outputs(monkeypatch, tmp_path):
+    # 既定の出力先 ocr_outputs/ をリポジトリではなく tmp_path に作らせる
+    monkeypatch.chdir(tmp_path)
     # monkeypatch a fake pyocr module
     fake_pyocr = DummyOCR()
     sys.modules['pyocr'] = fake_pyocr
@@ -89,4 +92,112 @@ def test_ocr_fails_with_no_outputs(monkeypatch, tmp_path):
         monkeypatch.setattr(sys, 'argv', ['process_ocr.py', str(image)])
         pocr.main()
     # expect error code non-zero
-    assert ex.value.code == 1
\ No newline at end of file
+    assert ex.value.code == 1
+
+def test_parallel_ocr_keeps_input_order_and_reports_failures(monkeypatch, tmp_path, capsys):
+    import time
+    from concurrent.futures import ThreadPoolExecutor
+
+    class SlowTool:
+        def image_to_string(self, image, lang, builder):
+            # 先に投入した画像ほど遅く終わらせる
+            time.sleep({'a': 0.05, 'b': 0.0, 'c': 0.02}[Path(image).stem])
+            if Path(image).stem == 'b':
+                raise RuntimeError('tesseract crashed')
+            return f"text of {Path(image).name}"
+
+    images = []
+    for name in ('a', 'b', 'c'):
+        images.append(tmp_path / f'{name}.png')
+        images[-1].write_bytes(f'png {name}'.encode())
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(pocr, 'pyocr', types.SimpleNamespace(
+        get_available_tools=lambda: [types.SimpleNamespace(
+            get_name=lambda: 'slow',
+            get_available_languages=lambda: ['eng'],
+            image_to_string=SlowTool().image_to_string,
+        )],
+        builders=types.SimpleNamespace(TextBuilder=lambda: object()),
+    ))
+    monkeypatch.setattr(pocr, 'preprocess_image', lambda image: image._path)
+    monkeypatch.setattr(pocr, '_worker_tool', None)
+    # プロセスプールの代わりにスレッドで並列実行し、完了順が入力順と異なる状況を作る
+    monkeypatch.setattr(
+        pocr, 'ProcessPoolExecutor',
+        lambda max_workers, initializer, mp_context: ThreadPoolExecutor(max_workers=max_workers, initializer=initializer),
+    )
+
+    results = pocr.run_ocr(images, 'eng', workers=3)
+    assert [Path(p).stem for p, _text, _error in results] == ['a', 'b', 'c']
+    assert results[1][2] == 'tesseract crashed'
+
+    ocr_dir, list_file = pocr.process_images_to_ocr(','.join(str(p) for p in images), str(tmp_path / 'ocr'), workers=3)
+    assert sorted(p.name for p in Path(ocr_dir).glob('*.txt')) == ['a.txt', 'c.txt']
+    assert (Path(ocr_dir) / 'a.txt').read_text(encoding='utf-8') == 'text of a.png'
+    err = capsys.readouterr().err
+    assert f"Error: Failed to process {images[1]}: tesseract crashed" in err
+    assert 'with 3 worker(s)' in err
+
+
+def test_ocr_cache_reuses_results_and_dedupes_identical_images(monkeypatch, tmp_path):
+    calls = []
+
+    def fake_iter_ocr(image_paths, lang, workers, tool=None):
+        calls.append([Path(p).name for p in image_paths])
+        return [(i, (p, f"text of {Path(p).name}", None)) for i, p in enumerate(image_paths)]
+
+    monkeypatch.setattr(pocr, 'iter_ocr', fake_iter_ocr)
+    monkeypatch.delenv('OCR_THRESHOLD', raising=False)
+    first = tmp_path / 'a' / 'screen.png'
+    duplicate = tmp_path / 'b' / 'copy.png'
+    other = tmp_path / 'other.png'
+    for path, data in ((first, b'same'), (duplicate, b'same'), (other, b'other')):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(data)
+    cache = pocr.open_ocr_cache(str(tmp_path / 'cache'))
+
+    results = pocr.run_ocr_cached([first, duplicate, other], 'eng', 2, cache=cache)
+    assert calls == [['screen.png', 'other.png']]
+    assert [(Path(p).name, text) for p, text, _error in results] == [
+        ('screen.png', 'text of screen.png'),
+        ('copy.png', 'text of screen.png'),
+        ('other.png', 'text of other.png'),
+    ]
+
+    # 2 回目は全てキャッシュから返り、OCR しない
+    again = pocr.run_ocr_cached([duplicate, other], 'eng', 2, cache=pocr.open_ocr_cache(str(tmp_path / 'cache')))
+    assert calls[-1] == []
+    assert [text for _p, text, _error in again] == ['text of screen.png', 'text of other.png']
+
+    # 言語や前処理のパラメータが変わればキーも変わる
+    default_key = pocr.ocr_cache_key(first, 'eng')
+    assert default_key != pocr.ocr_cache_key(first, 'jpn+eng')
+    monkeypatch.setenv('OCR_THRESHOLD', 'otsu')
+    assert pocr.ocr_cache_key(first, 'eng') != default_key
+    pocr.run_ocr_cached([first], 'eng', 1, cache=cache)
+    assert calls[-1] == ['screen.png']
+
+
+def test_ocr_outputs_mirror_directories_and_are_handed_off_as_completed(monkeypatch, tmp_path):
+    def fake_iter_ocr(image_paths, lang, workers, tool=None):
+        # 後ろの画像から完了したことにする
+        for position in reversed(range(len(image_paths))):
+            yield position, (image_paths[position], f"text of {image_paths[position]}", None)
+
+    monkeypatch.setattr(pocr, 'iter_ocr', fake_iter_ocr)
+    monkeypatch.chdir(tmp_path)
+    images = ['a/screen.png', 'b/screen.png', 'b/screen.jpg']
+    for index, name in enumerate(images):
+        (tmp_path / name).parent.mkdir(parents=True, exist_ok=True)
+        (tmp_path / name).write_bytes(f'image {index}'.encode())
+    handed_off = []
+
+    ocr_dir, list_file = pocr.process_images_to_ocr(
+        ','.join(images), 'ocr', workers=1, cache_dir=False, on_output=handed_off.append,
+    )
+
+    expected = [Path(ocr_dir) / 'a/screen.txt', Path(ocr_dir) / 'b/screen.txt', Path(ocr_dir) / 'b/screen.jpg.txt']
+    assert handed_off == [str(p) for p in reversed(expected)]
+    assert Path(list_file).read_text(encoding='utf-8').splitlines() == [str(p) for p in expected]
+    assert expected[1].read_text(encoding='utf-8').endswith('b/screen.png')
+    assert pocr.ocr_output_relative_path(tmp_path.parent / 'x.png').parts[0] == '_external'
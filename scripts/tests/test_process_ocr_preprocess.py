@@ -0,0 +1,131 @@
+import importlib
+import os
+import subprocess
+import sys
+import textwrap
+import types
+from pathlib import Path
+
+import pytest
+
+# PIL / pyocr が無い環境でも import できるよう stub を登録する（登録済みならそれを使う）
+sys.modules.setdefault('PIL', importlib.util.module_from_spec(importlib.machinery.ModuleSpec('PIL', None)))
+for name in ('PIL.Image', 'PIL.ImageChops', 'PIL.ImageFilter', 'pyocr', 'pyocr.builders'):
+    sys.modules.setdefault(name, types.SimpleNamespace())
+
+import scripts.process_ocr as pocr
+
+
+def test_contrast_lut_matches_image_enhance_formula():
+    lut = pocr.contrast_lut(mean=99.6, factor=2.0)
+
+    # 平均は四捨五入して 100、100 + (v - 100) * 2 を 0..255 に丸める
+    assert lut[100] == 100
+    assert lut[114] == 128
+    assert lut[115] == 130
+    assert lut[0] == 0 and lut[255] == 255
+    assert lut == sorted(lut)
+    assert pocr.threshold_lut(128)[128] == 0 and pocr.threshold_lut(128)[129] == 255
+
+
+SCRIPTS_DIR = Path(__file__).resolve().parents[1]
+
+# 他のテストが sys.modules に PIL の stub を登録するため、本物の Pillow で比較する処理は別プロセスで実行する
+PIXEL_COMPARISON = textwrap.dedent("""
+    import sys, types
+    sys.modules['pyocr'] = types.SimpleNamespace(builders=None)
+    sys.modules['pyocr.builders'] = types.SimpleNamespace()
+    sys.path.insert(0, sys.argv[1])
+    from PIL import Image, ImageEnhance, ImageFilter
+    import process_ocr
+
+    width, height = 64, 48
+    image = Image.new('RGB', (width, height))
+    image.putdata([
+        ((x * 4 + y) % 256, (y * 5) % 256, ((x // 4 + y // 4) % 2) * 200 + 20)
+        for y in range(height) for x in range(width)
+    ])
+    legacy = ImageEnhance.Contrast(image.convert('L')).enhance(process_ocr.CONTRAST_ENHANCEMENT_FACTOR)
+    legacy = legacy.filter(ImageFilter.SHARPEN)
+    legacy = legacy.point(lambda p: 255 if p > process_ocr.BINARIZATION_THRESHOLD else 0)
+    result = process_ocr.preprocess_image(image, threshold_method='fixed', target_dpi=0)
+    assert result.mode == legacy.mode and result.size == legacy.size
+    assert result.tobytes() == legacy.tobytes()
+    assert 0 < result.tobytes().count(0) < width * height
+""")
+
+
+def test_fixed_preprocess_matches_legacy_image_enhance_pipeline():
+    env = {key: value for key, value in os.environ.items() if not key.startswith('OCR_')}
+    probe = subprocess.run([sys.executable, '-c', 'import PIL.ImageEnhance'], env=env, capture_output=True)
+    if probe.returncode != 0:
+        pytest.skip('Pillow is not installed')
+
+    completed = subprocess.run(
+        [sys.executable, '-c', PIXEL_COMPARISON, str(SCRIPTS_DIR)], env=env, capture_output=True, text=True,
+    )
+
+    assert completed.returncode == 0, completed.stderr
+
+
+def test_otsu_threshold_separates_bimodal_histogram():
+    histogram = [0] * 256
+    for value in range(40, 61):
+        histogram[value] = 100
+    for value in range(190, 211):
+        histogram[value] = 300
+
+    threshold = pocr.otsu_threshold(histogram)
+
+    assert 60 <= threshold < 190
+    assert pocr.otsu_threshold([0] * 256) == pocr.BINARIZATION_THRESHOLD
+    assert pocr.histogram_mean(histogram) == (sum(range(40, 61)) * 100 + sum(range(190, 211)) * 300) / (21 * 400)
+
+
+def test_downscale_only_when_dpi_exceeds_target(monkeypatch):
+    resized = []
+
+    class FakeImage:
+        width, height = 3000, 2000
+        info = {'dpi': (300, 300)}
+
+        def resize(self, size, resample):
+            resized.append(size)
+            return 'resized'
+
+    monkeypatch.setattr(pocr, 'Image', types.SimpleNamespace(LANCZOS='lanczos'))
+
+    assert pocr.downscale_to_dpi(FakeImage(), 150) == 'resized'
+    assert resized == [(1500, 1000)]
+    assert pocr.downscale_to_dpi(FakeImage(), 600) != 'resized'
+    assert pocr.downscale_to_dpi(FakeImage(), None) != 'resized'
+    assert len(resized) == 1
+
+
+def test_preprocessing_signature_reflects_parameters(monkeypatch):
+    monkeypatch.delenv('OCR_THRESHOLD', raising=False)
+    monkeypatch.delenv('OCR_TARGET_DPI', raising=False)
+
+    default = pocr.preprocessing_signature()
+    assert default.startswith('method=fixed;dpi=none')
+    assert pocr.preprocessing_signature('otsu') != default
+    assert pocr.preprocessing_signature(target_dpi=200) != default
+    monkeypatch.setenv('OCR_THRESHOLD', 'adaptive')
+    assert pocr.preprocessing_signature().startswith('method=adaptive')
+
+
+def test_ocr_settings_use_shared_option_resolution(monkeypatch, capsys):
+    monkeypatch.setenv('OCR_THRESHOLD', 'OTSU')
+    monkeypatch.setenv('OCR_TARGET_DPI', '0')
+    monkeypatch.setenv('OCR_WORKERS', 'many')
+
+    assert pocr._resolve_threshold_method(None) == 'otsu'
+    assert pocr._resolve_threshold_method('bogus') == 'otsu'
+    assert pocr._resolve_target_dpi(None) is None
+    assert pocr._resolve_target_dpi('150') == 150.0
+    assert pocr._resolve_workers(None) == (os.cpu_count() or 1)
+    assert pocr._resolve_workers('3') == 3
+
+    err = capsys.readouterr().err
+    assert "Invalid explicit threshold_method ignored: 'bogus'" in err
+    assert "Invalid env OCR_WORKERS ignored: 'many'" in err
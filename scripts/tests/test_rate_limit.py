@@ -0,0 +1,109 @@
+import pytest
+
+from scripts.rate_limit import (
+    FATAL,
+    RETRYABLE,
+    RateLimiter,
+    TokenBucket,
+    call_with_retry,
+    classify_error,
+    retry_delay_hint,
+)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class ResourceExhausted(Exception):
+    code = 429
+
+
+class InvalidArgument(Exception):
+    code = 400
+
+
+def test_token_bucket_waits_for_refill():
+    clock = FakeClock()
+    bucket = TokenBucket(2, 1.0, clock=clock, sleep=clock.sleep)
+    assert bucket.acquire() == 0
+    assert bucket.acquire() == 0
+    assert bucket.acquire() == pytest.approx(1.0)
+    # 容量を超える要求も満杯になれば通る
+    assert bucket.acquire(10) == pytest.approx(2.0)
+
+
+def test_rate_limiter_limits_requests_and_tokens():
+    clock = FakeClock()
+    limiter = RateLimiter(rpm=60, tpm=600, clock=clock, sleep=clock.sleep)
+    limiter.acquire(tokens=600)
+    # トークン枠を使い切ったので 100 トークン分（10 秒）待つ
+    assert limiter.acquire(tokens=100) == pytest.approx(10.0)
+    limiter.pause(5)
+    assert limiter.acquire() == pytest.approx(5.0)
+
+
+def test_classify_error():
+    assert classify_error(ResourceExhausted('quota')) == RETRYABLE
+    assert classify_error(type('ServiceUnavailable', (Exception,), {})('down')) == RETRYABLE
+    assert classify_error(ConnectionError('reset')) == RETRYABLE
+    assert classify_error(InvalidArgument('bad')) == FATAL
+    assert classify_error(ValueError('blocked')) == FATAL
+
+
+def test_retry_delay_hint_from_message():
+    exc = ResourceExhausted('429 Quota exceeded. Please retry in 12.5s. [retry_delay { seconds: 12 }]')
+    assert retry_delay_hint(exc) == 12
+    assert retry_delay_hint(ResourceExhausted('quota')) is None
+
+
+def test_call_with_retry_retries_retryable_and_honors_hint():
+    clock = FakeClock()
+    attempts = []
+
+    def flaky():
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise ResourceExhausted('Please retry in 30s')
+        return 'ok'
+
+    retries = []
+    result = call_with_retry(
+        flaky,
+        max_retries=5,
+        on_retry=lambda attempt, exc, delay: retries.append((attempt, delay)),
+        sleep=clock.sleep,
+    )
+    assert result == 'ok'
+    assert [attempt for attempt, _ in retries] == [1, 2]
+    assert all(delay >= 30 for _, delay in retries)
+
+
+def test_call_with_retry_raises_fatal_and_exhausted():
+    clock = FakeClock()
+    calls = []
+
+    def fatal():
+        calls.append(1)
+        raise InvalidArgument('bad request')
+
+    with pytest.raises(InvalidArgument):
+        call_with_retry(fatal, sleep=clock.sleep)
+    assert len(calls) == 1
+
+    def always_busy():
+        calls.append(1)
+        raise ResourceExhausted('busy')
+
+    with pytest.raises(ResourceExhausted):
+        call_with_retry(always_busy, max_retries=2, sleep=clock.sleep)
+    assert len(calls) == 1 + 3
@@ -0,0 +1,33 @@
+import types
+
+import scripts.gemini_cli_wrapper as gcw
+import review_log
+
+
+def test_levels_filter_output(monkeypatch, capsys):
+    monkeypatch.setenv('REVIEW_LOG_LEVEL', 'quiet')
+    review_log.info('hidden')
+    review_log.warning('shown', file='a b.py')
+    assert capsys.readouterr().err == "Warning: shown file='a b.py'\n"
+
+    monkeypatch.setenv('REVIEW_LOG_LEVEL', 'unknown')
+    review_log.info('progress', count=3)
+    review_log.debug('details')
+    assert capsys.readouterr().err == 'Info: progress count=3\n'
+
+
+def test_request_contents_are_dumped_only_at_debug(monkeypatch, capsys):
+    prompt_part = types.SimpleNamespace(display_name='instruction-review.md')
+    contents = ['File: secret.py\n\nTOKEN = "do-not-log"', prompt_part]
+
+    monkeypatch.delenv('REVIEW_LOG_LEVEL', raising=False)
+    gcw.log_request('secret.py', 'gemini-2.5-flash', object(), contents)
+    err = capsys.readouterr().err
+    assert 'do-not-log' not in err
+    assert 'Info: Sending request for secret.py model=gemini-2.5-flash chars=37 bytes=37 sha256=' in err
+    assert 'prompts=instruction-review.md' in err
+
+    monkeypatch.setenv('REVIEW_LOG_LEVEL', 'debug')
+    gcw.log_request('secret.py', 'gemini-2.5-flash', object(), contents)
+    assert 'do-not-log' in capsys.readouterr().err
+
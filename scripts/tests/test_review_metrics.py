@@ -0,0 +1,76 @@
+import json
+import types
+
+import scripts.gemini_cli_wrapper as gcw
+from review_metrics import METRICS_FILENAME, ReviewMetrics, append_metrics_run, load_metrics, summarize_metrics
+
+
+def test_runs_are_appended_and_summarized(tmp_path):
+    ticks = iter([0.0, 1.0, 1.5, 4.0])
+    metrics = ReviewMetrics(clock=lambda: next(ticks))
+    with metrics.timed('a.py', 'read_seconds'):
+        pass
+    metrics.add('a.py', 'input_tokens', 100)
+    metrics.set('a.py', 'status', 'ok')
+    metrics.set('b.py', 'status', 'failed')
+
+    append_metrics_run(tmp_path, metrics.to_run(['a.py', 'b.py'], model='m'))
+    append_metrics_run(tmp_path, {'files': 2, 'reviewed': 2, 'input_tokens': 50, 'total_seconds': 1.0})
+
+    saved = load_metrics(tmp_path / METRICS_FILENAME)
+    first = saved['runs'][0]
+    assert first['model'] == 'm'
+    assert first['total_seconds'] == 4.0
+    assert (first['files'], first['reviewed'], first['failed']) == (2, 1, 1)
+    assert first['file_metrics'][0] == {'file': 'a.py', 'read_seconds': 0.5, 'input_tokens': 100, 'status': 'ok'}
+    summary = summarize_metrics(saved)
+    assert (summary['files'], summary['reviewed'], summary['input_tokens']) == (4, 3, 150)
+    assert summary['total_seconds'] == 5.0
+
+
+def test_batch_review_writes_per_file_metrics(monkeypatch, tmp_path, fake_genai):
+    monkeypatch.chdir(tmp_path)
+
+    class Model:
+        def __init__(self, name):
+            self.name = name
+
+        def generate_content(self, contents):
+            usage = types.SimpleNamespace(prompt_token_count=120, cached_content_token_count=0, candidates_token_count=30)
+            return types.SimpleNamespace(text='review', usage_metadata=usage)
+
+    fake_genai.GenerativeModel = Model
+    (tmp_path / 'sample.py').write_text('x = 1\n', encoding='utf-8')
+    file_list = tmp_path / 'files.txt'
+    file_list.write_text('sample.py\n', encoding='utf-8')
+    cache_dir = tmp_path / 'cache'
+
+    gcw.batch_review_files(str(file_list), str(tmp_path / 'out'), result_cache_dir=str(cache_dir))
+    gcw.batch_review_files(str(file_list), str(tmp_path / 'out'), result_cache_dir=str(cache_dir))
+
+    runs = json.loads((tmp_path / 'out' / METRICS_FILENAME).read_text(encoding='utf-8'))['runs']
+    first, second = (run['file_metrics'][0] for run in runs)
+    assert (first['status'], first['requests'], first['input_tokens'], first['output_tokens']) == ('ok', 1, 120, 30)
+    assert {'read_seconds', 'prompt_seconds', 'request_seconds', 'write_seconds'} <= set(first)
+    assert second['cache_hits'] == 1 and 'requests' not in second
+    assert runs[0]['output_tokens'] == 30 and runs[1]['cache_hits'] == 1
+
+
+def test_summary_counts_each_file_once_across_resumed_runs():
+    metrics = {'runs': [
+        {
+            'files': 2, 'reviewed': 1, 'failed': 1, 'input_tokens': 300,
+            'file_metrics': [{'file': 'a.py', 'status': 'ok'}, {'file': 'b.py', 'status': 'failed'}],
+        },
+        # --resume で a.py は再開扱い、b.py だけ再レビューして成功した
+        {
+            'files': 2, 'reviewed': 2, 'failed': 0, 'input_tokens': 200,
+            'file_metrics': [{'file': 'a.py', 'status': 'ok', 'resumed': True}, {'file': 'b.py', 'status': 'ok'}],
+        },
+    ]}
+
+    summary = summarize_metrics(metrics)
+
+    assert (summary['files'], summary['reviewed'], summary['failed']) == (2, 2, 0)
+    # トークン数は実際に使った量なので実行をまたいで合計する
+    assert summary['input_tokens'] == 500
@@ -1,5 +1,7 @@
 import os
 import subprocess
+import sys
+import types
 from pathlib import Path
 import pytest
 
@@ -56,7 +58,7 @@ def test_files_present_with_api_key_runs(monkeypatch, tmp_path, capsys):
     write_file(decoded, "some/code/file.py\n")
 
     # patch run_batch_review to avoid network calls and to create a dummy review file
-    def fake_run_batch_review(file_list, output_dir, use_prompt_map=False):
+    def fake_run_batch_review(file_list, output_dir, use_prompt_map=False, diff_base=None, resume=False):
         # create output dir and a dummy md file
         output = Path(output_dir)
         output.mkdir(parents=True, exist_ok=True)
@@ -71,6 +73,7 @@ def test_files_present_with_api_key_runs(monkeypatch, tmp_path, capsys):
     run_reviews.main()
     captured = capsys.readouterr()
     assert '生成されたレビューファイル数' in captured.err
+    assert 'metrics_wall_seconds=' in captured.out
 
 
 def test_batch_review_failure_causes_exit(monkeypatch, tmp_path, capsys):
@@ -84,7 +87,7 @@ def test_batch_review_failure_causes_exit(monkeypatch, tmp_path, capsys):
 
     # Simulate a failing batch review via return False
     monkeypatch.setenv('REVIEW_BASE_DIR', str(tmp_path))
-    monkeypatch.setattr(run_reviews, 'run_batch_review', lambda file_list, output_dir, use_prompt_map=False: False)
+    monkeypatch.setattr(run_reviews, 'run_batch_review', lambda file_list, output_dir, use_prompt_map=False, diff_base=None, resume=False: False)
 
     with pytest.raises(SystemExit) as ex:
         run_reviews.main()
@@ -94,6 +97,33 @@ def test_batch_review_failure_causes_exit(monkeypatch, tmp_path, capsys):
     assert 'Error: Batch review for code files failed.' in captured.err
 
 
+def test_failed_code_batch_still_runs_ocr_and_reports_completed_reviews(monkeypatch, tmp_path, capsys):
+    monkeypatch.setenv('GEMINI_API_KEY', 'dummy')
+    monkeypatch.setenv('REVIEW_BASE_DIR', str(tmp_path / 'review'))
+    monkeypatch.setenv('REVIEW_PARALLEL_LISTS', 'false')
+    write_file(tmp_path / 'decoded_files.txt', "a.py\n")
+    write_file(tmp_path / 'ocr_files_list.txt', "a.txt\n")
+    monkeypatch.chdir(tmp_path)
+    ran = []
+
+    def fake_run_batch_review(file_list, output_dir, use_prompt_map=False, diff_base=None, resume=False):
+        ran.append(file_list)
+        (Path(output_dir) / f'{Path(file_list).stem}.md').write_text('# review', encoding='utf-8')
+        return file_list != 'decoded_files.txt'
+
+    monkeypatch.setattr(run_reviews, 'run_batch_review', fake_run_batch_review)
+
+    with pytest.raises(SystemExit) as ex:
+        run_reviews.main()
+
+    assert ex.value.code == 1
+    assert ran == ['decoded_files.txt', 'ocr_files_list.txt']
+    captured = capsys.readouterr()
+    assert 'review_count=2' in captured.out
+    assert f"files_to_commit={tmp_path / 'review'}" in captured.out
+    assert 'Error: Batch review for code files failed.' in captured.err
+
+
 def test_resolve_model_name_ignores_empty_env(monkeypatch):
     # No GEMINI_MODEL set
     monkeypatch.delenv('GEMINI_MODEL', raising=False)
@@ -106,4 +136,130 @@ def test_resolve_model_name_ignores_empty_env(monkeypatch):
     # explicit arg should override
     assert gcw._resolve_model_name('gemini-2.5-flash') == 'gemini-2.5-flash'
 
- 
\ No newline at end of file
+ 
+
+def test_batch_reviews_run_in_process_with_shared_session(monkeypatch, tmp_path):
+    import gemini_cli_wrapper
+
+    calls = []
+
+    def fake_batch_review_files(file_list, output_dir, **kwargs):
+        calls.append((file_list, kwargs['prompt_map_path'], kwargs['session']))
+        if file_list == 'ocr_files_list.txt':
+            sys.exit(1)
+
+    (tmp_path / 'decoded_files.txt').write_text("a.py\n", encoding='utf-8')
+    (tmp_path / 'ocr_files_list.txt').write_text("a.txt\n", encoding='utf-8')
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(run_reviews, '_session', None)
+    monkeypatch.setattr(gemini_cli_wrapper, 'batch_review_files', fake_batch_review_files)
+
+    assert run_reviews.run_batch_review('decoded_files.txt', tmp_path, use_prompt_map=True)
+    # batch_review_files の sys.exit(1) は失敗として扱い、プロセスは終了させない
+    assert not run_reviews.run_batch_review('ocr_files_list.txt', tmp_path)
+
+    assert [(c[0], c[1]) for c in calls] == [
+        ('decoded_files.txt', 'docs/target-extensions.csv'),
+        ('ocr_files_list.txt', None),
+    ]
+    assert calls[0][2] is calls[1][2]
+
+
+def test_ocr_pipeline_reviews_texts_as_they_are_produced(monkeypatch, tmp_path, capsys):
+    import threading
+
+    monkeypatch.setenv('GEMINI_API_KEY', 'dummy')
+    monkeypatch.setenv('REVIEW_BASE_DIR', str(tmp_path / 'review'))
+    monkeypatch.setenv('REVIEW_OCR_IMAGES', 'a/shot.png,b/shot.png')
+    monkeypatch.chdir(tmp_path)
+    second_ready = threading.Event()
+    reviewed = []
+
+    def fake_process_images_to_ocr(image_files_csv, output_base_dir, on_output=None):
+        on_output('ocr_outputs/20250101/a/shot.txt')
+        # 1 件目のレビューが始まってから 2 件目を出力する（OCR とレビューが重なっていることの確認）
+        assert second_ready.wait(5)
+        on_output('ocr_outputs/20250101/b/shot.txt')
+        return 'ocr_outputs/20250101', 'ocr_files_list.txt'
+
+    def fake_run_batch_review(file_list, output_dir, use_prompt_map=False, diff_base=None, file_source=None, resume=False):
+        assert file_list is None
+        for file_path in file_source:
+            reviewed.append(file_path)
+            second_ready.set()
+        return True
+
+    monkeypatch.setitem(sys.modules, 'process_ocr', types.SimpleNamespace(process_images_to_ocr=fake_process_images_to_ocr))
+    monkeypatch.setattr(run_reviews, 'run_batch_review', fake_run_batch_review)
+
+    run_reviews.main()
+
+    assert reviewed == ['ocr_outputs/20250101/a/shot.txt', 'ocr_outputs/20250101/b/shot.txt']
+    assert 'ocr_output_dir=ocr_outputs/20250101' in capsys.readouterr().out
+
+
+# spawn で起動した OCR ワーカーが import する PIL / pyocr の代わり（ワーカーには sys.modules の stub が引き継がれない）
+FAKE_OCR_PACKAGES = {
+    'PIL/__init__.py': '',
+    'PIL/Image.py': (
+        "class _Image:\n"
+        "    info = {}\n"
+        "    def __init__(self, path):\n"
+        "        self.path = path\n"
+        "    def convert(self, mode):\n"
+        "        return self\n"
+        "    def filter(self, kernel):\n"
+        "        return self\n"
+        "    def point(self, lut):\n"
+        "        return self\n"
+        "    def histogram(self):\n"
+        "        return [1] * 256\n"
+        "def open(path):\n"
+        "    return _Image(path)\n"
+    ),
+    'PIL/ImageFilter.py': "SHARPEN = 'sharpen'\ndef BoxBlur(radius):\n    return radius\n",
+    'PIL/ImageChops.py': "def subtract(a, b):\n    return a\n",
+    'pyocr/__init__.py': (
+        "import os\n"
+        "from pyocr import builders\n"
+        "class _Tool:\n"
+        "    def image_to_string(self, image, lang, builder):\n"
+        "        return f'text of {os.path.basename(image.path)} pid={os.getpid()}'\n"
+        "def get_available_tools():\n"
+        "    return [_Tool()]\n"
+    ),
+    'pyocr/builders.py': "class TextBuilder:\n    pass\n",
+}
+
+
+def test_ocr_pipeline_runs_worker_processes_while_review_threads_run(monkeypatch, tmp_path):
+    fake_site = tmp_path / 'fake_site'
+    for name, source in FAKE_OCR_PACKAGES.items():
+        (fake_site / name).parent.mkdir(parents=True, exist_ok=True)
+        (fake_site / name).write_text(source, encoding='utf-8')
+    monkeypatch.syspath_prepend(str(fake_site))
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv('OCR_WORKERS', '2')
+    for name in ('a.png', 'b.png', 'c.png'):
+        (tmp_path / name).write_bytes(name.encode())
+    import process_ocr
+
+    # 親プロセスの OCR ツールは言語の一覧の取得のみに使う
+    monkeypatch.setattr(process_ocr, 'pyocr', types.SimpleNamespace(get_available_tools=lambda: [types.SimpleNamespace(
+        get_name=lambda: 'fake', get_available_languages=lambda: ['eng'],
+    )]))
+    reviewed = []
+
+    def fake_run_batch_review(file_list, output_dir, use_prompt_map=False, diff_base=None, file_source=None, resume=False):
+        for file_path in file_source:
+            reviewed.append(Path(file_path).read_text(encoding='utf-8'))
+        return True
+
+    monkeypatch.setattr(run_reviews, 'run_batch_review', fake_run_batch_review)
+
+    success, ocr_dir = run_reviews.run_pipelined_ocr_review('a.png,b.png,c.png', tmp_path / 'review')
+
+    assert success and ocr_dir
+    assert sorted(text.split(' pid=')[0] for text in reviewed) == ['text of a.png', 'text of b.png', 'text of c.png']
+    # OCR は別プロセス（spawn したワーカー）で実行される
+    assert all(text.split(' pid=')[1] != str(os.getpid()) for text in reviewed)
@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+"""
+generate_content を呼ぶ前の入力トークン数・費用の見積もり（pre-flight）
+
+- TokenCounter: テキストのトークン数を数える。API（GenerativeModel.count_tokens）で数える場合は
+  結果を内容ハッシュをキーにしたディスクキャッシュ（.token_count_cache/）に保存し、次回以降は API を呼ばない
+- resolve_prices: モデルの 100 万トークンあたりの入力・出力単価（USD）を決める
+- projected_cost: 入出力トークン数から費用（USD）を計算する
+- PreflightBudget: ファイルごとの見積もりを予算と照合し、予算内として受け入れたファイルの合計を集計する
+"""
+import os
+import threading
+
+from content_cache import ContentCache, build_cache_key
+from env_options import choice_parser, env_number, resolve_option
+from rate_limit import call_with_retry
+import review_log as log
+
+TOKEN_COUNT_CACHE_DIR = '.token_count_cache'
+TOKEN_COUNTER_ESTIMATE = 'estimate'
+TOKEN_COUNTER_API = 'api'
+TOKEN_COUNTERS = (TOKEN_COUNTER_ESTIMATE, TOKEN_COUNTER_API)
+
+# 100 万トークンあたりの (入力, 出力) 単価（USD、Gemini API の有料枠・200k トークン以下のプロンプト）
+# 単価の改定やモデルの追加には GEMINI_INPUT_PRICE_PER_M / GEMINI_OUTPUT_PRICE_PER_M で対応する
+MODEL_PRICES = {
+    'gemini-2.5-flash-lite': (0.10, 0.40),
+    'gemini-2.5-flash': (0.30, 2.50),
+    'gemini-2.5-pro': (1.25, 10.00),
+}
+
+
+def resolve_prices(model_name):
+    """model_name の (入力, 出力) の 100 万トークンあたり単価を返す
+
+    環境変数 GEMINI_INPUT_PRICE_PER_M / GEMINI_OUTPUT_PRICE_PER_M を優先し、
+    無ければ MODEL_PRICES のうちモデル名の先頭が最も長く一致するものを使う。どれにも一致しなければ 0。
+    """
+    matched = (0.0, 0.0)
+    matched_length = -1
+    for prefix, prices in MODEL_PRICES.items():
+        if model_name.startswith(prefix) and len(prefix) > matched_length:
+            matched, matched_length = prices, len(prefix)
+    return (
+        env_number('GEMINI_INPUT_PRICE_PER_M', matched[0]),
+        env_number('GEMINI_OUTPUT_PRICE_PER_M', matched[1]),
+    )
+
+
+def projected_cost(input_tokens, output_tokens, prices):
+    """入出力トークン数と単価から費用（USD）を返す"""
+    input_price, output_price = prices
+    return (input_tokens * input_price + output_tokens * output_price) / 1_000_000
+
+
+def resolve_token_counter(explicit_counter):
+    """トークン数の数え方（明示 -> GEMINI_TOKEN_COUNTER -> estimate）"""
+    return resolve_option(
+        explicit_counter, 'GEMINI_TOKEN_COUNTER', choice_parser(TOKEN_COUNTERS), TOKEN_COUNTER_ESTIMATE, 'token_counter',
+    )
+
+
+def open_token_count_cache(cache_dir=None):
+    """API で数えたトークン数のキャッシュを開く（TOKEN_COUNT_CACHE_DIR または GEMINI_TOKEN_COUNT_CACHE_DIR）"""
+    if not cache_dir:
+        env_dir = os.getenv('GEMINI_TOKEN_COUNT_CACHE_DIR')
+        cache_dir = env_dir.strip() if env_dir and env_dir.strip() else TOKEN_COUNT_CACHE_DIR
+    return ContentCache(cache_dir, max_bytes=10 * 1024 * 1024, max_age_seconds=30 * 24 * 60 * 60)
+
+
+class TokenCounter:
+    """テキストのトークン数を数える
+
+    model を渡すと model.count_tokens で数え、結果を cache に保存する（API 呼び出しに失敗した場合や
+    max_api_tokens を超えると推定されるテキストは estimator で見積もる）。model が None の場合は estimator のみを使う。
+    count_tokens は limiter（RateLimiter）の範囲で送信し、リトライ可能なエラーは max_retries 回まで再試行する。
+    複数のスレッドから同時に呼び出せる。
+    """
+
+    def __init__(self, estimator, model=None, model_name='', cache=None, max_api_tokens=None, limiter=None, max_retries=0):
+        self.estimator = estimator
+        self.model = model
+        self.model_name = model_name
+        self.cache = cache
+        self.max_api_tokens = max_api_tokens
+        self.limiter = limiter
+        self.max_retries = max_retries
+        self.api_calls = 0
+        self.fallbacks = 0
+        self._lock = threading.Lock()
+
+    @property
+    def method(self):
+        return TOKEN_COUNTER_API if self.model is not None else TOKEN_COUNTER_ESTIMATE
+
+    def count(self, text):
+        estimated = self.estimator(text)
+        if self.model is None or (self.max_api_tokens and estimated > self.max_api_tokens):
+            return estimated
+        key = build_cache_key('count_tokens', self.model_name, text)
+        if self.cache is not None:
+            cached = self.cache.get(key)
+            if cached is not None and cached.strip().isdigit():
+                return int(cached)
+        try:
+            response = call_with_retry(
+                lambda: self.model.count_tokens([text]), limiter=self.limiter, max_retries=self.max_retries,
+            )
+            tokens = int(response.total_tokens)
+        except Exception as e:
+            # 見積もりのためにレビューを止めない
+            with self._lock:
+                self.fallbacks += 1
+            log.warning(f"count_tokens failed, using local estimate: {e}")
+            return estimated
+        with self._lock:
+            self.api_calls += 1
+        if self.cache is not None:
+            self.cache.put(key, str(tokens))
+        return tokens
+
+
+class PreflightBudget:
+    """ファイルごとの見積もりを 1 ファイル・実行全体の予算と照合し、受け入れたファイルの合計を集計する
+
+    入力トークン数はファイルの内容＋プロンプト×リクエスト数、出力トークン数は
+    expected_output_tokens×リクエスト数として見積もる。予算（0 は無制限）を超えるファイルは
+    over_budget（ファイルパス -> レビュー結果に書き込む本文）に記録し、合計には加えない。
+    予算は admit を呼んだ順に積み上げる（メインスレッドから呼び出す）。
+    """
+
+    def __init__(self, counter, prices, expected_output_tokens, file_token_budget=0, run_token_budget=0, run_cost_budget=0.0):
+        self.counter = counter
+        self.prices = prices
+        self.expected_output_tokens = expected_output_tokens
+        self.file_token_budget = file_token_budget
+        self.run_token_budget = run_token_budget
+        self.run_cost_budget = run_cost_budget
+        self.files = 0
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self.cost_usd = 0.0
+        self.over_budget = {}
+        self._prompt_tokens = {}
+
+    def prompt_tokens(self, prompt_paths):
+        """プロンプトファイル群のトークン数の合計（ファイルごとに 1 回だけ数える。読めないファイルは 0）"""
+        tokens = 0
+        for prompt_path in prompt_paths:
+            if prompt_path not in self._prompt_tokens:
+                try:
+                    with open(prompt_path, 'r', encoding='utf-8') as f:
+                        self._prompt_tokens[prompt_path] = self.counter.count(f.read())
+                except (OSError, UnicodeDecodeError):
+                    self._prompt_tokens[prompt_path] = 0
+            tokens += self._prompt_tokens[prompt_path]
+        return tokens
+
+    def admit(self, file_path, content_tokens, prompt_paths, request_count):
+        """1 ファイル分を見積もり、予算内なら合計に加える
+
+        (入力トークン数, 出力トークン数, 費用, スキップ理由) を返す。スキップ理由は予算内なら None、
+        超える場合は 'token_budget' / 'cost_budget'（over_budget に本文を記録する）。
+        """
+        input_tokens = content_tokens + self.prompt_tokens(prompt_paths) * request_count
+        output_tokens = self.expected_output_tokens * request_count
+        cost = projected_cost(input_tokens, output_tokens, self.prices)
+        if self.file_token_budget and input_tokens > self.file_token_budget:
+            reason = 'token_budget'
+            detail = f"~{input_tokens} input tokens exceeds per-file budget {self.file_token_budget}"
+            body_detail = f"推定入力 {input_tokens} トークン / 1 ファイルの上限 {self.file_token_budget} トークン"
+        elif self.run_token_budget and self.input_tokens + input_tokens > self.run_token_budget:
+            reason = 'token_budget'
+            detail = f"run input token budget {self.run_token_budget} would be exceeded"
+            body_detail = f"推定入力 {input_tokens} トークン / 実行全体の上限 {self.run_token_budget} トークン"
+        elif self.run_cost_budget and self.cost_usd + cost > self.run_cost_budget:
+            reason = 'cost_budget'
+            detail = f"run cost budget ${self.run_cost_budget:g} would be exceeded (~${cost:.4f})"
+            body_detail = f"推定費用 ${cost:.4f} / 実行全体の上限 ${self.run_cost_budget:g}"
+        else:
+            self.files += 1
+            self.input_tokens += input_tokens
+            self.output_tokens += output_tokens
+            self.cost_usd += cost
+            return input_tokens, output_tokens, cost, None
+        log.warning(f"Skipping {file_path}: {detail}")
+        self.over_budget[file_path] = (
+            f"自動レビューをスキップしました。送信前の見積もりがトークン数・費用の予算を超えています（{body_detail}）。\n"
+            "生成物やバンドルされたファイルの場合はレビュー対象から除外することを検討してください。\n"
+        )
+        return input_tokens, output_tokens, cost, reason
+
+    def summary_line(self):
+        return (
+            f"Pre-flight: files={self.files} input≈{self.input_tokens} "
+            f"output≈{self.output_tokens} cost≈${self.cost_usd:.4f} "
+            f"over_budget={len(self.over_budget)} (counter={self.counter.method})"
+        )
+
+    def to_metrics(self):
+        """review_metrics.json の preflight に記録する値"""
+        return {
+            'token_counter': self.counter.method,
+            'input_price_per_m': self.prices[0],
+            'output_price_per_m': self.prices[1],
+            'expected_output_tokens': self.expected_output_tokens,
+            'file_token_budget': self.file_token_budget,
+            'run_token_budget': self.run_token_budget,
+            'run_cost_budget': self.run_cost_budget,
+            'admitted_files': self.files,
+            'input_tokens': self.input_tokens,
+            'output_tokens': self.output_tokens,
+            'cost_usd': round(self.cost_usd, 4),
+            'over_budget': len(self.over_budget),
+        }